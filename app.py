@@ -1,18 +1,34 @@
 
 from flask import Flask, render_template, request, jsonify
 from flask_cors import CORS
+from flask_sock import Sock
+from simple_websocket import ConnectionClosed
 import json
+import queue
 import re
 import os
+import threading
+import time
+import secrets
 import requests
+from collections import OrderedDict
 from datetime import datetime
+from twilio_voice_assistant.sarvam_scheduler import WEB, DeadlineExceeded, SarvamScheduler
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
+sock = Sock(app)  # Persistent voice channel at /ws/voice
 
 # Sarvam AI Configuration
 SARVAM_API_KEY = os.getenv('SARVAM_API_KEY', 'your-sarvam-api-key-here')
 SARVAM_BASE_URL = 'https://api.sarvam.ai/v1'
+# Requests per second and burst for Sarvam chat calls, and how long a
+# /process_voice request may wait for Sarvam before falling back to local parsing
+SARVAM_CHAT_RPS = float(os.getenv('SARVAM_CHAT_RPS', '5'))
+SARVAM_CHAT_BURST = int(os.getenv('SARVAM_CHAT_BURST', '10'))
+# Share of the account's Sarvam chat limit used by this app; the voice service takes the rest.
+WEB_SARVAM_RATE_SHARE = float(os.getenv('WEB_SARVAM_RATE_SHARE', '0.2'))
+SARVAM_REQUEST_DEADLINE_SECONDS = float(os.getenv('SARVAM_REQUEST_DEADLINE_SECONDS', '5'))
 
 # Sample contacts database
 CONTACTS = {
@@ -21,8 +37,143 @@ CONTACTS = {
     "rahul": {"name": "Rahul", "upi_id": "rahul@phonepe", "phone": "7777777777"}
 }
 
+# Pending payment intents awaiting confirmation
+PENDING_INTENT_TTL_SECONDS = int(os.getenv('PENDING_INTENT_TTL_SECONDS', '120'))
+MAX_PENDING_INTENTS = int(os.getenv('MAX_PENDING_INTENTS', '10000'))
+
+CONFIRM_WORDS = ['confirm', 'yes', 'proceed', 'ok']
+
 # Transaction log
 TRANSACTIONS = []
+TRANSACTIONS_LOCK = threading.Lock()
+
+# Open /ws/voice connections, used to push new transactions to every page
+VOICE_SOCKETS = set()
+VOICE_SOCKETS_LOCK = threading.Lock()
+# Messages that may wait to be sent on one voice connection; a client that
+# falls this far behind is disconnected rather than slowing everyone else down
+VOICE_OUTBOX_SIZE = int(os.getenv('VOICE_OUTBOX_SIZE', '100'))
+
+class PendingIntentStore:
+    """Parsed payment intents waiting for confirmation, keyed by session token.
+
+    Backed by an OrderedDict kept in insertion/refresh order, so lookups,
+    inserts and evictions are all O(1): expired entries are always at the
+    front, and when the store is full the oldest session is dropped."""
+
+    def __init__(self, ttl_seconds=PENDING_INTENT_TTL_SECONDS, max_entries=MAX_PENDING_INTENTS):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def new_token():
+        return secrets.token_urlsafe(16)
+
+    def _evict_expired(self, now):
+        while self._entries:
+            token, (expires_at, _, _) = next(iter(self._entries.items()))
+            if expires_at > now:
+                break
+            del self._entries[token]
+
+    def put(self, token, intent):
+        """Store (or replace) the pending intent for a session. Returns the intent's id,
+        which a confirmation can quote so it only executes the payment the user saw"""
+        now = time.monotonic()
+        intent_id = secrets.token_urlsafe(8)
+        with self._lock:
+            self._evict_expired(now)
+            self._entries.pop(token, None)
+            self._entries[token] = (now + self.ttl_seconds, intent_id, intent)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return intent_id
+
+    def pop(self, token, intent_id=None):
+        """Remove and return the session's pending intent, or None if missing or expired.
+        With an intent_id, a different (newer) intent is left in place and None is returned"""
+        if not token:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None or (intent_id is not None and entry[1] != intent_id):
+                return None
+            del self._entries[token]
+        if entry[0] <= now:
+            return None
+        return entry[2]
+
+    def discard(self, token):
+        with self._lock:
+            self._entries.pop(token, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+class VoiceConnection:
+    """Outbound side of one /ws/voice connection.
+
+    The websocket is not safe to write from several threads, so every message
+    goes through a bounded queue drained by one sender thread per connection.
+    send() never blocks: if a slow client's queue is full, its remaining
+    messages are dropped and the sender thread disconnects it."""
+
+    _CLOSE = object()
+
+    def __init__(self, ws, max_pending=VOICE_OUTBOX_SIZE):
+        self.ws = ws
+        self.closed = False
+        self._overflowed = False
+        self._outbox = queue.Queue(maxsize=max_pending)
+        self._sender = threading.Thread(target=self._run, name='voice-sender', daemon=True)
+        self._sender.start()
+
+    def send(self, message):
+        """Queue a message (a dict, sent as JSON). Returns False if the connection is closed or too far behind"""
+        if self.closed:
+            return False
+        try:
+            self._outbox.put_nowait(json.dumps(message))
+            return True
+        except queue.Full:
+            self._overflowed = True
+            self.closed = True
+            return False
+
+    def close(self, timeout=1.0):
+        """Stop accepting messages and give the sender a moment to flush what is queued"""
+        self.closed = True
+        try:
+            self._outbox.put_nowait(self._CLOSE)
+        except queue.Full:
+            pass
+        self._sender.join(timeout)
+
+    def _run(self):
+        while True:
+            try:
+                payload = self._outbox.get(timeout=1.0)
+            except queue.Empty:
+                if self.closed:
+                    return
+                continue
+            if payload is self._CLOSE:
+                return
+            if self._overflowed:
+                break
+            try:
+                self.ws.send(payload)
+            except Exception:
+                self.closed = True
+                return
+        # The client fell too far behind: drop what is queued and disconnect it
+        try:
+            self.ws.close(message='Client too slow')
+        except Exception:
+            pass
 
 class VoicePaymentProcessor:
     def __init__(self):
@@ -69,12 +220,21 @@ class VoicePaymentProcessor:
                 'temperature': 0.1
             }
             
-            response = requests.post(
-                f'{SARVAM_BASE_URL}/chat/completions',
-                headers=headers,
-                json=payload,
-                timeout=5
-            )
+            deadline = time.monotonic() + SARVAM_REQUEST_DEADLINE_SECONDS
+
+            def post():
+                response = requests.post(
+                    f'{SARVAM_BASE_URL}/chat/completions',
+                    headers=headers,
+                    json=payload,
+                    timeout=max(deadline - time.monotonic(), 0.1)
+                )
+                if response.status_code == 429:
+                    # Let the scheduler honour Retry-After and retry if time allows
+                    response.raise_for_status()
+                return response
+
+            response = sarvam.run('chat', payload['model'], post, deadline=deadline)
             
             if response.status_code == 200:
                 result = response.json()
@@ -86,6 +246,8 @@ class VoicePaymentProcessor:
                     pass
             else:
                 print(f"Sarvam AI API error: {response.status_code}")
+        except DeadlineExceeded as e:
+            print(f"Sarvam AI is busy, using fallback: {e}")
         except requests.exceptions.Timeout:
             print("Sarvam AI request timed out")
         except requests.exceptions.ConnectionError:
@@ -125,13 +287,14 @@ class VoicePaymentProcessor:
                 return contact_info
         return None
     
-    def process_voice_command(self, text):
-        """Process voice command and extract payment intent"""
+    def process_voice_command(self, text, use_ai=True):
+        """Process voice command and extract payment intent.
+        Pass use_ai=False for cheap local parsing of interim speech results."""
         original_text = text
         text = text.lower().strip()
         
         # First try Sarvam AI for better understanding
-        ai_result = self.enhance_with_sarvam_ai(original_text)
+        ai_result = self.enhance_with_sarvam_ai(original_text) if use_ai else None
         if ai_result:
             amount = ai_result.get('amount')
             recipient_name = ai_result.get('recipient')
@@ -236,52 +399,71 @@ class VoicePaymentProcessor:
                 'error': "I didn't understand. Try saying 'send 100 rupees to Sandeep'"
             }
 
+# Web requests queue behind live call turns and ahead of batch work
+sarvam = SarvamScheduler({'chat': (SARVAM_CHAT_RPS, SARVAM_CHAT_BURST)}, default_priority=WEB, share=WEB_SARVAM_RATE_SHARE)
 processor = VoicePaymentProcessor()
+pending_intents = PendingIntentStore()
 
 @app.route('/')
 def index():
     return render_template('index.html')
 
+def execute_pending_intent(token, intent_id=None):
+    """Execute the payment stored for a session (only if it is still intent_id, when given). Returns the response dict."""
+    intent = pending_intents.pop(token, intent_id)
+    if not intent:
+        return {
+            'success': False,
+            'error': 'There is no payment waiting for confirmation. Please say the payment again.'
+        }
+    transaction = record_transaction(intent['amount'], intent['contact'], intent.get('reason'))
+    return {**payment_success_response(transaction), 'action': 'payment_complete'}
+
 @app.route('/process_voice', methods=['POST'])
 def process_voice():
     data = request.get_json()
     text = data.get('text', '')
+    token = data.get('session_token') or pending_intents.new_token()
     
-    # Process confirmation
-    if text.lower() in ['confirm', 'yes', 'proceed', 'ok']:
-        # Get the last pending transaction from session (simplified)
-        # In real app, you'd use proper session management
-        return jsonify({
-            'success': True,
-            'message': 'Payment successful!',
-            'action': 'payment_complete'
-        })
+    # Process confirmation: execute the intent stored for this session
+    if text.lower().strip() in CONFIRM_WORDS:
+        return jsonify(execute_pending_intent(token))
     
     # Process payment command
     result = processor.process_voice_command(text)
-    return jsonify(result)
+    if result.get('success'):
+        result = {**result, 'intent_id': pending_intents.put(token, result)}
+    else:
+        pending_intents.discard(token)
+    return jsonify({**result, 'session_token': token})
 
-@app.route('/execute_payment', methods=['POST'])
-def execute_payment():
-    data = request.get_json()
-    
-    # Simulate payment processing
-    transaction = {
-        'id': len(TRANSACTIONS) + 1,
-        'amount': data.get('amount'),
-        'contact': data.get('contact'),
-        'reason': data.get('reason'),
-        'timestamp': datetime.now().isoformat(),
-        'status': 'success'
-    }
-    
-    TRANSACTIONS.append(transaction)
-    
-    return jsonify({
+def record_transaction(amount, contact, reason):
+    """Simulate payment processing, log the transaction and push it to open voice channels"""
+    with TRANSACTIONS_LOCK:
+        transaction = {
+            'id': len(TRANSACTIONS) + 1,
+            'amount': amount,
+            'contact': contact,
+            'reason': reason,
+            'timestamp': datetime.now().isoformat(),
+            'status': 'success'
+        }
+        TRANSACTIONS.append(transaction)
+    broadcast({'type': 'transaction', 'transaction': transaction})
+    return transaction
+
+def payment_success_response(transaction):
+    return {
         'success': True,
         'message': f"Payment of {transaction['amount']} rupees to {transaction['contact']['name']} successful!",
         'transaction_id': transaction['id']
-    })
+    }
+
+@app.route('/execute_payment', methods=['POST'])
+def execute_payment():
+    # Only the session token is trusted; the payment details come from the server-side store
+    data = request.get_json()
+    return jsonify(execute_pending_intent(data.get('session_token'), data.get('intent_id')))
 
 @app.route('/contacts')
 def get_contacts():
@@ -289,7 +471,100 @@ def get_contacts():
 
 @app.route('/transactions')
 def get_transactions():
-    return jsonify(TRANSACTIONS)
+    # ?since=<id> returns only transactions newer than the client's last one
+    since = request.args.get('since', 0, type=int)
+    return jsonify(TRANSACTIONS[since:])
+
+def broadcast(message):
+    """Queue a message on every open voice channel without waiting on any of them,
+    dropping channels that have gone away or fallen too far behind"""
+    with VOICE_SOCKETS_LOCK:
+        connections = list(VOICE_SOCKETS)
+    for connection in connections:
+        if not connection.send(message):
+            with VOICE_SOCKETS_LOCK:
+                VOICE_SOCKETS.discard(connection)
+
+@sock.route('/ws/voice')
+def voice_channel(ws):
+    """
+    One persistent channel per page. The client streams interim and final
+    recognition results, confirms or cancels on the same connection, and
+    receives new transactions as they happen.
+
+    Client -> server: {"type": "hello", "last_transaction_id": n}
+                      {"type": "interim" | "final", "text": "..."}
+                      {"type": "confirm", "intent_id": "..."} / {"type": "cancel"}
+    Server -> client: {"type": "contacts" | "transactions", "items": [...]}
+                      {"type": "preview" | "result" | "payment_complete" | "cancelled", ...}
+                      (a successful "result" carries the "intent_id" to confirm; a
+                      "preview" is display-only and never changes what confirm executes)
+                      {"type": "transaction", "transaction": {...}}
+    """
+    connection = VoiceConnection(ws)
+    with VOICE_SOCKETS_LOCK:
+        VOICE_SOCKETS.add(connection)
+    token = pending_intents.new_token()
+    # Interim parses keyed by text, so a final result that matches the last
+    # interim one is answered without parsing (or calling Sarvam AI) again.
+    interim_text, interim_result = None, None
+
+    try:
+        while not connection.closed:
+            raw = ws.receive()
+            if raw is None:
+                break
+            try:
+                message = json.loads(raw)
+            except json.JSONDecodeError:
+                continue
+            kind = message.get('type')
+
+            if kind == 'hello':
+                since = int(message.get('last_transaction_id') or 0)
+                connection.send({'type': 'contacts', 'items': list(CONTACTS.values())})
+                connection.send({'type': 'transactions', 'items': TRANSACTIONS[since:]})
+
+            elif kind == 'interim':
+                text = message.get('text', '').strip()
+                if not text or text == interim_text:
+                    continue
+                interim_text = text
+                interim_result = processor.process_voice_command(text, use_ai=False)
+                if interim_result.get('success'):
+                    connection.send({'type': 'preview', **interim_result})
+
+            elif kind == 'final':
+                text = message.get('text', '').strip()
+                if text.lower() in CONFIRM_WORDS:
+                    kind = 'confirm'
+                else:
+                    if text == interim_text and interim_result and interim_result.get('success'):
+                        result = interim_result
+                    else:
+                        result = processor.process_voice_command(text)
+                    interim_text, interim_result = None, None
+                    if result.get('success'):
+                        result = {**result, 'intent_id': pending_intents.put(token, result)}
+                    else:
+                        pending_intents.discard(token)
+                    connection.send({'type': 'result', **result})
+
+            if kind == 'confirm':
+                # A button click quotes the intent it was showing; a spoken "confirm" does not.
+                response = execute_pending_intent(token, message.get('intent_id'))
+                connection.send({'type': 'payment_complete' if response['success'] else 'result', **response})
+
+            elif kind == 'cancel':
+                pending_intents.discard(token)
+                connection.send({'type': 'cancelled'})
+    except ConnectionClosed:
+        pass
+    finally:
+        pending_intents.discard(token)
+        with VOICE_SOCKETS_LOCK:
+            VOICE_SOCKETS.discard(connection)
+        connection.close()
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=True)
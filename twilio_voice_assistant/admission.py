@@ -0,0 +1,262 @@
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager, contextmanager
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TENANT = "default"
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request could not get a concurrency slot before its queue timeout."""
+
+
+class StageLimiter:
+    """
+    Bounds how many requests of one kind (STT, LLM, TTS, tool calls) run at once,
+    both globally and per tenant. Waiters queue on asyncio semaphores and give up
+    after queue_timeout seconds instead of piling up behind a slow provider.
+    """
+
+    def __init__(self, name: str, global_limit: int, tenant_limit: int, queue_timeout: float):
+        self.name = name
+        self.global_limit = global_limit
+        self.tenant_limit = tenant_limit
+        self.queue_timeout = queue_timeout
+        self._global = asyncio.Semaphore(global_limit)
+        self._tenants = {}
+        self._tenant_refs = {}
+        self._loop = None
+        # Saturation counters
+        self.in_use = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.total_wait_seconds = 0.0
+
+    def _checkout_tenant(self, tenant: str) -> asyncio.Semaphore:
+        """Returns the tenant's semaphore and records one more holder or waiter on it."""
+        semaphore = self._tenants.get(tenant)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.tenant_limit)
+            self._tenants[tenant] = semaphore
+            self._tenant_refs[tenant] = 0
+        self._tenant_refs[tenant] += 1
+        return semaphore
+
+    def _return_tenant(self, tenant: str):
+        # Forget idle tenants so the table does not grow with every caller ever seen.
+        self._tenant_refs[tenant] -= 1
+        if self._tenant_refs[tenant] == 0:
+            del self._tenants[tenant]
+            del self._tenant_refs[tenant]
+
+    def bind_loop(self, loop: asyncio.AbstractEventLoop):
+        """Sets the event loop that worker-thread callers of blocking_slot queue on."""
+        self._loop = loop
+
+    async def acquire(self, tenant: str = DEFAULT_TENANT):
+        """Waits for a tenant slot and then a global slot, sharing one queue timeout."""
+        tenant = tenant or DEFAULT_TENANT
+        tenant_semaphore = self._checkout_tenant(tenant)
+        started = time.monotonic()
+        deadline = started + self.queue_timeout
+        self.waiting += 1
+        try:
+            try:
+                await asyncio.wait_for(tenant_semaphore.acquire(), timeout=self.queue_timeout)
+            except asyncio.TimeoutError:
+                self._return_tenant(tenant)
+                self.rejected += 1
+                raise AdmissionRejected(f"{self.name}: tenant '{tenant}' at capacity ({self.tenant_limit})")
+            try:
+                remaining = max(deadline - time.monotonic(), 0)
+                await asyncio.wait_for(self._global.acquire(), timeout=remaining)
+            except asyncio.TimeoutError:
+                tenant_semaphore.release()
+                self._return_tenant(tenant)
+                self.rejected += 1
+                raise AdmissionRejected(f"{self.name}: global capacity exhausted ({self.global_limit})")
+        finally:
+            self.waiting -= 1
+
+        self.total_wait_seconds += time.monotonic() - started
+        self.admitted += 1
+        self.in_use += 1
+
+    def release(self, tenant: str = DEFAULT_TENANT):
+        tenant = tenant or DEFAULT_TENANT
+        self._global.release()
+        self._tenants[tenant].release()
+        self._return_tenant(tenant)
+        self.in_use -= 1
+
+    @asynccontextmanager
+    async def slot(self, tenant: str = DEFAULT_TENANT):
+        await self.acquire(tenant)
+        try:
+            yield
+        finally:
+            self.release(tenant)
+
+    @contextmanager
+    def blocking_slot(self, tenant: str = DEFAULT_TENANT):
+        """
+        Acquires a slot from a worker thread (e.g. a tool call made inside
+        get_llm_response running under asyncio.to_thread). The semaphores live
+        on the event loop bound with bind_loop(), so the acquire is scheduled
+        there and awaited here. Before a loop is bound (outside of a running
+        server) there is no loop to limit against.
+        """
+        loop = self._loop
+        try:
+            asyncio.get_running_loop()
+            on_loop_thread = True
+        except RuntimeError:
+            on_loop_thread = False
+
+        if loop is None or not loop.is_running() or on_loop_thread:
+            yield
+            return
+
+        future = asyncio.run_coroutine_threadsafe(self.acquire(tenant), loop)
+        future.result()
+        try:
+            yield
+        finally:
+            loop.call_soon_threadsafe(self.release, tenant)
+
+    def stats(self) -> dict:
+        return {
+            "in_use": self.in_use,
+            "waiting": self.waiting,
+            "global_limit": self.global_limit,
+            "tenant_limit": self.tenant_limit,
+            "utilization": round(self.in_use / self.global_limit, 3) if self.global_limit else 0.0,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "avg_wait_ms": round(self.total_wait_seconds / self.admitted * 1000, 2) if self.admitted else 0.0,
+            "active_tenants": len(self._tenant_refs),
+        }
+
+
+class AdmissionController:
+    """
+    Per-worker admission control: how many calls are accepted and how many
+    requests of each stage may be in flight, globally and per tenant.
+    """
+
+    def __init__(self, max_calls: int, max_calls_per_tenant: int, stage_limits: dict, queue_timeout: float,
+                 reservation_ttl: float = 15.0):
+        self.max_calls = max_calls
+        self.max_calls_per_tenant = max_calls_per_tenant
+        self.reservation_ttl = reservation_ttl
+        # Active calls include reserved ones, so a slot promised by the webhook
+        # cannot be taken by another call before its media stream starts.
+        self.active_calls = 0
+        self.calls_by_tenant = {}
+        self._reservations = {}  # call_sid -> (expires_at, tenant)
+        self.calls_admitted = 0
+        self.calls_rejected = 0
+        self.stages = {
+            name: StageLimiter(name, limits["global"], limits["tenant"], queue_timeout)
+            for name, limits in stage_limits.items()
+        }
+
+    def has_call_capacity(self, tenant: str = DEFAULT_TENANT) -> bool:
+        tenant = tenant or DEFAULT_TENANT
+        self._expire_reservations()
+        return (
+            self.active_calls < self.max_calls
+            and self.calls_by_tenant.get(tenant, 0) < self.max_calls_per_tenant
+        )
+
+    def _take_call_slot(self, tenant: str):
+        self.active_calls += 1
+        self.calls_by_tenant[tenant] = self.calls_by_tenant.get(tenant, 0) + 1
+
+    def _expire_reservations(self):
+        """Gives back the slots of reserved calls whose media stream never started."""
+        now = time.monotonic()
+        expired = [call_sid for call_sid, (expires_at, _) in self._reservations.items() if expires_at <= now]
+        for call_sid in expired:
+            _, tenant = self._reservations.pop(call_sid)
+            logger.info(f"Call slot reservation for {call_sid} expired.")
+            self.release_call(tenant)
+
+    def reject_call(self):
+        """Counts a call turned away for lack of capacity."""
+        self.calls_rejected += 1
+
+    def reserve_call(self, call_sid: str, tenant: str = DEFAULT_TENANT) -> bool:
+        """
+        Holds a call slot for `call_sid` until its media stream starts (or the
+        reservation expires after reservation_ttl seconds). Returns False, and
+        counts a rejection, when at capacity.
+        """
+        tenant = tenant or DEFAULT_TENANT
+        if call_sid in self._reservations:
+            return True
+        if not self.has_call_capacity(tenant):
+            self.reject_call()
+            return False
+        self._take_call_slot(tenant)
+        self._reservations[call_sid] = (time.monotonic() + self.reservation_ttl, tenant)
+        return True
+
+    def admit_call(self, tenant: str = DEFAULT_TENANT, call_sid: str = None) -> bool:
+        """
+        Registers a new call, using up the slot reserved for `call_sid` if there
+        is one, or taking a free slot otherwise. Returns False when at capacity.
+        """
+        tenant = tenant or DEFAULT_TENANT
+        reservation = self._reservations.pop(call_sid, None) if call_sid else None
+        if reservation is not None:
+            _, reserved_tenant = reservation
+            if reserved_tenant != tenant:
+                # Keep the books per tenant straight if the stream reports another account.
+                self.release_call(reserved_tenant)
+                self._take_call_slot(tenant)
+            self.calls_admitted += 1
+            return True
+        if not self.has_call_capacity(tenant):
+            self.reject_call()
+            return False
+        self._take_call_slot(tenant)
+        self.calls_admitted += 1
+        return True
+
+    def release_call(self, tenant: str = DEFAULT_TENANT):
+        tenant = tenant or DEFAULT_TENANT
+        if self.calls_by_tenant.get(tenant, 0) <= 0:
+            return
+        self.active_calls -= 1
+        self.calls_by_tenant[tenant] -= 1
+        if self.calls_by_tenant[tenant] == 0:
+            del self.calls_by_tenant[tenant]
+
+    def bind_loop(self, loop: asyncio.AbstractEventLoop):
+        """Binds every stage limiter to the server's event loop; call once at startup."""
+        for limiter in self.stages.values():
+            limiter.bind_loop(loop)
+
+    def slot(self, stage: str, tenant: str = DEFAULT_TENANT):
+        return self.stages[stage].slot(tenant)
+
+    def blocking_slot(self, stage: str, tenant: str = DEFAULT_TENANT):
+        return self.stages[stage].blocking_slot(tenant)
+
+    def stats(self) -> dict:
+        return {
+            "calls": {
+                "active": self.active_calls,
+                "reserved": len(self._reservations),
+                "limit": self.max_calls,
+                "per_tenant_limit": self.max_calls_per_tenant,
+                "utilization": round(self.active_calls / self.max_calls, 3) if self.max_calls else 0.0,
+                "admitted": self.calls_admitted,
+                "rejected": self.calls_rejected,
+            },
+            "stages": {name: limiter.stats() for name, limiter in self.stages.items()},
+        }
@@ -0,0 +1,112 @@
+import io
+import logging
+import wave
+import audioop
+from math import gcd
+
+import numpy as np
+from scipy.signal import resample_poly
+
+logger = logging.getLogger(__name__)
+
+# --- Sink Formats ---
+# Each sink that plays TTS audio declares the sample rate and codec it wants.
+# Twilio media streams are the only sink; the web app plays the TTS WAV as is.
+#   - "mulaw": raw, headerless 8-bit G.711 µ-law (what Twilio media streams expect)
+#   - "alaw": raw, headerless 8-bit G.711 A-law
+#   - "pcm16": raw, headerless 16-bit little-endian linear PCM
+#   - "wav": 16-bit PCM wrapped in a WAV container
+SINK_FORMATS = {
+    "twilio": {"sample_rate": 8000, "codec": "mulaw"},
+}
+
+# Full-scale values used to normalize integer PCM of each sample width to [-1.0, 1.0].
+_FULL_SCALE = {1: 128.0, 2: 32768.0, 3: 8388608.0, 4: 2147483648.0}
+
+
+def decode_wav(wav_bytes: bytes):
+    """
+    Decodes a PCM WAV file of any sample width, rate and channel count into
+    a mono float32 NumPy array in [-1.0, 1.0] plus its sample rate.
+    """
+    with wave.open(io.BytesIO(wav_bytes), 'rb') as wf:
+        sample_width = wf.getsampwidth()
+        channels = wf.getnchannels()
+        sample_rate = wf.getframerate()
+        frames = wf.readframes(wf.getnframes())
+
+    if sample_width == 1:
+        # 8-bit WAV is unsigned, centred on 128.
+        samples = np.frombuffer(frames, dtype=np.uint8).astype(np.float32) - 128.0
+    elif sample_width == 2:
+        samples = np.frombuffer(frames, dtype='<i2').astype(np.float32)
+    elif sample_width == 3:
+        # 24-bit has no native dtype: widen each 3-byte sample into an int32.
+        raw = np.frombuffer(frames, dtype=np.uint8).reshape(-1, 3)
+        widened = np.zeros((raw.shape[0], 4), dtype=np.uint8)
+        widened[:, 1:] = raw
+        samples = (widened.view('<i4').reshape(-1) >> 8).astype(np.float32)
+    elif sample_width == 4:
+        samples = np.frombuffer(frames, dtype='<i4').astype(np.float32)
+    else:
+        raise ValueError(f"Unsupported WAV sample width: {sample_width} bytes")
+
+    samples /= _FULL_SCALE[sample_width]
+
+    # Downmix interleaved multi-channel audio by averaging the channels.
+    if channels > 1:
+        usable = len(samples) - (len(samples) % channels)
+        samples = samples[:usable].reshape(-1, channels).mean(axis=1)
+
+    return samples, sample_rate
+
+
+def resample_pcm(samples, src_rate: int, dst_rate: int):
+    """
+    Resamples mono float audio from src_rate to dst_rate with a polyphase
+    filter. The up/down factors are reduced by their GCD so common TTS rates
+    (e.g. 24000 -> 8000, 22050 -> 8000) use the smallest filter bank.
+    """
+    if src_rate == dst_rate or len(samples) == 0:
+        return samples
+    divisor = gcd(src_rate, dst_rate)
+    up = dst_rate // divisor
+    down = src_rate // divisor
+    return resample_poly(samples, up, down).astype(np.float32, copy=False)
+
+
+def to_pcm16(samples) -> bytes:
+    """Quantizes float audio in [-1.0, 1.0] to 16-bit little-endian PCM bytes."""
+    clipped = np.clip(samples, -1.0, 32767.0 / 32768.0)
+    return (clipped * 32768.0).astype('<i2').tobytes()
+
+
+def encode_pcm16(pcm16_bytes: bytes, sample_rate: int, codec: str) -> bytes:
+    """
+    Encodes 16-bit PCM into the requested codec.
+    """
+    if codec == "mulaw":
+        return audioop.lin2ulaw(pcm16_bytes, 2)
+    if codec == "alaw":
+        return audioop.lin2alaw(pcm16_bytes, 2)
+    if codec == "pcm16":
+        return pcm16_bytes
+    if codec == "wav":
+        buffer = io.BytesIO()
+        with wave.open(buffer, 'wb') as wf:
+            wf.setnchannels(1)
+            wf.setsampwidth(2)
+            wf.setframerate(sample_rate)
+            wf.writeframes(pcm16_bytes)
+        return buffer.getvalue()
+    raise ValueError(f"Unsupported codec: {codec}")
+
+
+def convert_audio(wav_bytes: bytes, sample_rate: int, codec: str) -> bytes:
+    """
+    Converts a WAV file of any rate/width/channel count into the given
+    sample rate and codec.
+    """
+    samples, src_rate = decode_wav(wav_bytes)
+    resampled = resample_pcm(samples, src_rate, sample_rate)
+    return encode_pcm16(to_pcm16(resampled), sample_rate, codec)
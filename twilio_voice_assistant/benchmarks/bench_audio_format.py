@@ -0,0 +1,68 @@
+"""
+Benchmark: cost of converting TTS output into the Twilio sink format.
+
+Reports milliseconds of CPU spent per second of audio for a range of TTS
+sample rates and channel counts. Run from the twilio_voice_assistant folder:
+
+    python benchmarks/bench_audio_format.py
+"""
+import argparse
+import io
+import os
+import sys
+import time
+import wave
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from audio_format import SINK_FORMATS, convert_audio  # noqa: E402
+
+
+def make_wav(sample_rate: int, channels: int, seconds: float) -> bytes:
+    """Builds a 16-bit WAV containing a speech-band test tone."""
+    t = np.arange(int(sample_rate * seconds)) / sample_rate
+    tone = 0.4 * np.sin(2 * np.pi * 440 * t) + 0.2 * np.sin(2 * np.pi * 1800 * t)
+    pcm = (tone * 32767).astype('<i2')
+    if channels > 1:
+        pcm = np.repeat(pcm, channels)
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wf:
+        wf.setnchannels(channels)
+        wf.setsampwidth(2)
+        wf.setframerate(sample_rate)
+        wf.writeframes(pcm.tobytes())
+    return buffer.getvalue()
+
+
+def time_per_audio_second(fn, wav_bytes: bytes, seconds: float, repeats: int) -> float:
+    """Returns the mean milliseconds spent per second of audio."""
+    fn(wav_bytes)  # warm up filter design caches
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn(wav_bytes)
+    elapsed = time.perf_counter() - start
+    return elapsed / repeats / seconds * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=10.0, help="Length of the synthetic clip.")
+    parser.add_argument("--repeats", type=int, default=20, help="Conversions per measurement.")
+    args = parser.parse_args()
+
+    sink_format = SINK_FORMATS["twilio"]
+    print(f"{'source':<16}{'twilio ms/s':>14}")
+    for sample_rate in (8000, 16000, 22050, 24000, 48000):
+        for channels in (1, 2):
+            wav_bytes = make_wav(sample_rate, channels, args.seconds)
+            twilio = time_per_audio_second(
+                lambda w: convert_audio(w, sink_format["sample_rate"], sink_format["codec"]),
+                wav_bytes, args.seconds, args.repeats,
+            )
+            label = f"{sample_rate}Hz/{channels}ch"
+            print(f"{label:<16}{twilio:>14.3f}")
+
+if __name__ == "__main__":
+    main()
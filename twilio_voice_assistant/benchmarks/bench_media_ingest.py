@@ -0,0 +1,122 @@
+"""
+Benchmark: media frames ingested per second per core.
+
+Replays Twilio media-stream messages (20ms µ-law frames, with an occasional
+mark event) through the previous per-frame loop (json.loads, dict lookups,
+base64.b64decode, ring write, two counter updates) and through the
+media_ingest fast path, and reports CPU-time throughput for each. Run from
+the twilio_voice_assistant folder:
+
+    python benchmarks/bench_media_ingest.py --frames 200000
+"""
+import argparse
+import base64
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import profiling  # noqa: E402
+from call_session import CallSession  # noqa: E402
+from media_ingest import MediaIngest, parse_message  # noqa: E402
+
+FRAME_BYTES = 160  # 20ms of 8kHz µ-law
+TURN_AUDIO_BYTES = 24000
+MARK_EVERY = 250  # one control event every 5 seconds of audio
+
+
+def make_messages(count: int) -> list:
+    """Builds raw websocket text in the exact shape Twilio sends."""
+    stream_sid = "MZ18ad3ab5a668481ce02b83e7395059f0"
+    messages = []
+    for i in range(count):
+        if i % MARK_EVERY == MARK_EVERY - 1:
+            messages.append(json.dumps({"event": "mark", "sequenceNumber": str(i + 2), "streamSid": stream_sid,
+                                        "mark": {"name": f"reply-{i}"}}, separators=(",", ":")))
+            continue
+        payload = base64.b64encode(bytes((i + j) % 256 for j in range(FRAME_BYTES))).decode("ascii")
+        messages.append(json.dumps({
+            "event": "media",
+            "sequenceNumber": str(i + 2),
+            "media": {"track": "inbound", "chunk": str(i + 1), "timestamp": str(i * 20), "payload": payload},
+            "streamSid": stream_sid,
+        }, separators=(",", ":")))
+    return messages
+
+
+def previous_loop(messages: list, session: CallSession):
+    """The per-frame work of the /ws handler before the fast path."""
+    for raw in messages:
+        message = json.loads(raw)  # what websocket.receive_json() does
+        event = message.get("event")
+        if event == "media":
+            payload = message["media"]["payload"]
+            audio_data = base64.b64decode(payload)
+            overflow = session.audio.write(audio_data)
+            if overflow:
+                session.dropped_bytes += overflow
+            session.bytes_in += len(audio_data)
+            profiling.increment("frames_ingested")
+            profiling.increment("bytes_decoded", len(audio_data))
+            if len(session.audio) > TURN_AUDIO_BYTES:
+                session.audio.clear()
+
+
+def fast_loop(messages: list, session: CallSession):
+    """The per-frame work of the /ws handler with media_ingest."""
+    ingest = MediaIngest(session.audio)
+    for raw in messages:
+        event, payload, message = parse_message(raw)
+        if event == "media":
+            if payload is None:
+                payload = message["media"]["payload"]
+            overflow = ingest.write(payload)
+            if overflow:
+                session.dropped_bytes += overflow
+            if len(session.audio) > TURN_AUDIO_BYTES:
+                ingest.flush(session)
+                session.audio.clear()
+        else:
+            ingest.defer(event)
+    ingest.flush(session)
+
+
+def frames_per_cpu_second(loop, messages: list, repeats: int) -> float:
+    best = 0.0
+    for _ in range(repeats):
+        session = CallSession(32000)
+        started = time.process_time()
+        loop(messages, session)
+        elapsed = time.process_time() - started
+        best = max(best, len(messages) / elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--frames", type=int, default=200000, help="Messages replayed per run.")
+    parser.add_argument("--repeats", type=int, default=5, help="Runs per loop; the best is reported.")
+    args = parser.parse_args()
+
+    messages = make_messages(args.frames)
+
+    # Both loops must leave the same audio in the ring.
+    reference, candidate = CallSession(32000), CallSession(32000)
+    previous_loop(messages[:5000], reference)
+    fast_loop(messages[:5000], candidate)
+    assert reference.audio.read_all() == candidate.audio.read_all(), "fast path decoded different audio"
+    assert reference.bytes_in == candidate.bytes_in
+
+    previous = frames_per_cpu_second(previous_loop, messages, args.repeats)
+    fast = frames_per_cpu_second(fast_loop, messages, args.repeats)
+    print(f"{'loop':<10}{'frames/s/core':>16}{'calls/core':>12}")
+    for name, rate in (("previous", previous), ("fast", fast)):
+        # A call sends 50 frames per second.
+        print(f"{name:<10}{rate:>16,.0f}{rate / 50:>12,.0f}")
+    print(f"speedup: {fast / previous:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
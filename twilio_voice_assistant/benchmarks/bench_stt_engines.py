@@ -0,0 +1,105 @@
+"""
+Benchmark: word error rate and latency of the speech-to-text engines.
+
+Reads recorded 8kHz µ-law clips from a directory, either headerless (*.ulaw)
+or µ-law WAVs as saved under audio_logs/ (*.wav), each with a reference
+transcript next to it (clip.ulaw -> clip.txt, in English since both engines
+translate to English). Runs every available engine and prints WER and
+latency percentiles. Run from the twilio_voice_assistant folder:
+
+    python benchmarks/bench_stt_engines.py path/to/clips [--engines sarvam local]
+"""
+import argparse
+import glob
+import os
+import re
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+import sarvam_scheduler  # noqa: E402
+from stt_engines import utterance_seconds  # noqa: E402
+
+
+def normalize_words(text: str) -> list:
+    return re.sub(r"[^\w\s']", " ", (text or "").lower()).split()
+
+
+def word_errors(reference: list, hypothesis: list) -> int:
+    """Word-level Levenshtein distance (substitutions + insertions + deletions)."""
+    previous = list(range(len(hypothesis) + 1))
+    for i, ref_word in enumerate(reference, 1):
+        current = [i] + [0] * len(hypothesis)
+        for j, hyp_word in enumerate(hypothesis, 1):
+            current[j] = min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (ref_word != hyp_word),
+            )
+        previous = current
+    return previous[-1]
+
+
+def load_clips(directory: str) -> list:
+    clips = []
+    for path in sorted(glob.glob(os.path.join(directory, "*.ulaw")) + glob.glob(os.path.join(directory, "*.wav"))):
+        reference_path = os.path.splitext(path)[0] + ".txt"
+        if not os.path.exists(reference_path):
+            continue
+        with open(path, "rb") as audio_file, open(reference_path, encoding="utf-8") as text_file:
+            clips.append((os.path.basename(path), audio_file.read(), text_file.read().strip()))
+    return clips
+
+
+def percentile(values: list, fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)]
+
+
+def main_benchmark():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("clips", help="Directory of clips with matching .txt references.")
+    parser.add_argument("--engines", nargs="+", default=["sarvam", "local"])
+    args = parser.parse_args()
+
+    clips = load_clips(args.clips)
+    if not clips:
+        print(f"No clips with reference transcripts found in {args.clips}")
+        return
+    total_audio = sum(utterance_seconds(audio) for _, audio, _ in clips)
+    print(f"{len(clips)} clips, {total_audio:.1f}s of audio")
+
+    # Offline work: queue behind any live call or web traffic in this process.
+    sarvam_scheduler.current_priority.set(sarvam_scheduler.BATCH)
+    engines = {"sarvam": main.stt_router.remote, "local": main.stt_router.local}
+    print(f"{'engine':<8}{'WER':>8}{'p50 ms':>10}{'p95 ms':>10}{'RTF':>8}")
+    for name in args.engines:
+        engine = engines[name]
+        if not engine.available:
+            print(f"{name:<8}  unavailable")
+            continue
+        try:
+            engine.transcribe(clips[0][1])  # warm up (model load / connection)
+        except Exception as e:
+            print(f"{name:<8}  failed to start: {e}")
+            continue
+        errors = reference_words = 0
+        latencies = []
+        for _, audio, reference in clips:
+            start = time.perf_counter()
+            result = engine.transcribe(audio)
+            latencies.append(time.perf_counter() - start)
+            reference_tokens = normalize_words(reference)
+            errors += word_errors(reference_tokens, normalize_words(getattr(result, "transcript", "")))
+            reference_words += len(reference_tokens)
+        wer = errors / reference_words if reference_words else 0.0
+        real_time_factor = sum(latencies) / total_audio if total_audio else 0.0
+        print(f"{name:<8}{wer:>8.3f}{statistics.median(latencies) * 1000:>10.0f}"
+              f"{percentile(latencies, 0.95) * 1000:>10.0f}{real_time_factor:>8.2f}")
+
+
+if __name__ == "__main__":
+    main_benchmark()
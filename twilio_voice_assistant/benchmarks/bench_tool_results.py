@@ -0,0 +1,103 @@
+"""
+Benchmark: second-pass prompt size and latency with raw vs shaped tool results.
+
+Builds the final-response prompt for each tool from the tools API stub data,
+once with the raw tool result and once with the compact shaped result, and
+reports estimated prompt tokens. With SARVAM_API_KEY set (and --live), it also
+sends both prompts to the LLM and reports reported prompt tokens and latency.
+Run from the twilio_voice_assistant folder:
+
+    python benchmarks/bench_tool_results.py [--live --runs 5]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+import tools_api_stub  # noqa: E402
+from tool_results import estimate_tokens, shape_tool_result  # noqa: E402
+
+SAMPLE_RESULTS = {
+    "get_expenses": (
+        "what do I owe everyone",
+        json.dumps({
+            "expenses": main.summarize_expenses(list(reversed(tools_api_stub.EXPENSES))),
+            "owes": main.net_owes(tools_api_stub.EXPENSES),
+            "unsettled_count": sum(not expense.get("settled") for expense in tools_api_stub.EXPENSES),
+        }),
+    ),
+    "get_current_user": (
+        "who am I",
+        json.dumps({"success": True, "data": {"result": {"user": tools_api_stub.CURRENT_USER}}}),
+    ),
+    "initiate_payment": (
+        "pay Sandeep",
+        json.dumps({
+            "success": True,
+            "data": {
+                "link_id": "a1b2c3d4e5f6",
+                "link_url": "https://payments.example.com/links/a1b2c3d4e5f6",
+                "link_amount": 237200,
+                "link_status": "ACTIVE",
+                "link_purpose": "Payment",
+                "link_created_at": "2025-06-22T10:30:00+05:30",
+                "link_expiry_time": "2025-07-22T10:30:00+05:30",
+                "customer_details": {
+                    "customer_name": "Sandeep Kumar",
+                    "customer_email": "sandeep@example.com",
+                    "customer_phone": "9999999999",
+                },
+                "link_notify": {"send_sms": False, "send_email": True},
+            },
+        }),
+    ),
+}
+
+
+def prompt_tokens(messages: list) -> int:
+    return sum(estimate_tokens(message["content"]) for message in messages)
+
+
+def timed_completion(messages: list, runs: int):
+    latencies = []
+    reported_tokens = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        response = main.sarvam_client.chat.completions(messages=messages, max_tokens=300, temperature=0.7)
+        latencies.append((time.perf_counter() - start) * 1000)
+        usage = getattr(response, "usage", None)
+        reported_tokens = getattr(usage, "prompt_tokens", reported_tokens)
+    return statistics.median(latencies), reported_tokens
+
+
+def main_benchmark():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--live", action="store_true", help="Also call the LLM and measure latency.")
+    parser.add_argument("--runs", type=int, default=3, help="LLM calls per prompt when --live.")
+    args = parser.parse_args()
+
+    live = args.live and main.sarvam_client is not None
+    if args.live and not live:
+        print("SarvamAI client unavailable; reporting token estimates only.")
+
+    for tool_name, (question, raw_result) in SAMPLE_RESULTS.items():
+        raw_messages = main.build_final_response_messages(question, tool_name, raw_result)
+        shaped_messages = main.build_final_response_messages(question, tool_name, shape_tool_result(tool_name, raw_result))
+        raw_tokens = prompt_tokens(raw_messages)
+        shaped_tokens = prompt_tokens(shaped_messages)
+        print(f"{tool_name}: est. prompt tokens {raw_tokens} -> {shaped_tokens} "
+              f"({100 * (raw_tokens - shaped_tokens) / raw_tokens:.0f}% smaller)")
+        if live:
+            raw_ms, raw_reported = timed_completion(raw_messages, args.runs)
+            shaped_ms, shaped_reported = timed_completion(shaped_messages, args.runs)
+            print(f"  reported prompt tokens {raw_reported} -> {shaped_reported}, "
+                  f"median latency {raw_ms:.0f}ms -> {shaped_ms:.0f}ms")
+
+
+if __name__ == "__main__":
+    main_benchmark()
@@ -0,0 +1,111 @@
+"""
+Soak test: memory per active call at a target concurrency.
+
+Opens N call sessions concurrently, streams 20ms µ-law frames into each as
+the /ws handler does, and runs a simulated reply turn per call (TTS WAV ->
+8kHz µ-law -> base64). Measures Python heap per held call with tracemalloc
+and exits non-zero if it exceeds the ceiling. Run from the
+twilio_voice_assistant folder:
+
+    python benchmarks/soak_call_memory.py --calls 2000 --max-kib-per-call 40
+"""
+import argparse
+import asyncio
+import base64
+import io
+import os
+import sys
+import tracemalloc
+import wave
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import call_session  # noqa: E402
+from audio_format import convert_audio  # noqa: E402
+
+FRAME_BYTES = 160  # 20ms of 8kHz µ-law, as Twilio sends it
+TURN_AUDIO_BYTES = 24000
+AUDIO_CAPACITY = 32000
+
+
+def make_tts_wav(seconds: float = 3.0, sample_rate: int = 24000) -> bytes:
+    t = np.arange(int(sample_rate * seconds)) / sample_rate
+    pcm = (0.3 * np.sin(2 * np.pi * 220 * t) * 32767).astype('<i2')
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(sample_rate)
+        wf.writeframes(pcm.tobytes())
+    return buffer.getvalue()
+
+
+async def simulate_call(frame_payload: str, tts_wav: bytes, hold: asyncio.Event, streamed: list):
+    session = call_session.open_session(AUDIO_CAPACITY)
+    session.stream_sid = f"MZ{id(session):030x}"
+    try:
+        # Stream a little over one turn's worth of audio, yielding between frames
+        # so all calls interleave like real connections.
+        for _ in range(TURN_AUDIO_BYTES // FRAME_BYTES + 10):
+            audio_data = base64.b64decode(frame_payload)
+            session.audio.write(audio_data)
+            session.bytes_in += len(audio_data)
+            if len(session.audio) > TURN_AUDIO_BYTES:
+                turn_audio = session.audio.read_all()
+                session.audio.clear()
+                del turn_audio
+                mulaw = convert_audio(tts_wav, 8000, "mulaw")
+                payload = base64.b64encode(mulaw).decode("ascii")
+                session.bytes_out += len(mulaw)
+                del mulaw, payload
+            await asyncio.sleep(0)
+        # Keep the call open until every call has been measured.
+        streamed.append(session)
+        await hold.wait()
+    finally:
+        call_session.close_session(session)
+
+
+async def run(calls: int) -> tuple:
+    frame_payload = base64.b64encode(bytes([0xFF]) * FRAME_BYTES).decode("ascii")
+    tts_wav = make_tts_wav()
+    hold = asyncio.Event()
+    streamed = []
+
+    tracemalloc.start()
+    baseline, _ = tracemalloc.get_traced_memory()
+    tasks = [asyncio.create_task(simulate_call(frame_payload, tts_wav, hold, streamed)) for _ in range(calls)]
+    while len(streamed) < calls:
+        await asyncio.sleep(0.01)
+    current, peak = tracemalloc.get_traced_memory()
+    report = call_session.memory_report()
+    hold.set()
+    await asyncio.gather(*tasks)
+    tracemalloc.stop()
+    return current - baseline, peak - baseline, report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=2000, help="Concurrent calls to hold open.")
+    parser.add_argument("--max-kib-per-call", type=float, default=40.0, help="Heap ceiling per held call.")
+    args = parser.parse_args()
+
+    held, peak, report = asyncio.run(run(args.calls))
+    per_call = held / args.calls
+    print(f"calls: {args.calls}")
+    print(f"heap held: {held / 1024 / 1024:.1f} MiB ({per_call / 1024:.1f} KiB per call)")
+    print(f"heap peak: {peak / 1024 / 1024:.1f} MiB")
+    print(f"session accounting: {report['session_bytes_per_call'] / 1024:.1f} KiB per call")
+
+    ceiling = args.max_kib_per_call * 1024
+    if per_call > ceiling:
+        print(f"FAIL: {per_call / 1024:.1f} KiB per call exceeds ceiling of {args.max_kib_per_call} KiB")
+        sys.exit(1)
+    print(f"OK: within {args.max_kib_per_call} KiB per call")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+import glob
+import hashlib
+import logging
+import os
+import struct
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# --- File Format ---
+# Files are append-only sequences of fixed-size 64-byte little-endian rows, so
+# a reader can map a whole file onto a NumPy structured array in one call.
+# Row kind b"T" is one call turn. Row kind b"S" defines a string code: short,
+# repetitive strings (language, tool, outcome) are stored once per file and
+# turn rows carry their 1-byte code. Each file starts with its own string table.
+MAGIC = b"CREC1\n"
+RECORD_SIZE = 64
+# Stage offsets are milliseconds from the start of the turn; NOT_RUN marks a
+# stage the turn never reached.
+NOT_RUN = 0xFFFFFFFF
+STAGES = ("stt", "llm", "tts", "sent")
+
+_TURN = struct.Struct("<c d 16s H I I I I H B B B I I")
+_STRING = struct.Struct("<c B B 61s")
+
+TURN_DTYPE = np.dtype([
+    ("kind", "S1"),
+    ("started_at", "<f8"),
+    ("call_id", "S16"),
+    ("turn", "<u2"),
+    ("stt", "<u4"),
+    ("llm", "<u4"),
+    ("tts", "<u4"),
+    ("sent", "<u4"),
+    ("transcript_chars", "<u2"),
+    ("language", "u1"),
+    ("tool", "u1"),
+    ("outcome", "u1"),
+    ("bytes_in", "<u4"),
+    ("bytes_out", "<u4"),
+    ("_pad", f"V{RECORD_SIZE - _TURN.size}"),
+])
+assert TURN_DTYPE.itemsize == RECORD_SIZE
+
+
+def call_id_bytes(call_id: str) -> bytes:
+    """16-byte form of a Twilio SID (two letters + 32 hex digits); other ids are hashed."""
+    if call_id and len(call_id) == 34:
+        try:
+            return bytes.fromhex(call_id[2:])
+        except ValueError:
+            pass
+    return hashlib.md5((call_id or "").encode("utf-8")).digest()
+
+
+class TurnRecord:
+    """
+    Structured record of one call turn, filled in as the turn progresses.
+    Stage times are offsets from the start of the turn, set by mark().
+
+    Outcomes: replied; no_speech (empty transcript); stt_failed, stt_busy;
+    llm_error, llm_dropped (deadline), llm_busy; tool_error, tool_busy;
+    tts_failed, tts_busy; no_reply; error and disconnected. A turn that spoke
+    an apology keeps the failure that caused it rather than "replied".
+    """
+
+    __slots__ = ("call_id", "turn", "started_at", "_started", "stages",
+                 "transcript_chars", "language", "tool", "outcome", "bytes_in", "bytes_out")
+
+    def __init__(self, call_id: str, turn: int, bytes_in: int = 0):
+        self.call_id = call_id
+        self.turn = turn
+        self.started_at = time.time()
+        self._started = time.monotonic()
+        self.stages = {}
+        self.transcript_chars = 0
+        self.language = ""
+        self.tool = ""
+        self.outcome = "no_speech"
+        self.bytes_in = bytes_in
+        self.bytes_out = 0
+
+    def mark(self, stage: str):
+        self.stages[stage] = int((time.monotonic() - self._started) * 1000)
+
+
+class CallRecordWriter:
+    """
+    Collects turn records in memory and appends them to disk in batches from a
+    background thread, so the event loop never waits on file I/O. Files rotate
+    once they reach `max_file_bytes`; only the newest `keep_files` are kept.
+    If the disk falls behind, records beyond `max_pending` are dropped and counted.
+    """
+
+    def __init__(self, directory: str, max_file_bytes: int = 64 * 1024 * 1024, keep_files: int = 50,
+                 flush_interval: float = 1.0, batch_size: int = 1024, max_pending: int = 100000):
+        self.directory = directory
+        self.max_file_bytes = max_file_bytes
+        self.keep_files = keep_files
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self.written = 0
+        self.dropped = 0
+        self._pending = deque()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._file = None
+        self._file_bytes = 0
+        self._codes = {}
+        self._sequence = 0
+
+    def submit(self, record: TurnRecord):
+        """Queues a record for writing. Never blocks."""
+        if len(self._pending) >= self.max_pending:
+            self.dropped += 1
+            return
+        self._pending.append(record)
+        if len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="call-records", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join(5.0)
+            self._thread = None
+        self.flush()
+        if self._file:
+            self._file.close()
+            self._file = None
+
+    def _run(self):
+        while not self._stopping.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except OSError as e:
+                logger.error(f"Failed to write call records: {e}")
+
+    # --- Encoding ---
+
+    def _open_next_file(self):
+        if self._file:
+            self._file.close()
+        self._sequence += 1
+        name = f"turns-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{self._sequence:04d}.crec"
+        path = os.path.join(self.directory, name)
+        # A new file for every rotation: string codes are only valid within one file.
+        self._file = open(path, "xb")
+        self._file.write(MAGIC)
+        self._file_bytes = len(MAGIC)
+        self._codes = {}
+        logger.info(f"Writing call records to {path}")
+        for old in sorted(glob.glob(os.path.join(self.directory, "turns-*.crec")))[:-self.keep_files]:
+            os.remove(old)
+
+    def _code(self, value: str, out: list) -> int:
+        code = self._codes.get(value)
+        if code is None:
+            if len(self._codes) >= 255:
+                return 255
+            code = self._codes[value] = len(self._codes)
+            encoded = value.encode("utf-8")[:61]
+            out.append(_STRING.pack(b"S", code, len(encoded), encoded).ljust(RECORD_SIZE, b"\0"))
+        return code
+
+    def _encode(self, record: TurnRecord, out: list):
+        language = self._code(record.language or "", out)
+        tool = self._code(record.tool or "", out)
+        outcome = self._code(record.outcome or "", out)
+        stages = record.stages
+        out.append(_TURN.pack(
+            b"T", record.started_at, call_id_bytes(record.call_id), min(record.turn, 0xFFFF),
+            *(stages.get(stage, NOT_RUN) for stage in STAGES),
+            min(record.transcript_chars, 0xFFFF), language, tool, outcome,
+            min(record.bytes_in, 0xFFFFFFFF), min(record.bytes_out, 0xFFFFFFFF),
+        ).ljust(RECORD_SIZE, b"\0"))
+
+    def flush(self):
+        """
+        Writes every pending record, one write per batch. A batch ends early
+        when the file reaches max_file_bytes, so files overshoot it by at most
+        one record's rows.
+        """
+        while self._pending:
+            if self._file is None or self._file_bytes >= self.max_file_bytes:
+                self._open_next_file()
+            rows = []
+            count = 0
+            while self._pending and count < self.batch_size:
+                if rows and self._file_bytes + len(rows) * RECORD_SIZE >= self.max_file_bytes:
+                    break
+                self._encode(self._pending.popleft(), rows)
+                count += 1
+            data = b"".join(rows)
+            self._file.write(data)
+            self._file.flush()
+            self._file_bytes += len(data)
+            self.written += count
+
+    def stats(self) -> dict:
+        return {
+            "written": self.written,
+            "pending": len(self._pending),
+            "dropped": self.dropped,
+            "current_file_bytes": self._file_bytes,
+        }
+
+
+# --- Reading ---
+
+def read_file(path: str):
+    """
+    Loads one record file. Returns (turns, strings): a structured array of the
+    turn rows, and the file's code -> string table for the language, tool and
+    outcome columns.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    if not data.startswith(MAGIC):
+        raise ValueError(f"{path} is not a call record file")
+    body = data[len(MAGIC):]
+    # A crash mid-write can leave a partial final row; ignore it.
+    body = body[:len(body) - len(body) % RECORD_SIZE]
+    rows = np.frombuffer(body, dtype=TURN_DTYPE)
+    strings = {}
+    raw = np.frombuffer(body, dtype=np.uint8).reshape(-1, RECORD_SIZE)
+    for index in np.flatnonzero(rows["kind"] == b"S"):
+        _, code, length, encoded = _STRING.unpack_from(raw[index].tobytes())
+        strings[code] = encoded[:length].decode("utf-8", "replace")
+    return rows[rows["kind"] == b"T"], strings
@@ -0,0 +1,127 @@
+import os
+import sys
+import time
+
+
+class AudioRingBuffer:
+    """
+    Fixed-size ring buffer for inbound µ-law audio. The storage is allocated
+    once per call and never grows; when full, the oldest audio is overwritten.
+    """
+
+    __slots__ = ("_buffer", "_capacity", "_start", "_length")
+
+    def __init__(self, capacity: int):
+        self._buffer = bytearray(capacity)
+        self._capacity = capacity
+        self._start = 0
+        self._length = 0
+
+    def __len__(self) -> int:
+        return self._length
+
+    @property
+    def capacity(self) -> int:
+        return self._capacity
+
+    def write(self, data) -> int:
+        """Appends data, returning how many bytes of older audio were overwritten."""
+        size = len(data)
+        if size >= self._capacity:
+            dropped = self._length + size - self._capacity
+            self._buffer[:] = memoryview(data)[size - self._capacity:]
+            self._start = 0
+            self._length = self._capacity
+            return dropped
+
+        end = (self._start + self._length) % self._capacity
+        first = min(size, self._capacity - end)
+        self._buffer[end:end + first] = memoryview(data)[:first]
+        if first < size:
+            self._buffer[:size - first] = memoryview(data)[first:]
+
+        dropped = max(self._length + size - self._capacity, 0)
+        if dropped:
+            self._start = (self._start + dropped) % self._capacity
+        self._length = min(self._length + size, self._capacity)
+        return dropped
+
+    def read_all(self) -> bytes:
+        """Returns the buffered audio, oldest first, as one bytes object."""
+        end = self._start + self._length
+        if end <= self._capacity:
+            return bytes(self._buffer[self._start:end])
+        return bytes(self._buffer[self._start:]) + bytes(self._buffer[:end - self._capacity])
+
+    def clear(self):
+        self._start = 0
+        self._length = 0
+
+
+class CallSession:
+    """
+    Compact per-call state for the Twilio media stream. Slotted so a session
+    carries no per-instance __dict__; the only large allocation is the audio ring.
+    """
+
+    __slots__ = ("stream_sid", "tenant", "admitted", "audio", "started_at",
+                 "turns", "bytes_in", "bytes_out", "dropped_bytes")
+
+    def __init__(self, audio_capacity: int):
+        self.stream_sid = None
+        self.tenant = None
+        self.admitted = False
+        self.audio = AudioRingBuffer(audio_capacity)
+        self.started_at = time.time()
+        self.turns = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.dropped_bytes = 0
+
+    def footprint(self) -> int:
+        """Approximate bytes held by this session object and its audio ring."""
+        size = sys.getsizeof(self) + sys.getsizeof(self.audio) + sys.getsizeof(self.audio._buffer)
+        for attribute in ("stream_sid", "tenant"):
+            value = getattr(self, attribute)
+            if value is not None:
+                size += sys.getsizeof(value)
+        return size
+
+
+# Sessions for calls currently connected to this worker, keyed by id(session)
+# until Twilio tells us the stream SID.
+active_sessions = {}
+
+
+def open_session(audio_capacity: int) -> CallSession:
+    session = CallSession(audio_capacity)
+    active_sessions[id(session)] = session
+    return session
+
+
+def close_session(session: CallSession):
+    active_sessions.pop(id(session), None)
+
+
+def _process_rss_bytes() -> int:
+    """Resident set size of this process, or 0 where /proc is unavailable."""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def memory_report() -> dict:
+    sessions = list(active_sessions.values())
+    session_bytes = sum(session.footprint() for session in sessions)
+    buffered = sum(len(session.audio) for session in sessions)
+    rss = _process_rss_bytes()
+    return {
+        "active_calls": len(sessions),
+        "session_bytes_total": session_bytes,
+        "session_bytes_per_call": session_bytes // len(sessions) if sessions else 0,
+        "audio_bytes_buffered": buffered,
+        "process_rss_bytes": rss,
+        "process_rss_bytes_per_call": rss // len(sessions) if sessions and rss else None,
+    }
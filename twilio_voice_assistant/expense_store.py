@@ -0,0 +1,168 @@
+import logging
+import threading
+import time
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+# Number of expenses requested per getExpenses call.
+EXPENSE_PAGE_SIZE = 50
+# Safety bound on pages fetched in one sync, in case the API ignores paging.
+MAX_PAGES_PER_SYNC = 40
+# Repeated turns within this many seconds reuse the local copy without a delta call.
+MIN_SYNC_INTERVAL_SECONDS = 5.0
+
+
+def expense_key(expense: dict) -> str:
+    """
+    Stable identity for an expense. Uses the API's id when present and falls back
+    to the fields that identify a row in the legacy payload.
+    """
+    if expense.get("id") is not None:
+        return str(expense["id"])
+    return "|".join(str(expense.get(field, "")) for field in ("date", "from", "to", "amount", "description"))
+
+
+def fetch_expenses_page(base_url: str, api_key: str, limit: int, offset: int = 0, updated_after: str = None) -> dict:
+    """
+    Fetches one page of expenses from the tools API.
+    Returns the 'result' object: {"expenses": [...], "has_more": bool}.
+    """
+    body = {"limit": limit, "offset": offset}
+    if updated_after:
+        body["updated_after"] = updated_after
+    response = requests.post(
+        f"{base_url}/tools/getExpenses",
+        headers={'x-splitwise-key': f'{api_key}', 'Content-Type': 'application/json'},
+        json=body,
+        timeout=10,
+    )
+    response.raise_for_status()
+    return response.json().get('data', {}).get('result', {})
+
+
+class ExpenseStore:
+    """
+    A per-user local copy of the expense history, kept current with delta
+    queries ("updated_after" the newest change already seen) so that each
+    request only transfers expenses that are new or changed.
+    """
+
+    def __init__(self, base_url: str, api_key: str, page_size: int = EXPENSE_PAGE_SIZE,
+                 min_sync_interval: float = MIN_SYNC_INTERVAL_SECONDS, fetch_page=fetch_expenses_page):
+        self.base_url = base_url
+        self.api_key = api_key
+        self.page_size = page_size
+        self.min_sync_interval = min_sync_interval
+        self._fetch_page = fetch_page
+        self._expenses = {}
+        self._ordered = []
+        self._cursor = None
+        # Where a sync cut short at MAX_PAGES_PER_SYNC resumes, and the newest
+        # update it had seen. The cursor only moves once every page was read.
+        self._resume_offset = 0
+        self._resume_cursor = None
+        self._last_sync = 0.0
+        self._lock = threading.Lock()
+        # Accounting for how much each sync actually transferred.
+        self.syncs = 0
+        self.pages_fetched = 0
+        self.records_fetched = 0
+
+    def sync(self, force: bool = False) -> int:
+        """
+        Pulls expenses changed since the last sync and merges them into the
+        local copy. Returns the number of records received.
+        """
+        with self._lock:
+            if not force and time.monotonic() - self._last_sync < self.min_sync_interval:
+                return 0
+
+            received = 0
+            offset = self._resume_offset
+            newest_update = self._resume_cursor or self._cursor
+            supports_delta = True
+            complete = True
+            for _ in range(MAX_PAGES_PER_SYNC):
+                result = self._fetch_page(self.base_url, self.api_key, self.page_size, offset, self._cursor)
+                page = result.get("expenses", [])
+                self.pages_fetched += 1
+                received += len(page)
+
+                for expense in page:
+                    updated_at = expense.get("updated_at")
+                    if updated_at is None:
+                        supports_delta = False
+                    elif newest_update is None or updated_at > newest_update:
+                        newest_update = updated_at
+                    if expense.get("deleted"):
+                        self._expenses.pop(expense_key(expense), None)
+                    else:
+                        self._expenses[expense_key(expense)] = expense
+
+                # An API that ignores paging returns everything in one go.
+                has_more = result.get("has_more", len(page) == self.page_size)
+                if not page or not has_more or len(page) > self.page_size:
+                    break
+                offset += len(page)
+            else:
+                # Pages come newest first, so the unread ones hold older rows: keep
+                # the cursor where it was and pick up from this offset next time.
+                logger.warning(f"Stopped expense sync after {MAX_PAGES_PER_SYNC} pages; resuming at offset {offset}.")
+                complete = False
+
+            if complete:
+                # Without update timestamps we cannot ask for a delta, so the next sync
+                # starts from scratch (and still merges rather than duplicating).
+                self._cursor = newest_update if supports_delta else None
+                self._resume_offset = 0
+                self._resume_cursor = None
+                self._last_sync = time.monotonic()
+            else:
+                # Not throttled, so the next request carries on with the rest.
+                self._resume_offset = offset
+                self._resume_cursor = newest_update if supports_delta else None
+            if received:
+                self._ordered = sorted(self._expenses.values(), key=lambda e: e.get("date", ""), reverse=True)
+            self.syncs += 1
+            self.records_fetched += received
+            logger.info(f"Expense sync received {received} records; {len(self._expenses)} held locally.")
+            return received
+
+    def sync_fully(self) -> int:
+        """
+        Syncs, then keeps going while a sync was cut short, so every row is held.
+        For balances and payments, which are wrong if older rows are missing.
+        """
+        received = self.sync()
+        while not self.complete:
+            received += self.sync(force=True)
+        return received
+
+    @property
+    def complete(self) -> bool:
+        """False while a sync cut short at MAX_PAGES_PER_SYNC still has older pages to read."""
+        return self._resume_offset == 0
+
+    def recent(self, limit: int = None) -> list:
+        """Returns the most recent expenses, newest first."""
+        return self._ordered[:limit] if limit else list(self._ordered)
+
+    def outstanding(self) -> list:
+        """Returns all unsettled expenses."""
+        return [expense for expense in self._ordered if not expense.get("settled")]
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_expense_store(base_url: str, api_key: str) -> ExpenseStore:
+    """Returns the process-wide store for a user, creating it on first use."""
+    with _stores_lock:
+        store = _stores.get(api_key)
+        if store is None:
+            store = ExpenseStore(base_url, api_key)
+            _stores[api_key] = store
+        return store
@@ -0,0 +1,90 @@
+import hashlib
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+# Unicode categories kept by normalization: letters, marks (Indic vowel signs
+# and viramas are marks) and numbers. Everything else separates words.
+_WORD_CATEGORIES = ("L", "M", "N")
+
+
+def normalize_utterance(text: str) -> str:
+    """
+    Canonical form of a transcript for cache lookups: Unicode NFKC, case-folded,
+    punctuation dropped and whitespace collapsed, so "Who am I?" and "who am i"
+    share an entry.
+    """
+    text = unicodedata.normalize("NFKC", text).casefold()
+    return " ".join("".join(
+        char if unicodedata.category(char)[0] in _WORD_CATEGORIES else " " for char in text
+    ).split())
+
+
+def schema_version(*parts: str) -> str:
+    """Short hash of the tool schema and prompt text; any change invalidates old entries."""
+    digest = hashlib.sha1()
+    for part in parts:
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()[:12]
+
+
+class ResponseCache:
+    """
+    LRU cache with a TTL for first-pass LLM outputs, keyed by
+    (normalized utterance, language code, schema version).
+
+    Backed by an OrderedDict in least-recently-used order, so lookups,
+    inserts and evictions are O(1). Each entry remembers how long the LLM
+    took to produce it, which is counted as saved latency on every hit.
+    """
+
+    def __init__(self, max_entries: int = 5000, ttl_seconds: float = 3600.0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+
+    @staticmethod
+    def key(text: str, language_code: str, version: str) -> tuple:
+        return normalize_utterance(text), language_code, version
+
+    def get(self, key: tuple):
+        """Returns the cached output for key, or None on a miss."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or now - entry[2] > self.ttl_seconds:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            self.saved_seconds += entry[1]
+            return entry[0]
+
+    def put(self, key: tuple, output: str, latency_seconds: float):
+        if not key[0] or self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (output, latency_seconds, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "saved_seconds": round(self.saved_seconds, 3),
+                "saved_ms_per_hit": round(self.saved_seconds / self.hits * 1000, 1) if self.hits else 0.0,
+            }
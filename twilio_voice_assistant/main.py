@@ -7,8 +7,13 @@ import audioop
 import pywav
 import requests
 import json
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
-from fastapi.responses import Response
+import asyncio
+import hmac
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+from fastapi import FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import PlainTextResponse, Response
 from twilio.twiml.voice_response import VoiceResponse, Connect
 from sarvamai import SarvamAI
 from dotenv import load_dotenv
@@ -17,6 +22,19 @@ from datetime import datetime
 from scipy.signal import resample
 from tempfile import NamedTemporaryFile
 import tempfile
+from audio_format import SINK_FORMATS, convert_audio
+from admission import AdmissionController, AdmissionRejected
+from expense_store import get_expense_store
+from tool_results import net_owes, shape_tool_result
+from stt_engines import CircuitBreaker, LocalSTTEngine, RemoteSTTEngine, STTRouter
+import profiling
+from call_session import close_session, memory_report, open_session
+from media_ingest import MediaIngest, parse_message
+from llm_cache import ResponseCache, schema_version
+from call_records import CallRecordWriter, TurnRecord
+from payment_jobs import JobQueue, RetryableJobError
+import sarvam_scheduler
+from sarvam_scheduler import DeadlineExceeded, SarvamScheduler
 # from scikits.audiolab import Sndfile
 
 # --- Configuration ---
@@ -35,6 +53,66 @@ TOOLS_API_BASE_URL = os.getenv("TOOLS_API_BASE_URL")
 SPLITWISE_API_KEY = os.getenv("SPLITWISE_API_KEY")
 CASHFREE_CLIENT_ID = os.getenv("CASHFREE_CLIENT_ID")
 CASHFREE_CLIENT_SECRET = os.getenv("CASHFREE_CLIENT_SECRET")
+# Sample rate requested from the TTS service. Calls only play 8kHz µ-law, so the
+# default asks for 8kHz and skips resampling; any other rate is resampled.
+TTS_SAMPLE_RATE = int(os.getenv("TTS_SAMPLE_RATE", "8000"))
+
+# Admission control: calls accepted per worker, in-flight requests per stage
+# (globally and per tenant / Twilio account), and how long a request may queue.
+MAX_CONCURRENT_CALLS = int(os.getenv("MAX_CONCURRENT_CALLS", "50"))
+MAX_CALLS_PER_TENANT = int(os.getenv("MAX_CALLS_PER_TENANT", "20"))
+STAGE_LIMITS = {
+    "stt": {"global": int(os.getenv("STT_CONCURRENCY", "16")), "tenant": int(os.getenv("STT_TENANT_CONCURRENCY", "8"))},
+    "llm": {"global": int(os.getenv("LLM_CONCURRENCY", "16")), "tenant": int(os.getenv("LLM_TENANT_CONCURRENCY", "8"))},
+    "tts": {"global": int(os.getenv("TTS_CONCURRENCY", "16")), "tenant": int(os.getenv("TTS_TENANT_CONCURRENCY", "8"))},
+    "tool": {"global": int(os.getenv("TOOL_CONCURRENCY", "8")), "tenant": int(os.getenv("TOOL_TENANT_CONCURRENCY", "4"))},
+}
+STAGE_QUEUE_TIMEOUT = float(os.getenv("STAGE_QUEUE_TIMEOUT", "2.0"))
+# How long a call slot reserved by the webhook waits for its media stream to start.
+CALL_RESERVATION_TTL = float(os.getenv("CALL_RESERVATION_TTL", "15"))
+# Speech-to-text routing between SarvamAI and the local CPU fallback engine.
+STT_LATENCY_SLO_SECONDS = float(os.getenv("STT_LATENCY_SLO_SECONDS", "2.5"))
+LOCAL_STT_MODEL = os.getenv("LOCAL_STT_MODEL", "tiny")
+LOCAL_STT_COMPUTE_TYPE = os.getenv("LOCAL_STT_COMPUTE_TYPE", "int8")
+LOCAL_STT_WORKERS = int(os.getenv("LOCAL_STT_WORKERS", "2"))
+LOCAL_STT_SHORT_UTTERANCE_SECONDS = float(os.getenv("LOCAL_STT_SHORT_UTTERANCE_SECONDS", "1.5"))
+STT_BREAKER_FAILURES = int(os.getenv("STT_BREAKER_FAILURES", "3"))
+STT_BREAKER_RESET_SECONDS = float(os.getenv("STT_BREAKER_RESET_SECONDS", "30"))
+# Payment links created in parallel by the settle_up_everyone tool.
+SETTLE_UP_CONCURRENCY = int(os.getenv("SETTLE_UP_CONCURRENCY", "4"))
+# Payment links are created by background workers from a durable SQLite queue, so
+# the caller hears an acknowledgement instead of waiting on the payment backend.
+ASYNC_PAYMENT_LINKS = os.getenv("ASYNC_PAYMENT_LINKS", "true").lower() == "true"
+PAYMENT_JOBS_DB = os.getenv("PAYMENT_JOBS_DB", "payment_jobs.sqlite3")
+PAYMENT_JOB_WORKERS = int(os.getenv("PAYMENT_JOB_WORKERS", "2"))
+PAYMENT_JOB_MAX_ATTEMPTS = int(os.getenv("PAYMENT_JOB_MAX_ATTEMPTS", "5"))
+# Sarvam API rate limits per endpoint (requests per second, burst), applied per
+# model, and the time budget for one call turn (STT + LLM + TTS). Sarvam requests
+# that can no longer finish within the turn budget are dropped instead of sent.
+SARVAM_RATE_LIMITS = {
+    "stt": (float(os.getenv("SARVAM_STT_RPS", "5")), int(os.getenv("SARVAM_STT_BURST", "10"))),
+    "chat": (float(os.getenv("SARVAM_CHAT_RPS", "5")), int(os.getenv("SARVAM_CHAT_BURST", "10"))),
+    "tts": (float(os.getenv("SARVAM_TTS_RPS", "5")), int(os.getenv("SARVAM_TTS_BURST", "10"))),
+}
+# Fraction of the limits above this process may use. Every process calling Sarvam
+# with the same key takes a share: the web app (app.py) defaults to 0.2, so with
+# N uvicorn workers set this to 0.8 / N.
+SARVAM_RATE_SHARE = float(os.getenv("SARVAM_RATE_SHARE", "0.8"))
+TURN_SLO_SECONDS = float(os.getenv("TURN_SLO_SECONDS", "10"))
+# First-pass (tool selection) LLM outputs reused for repeated utterances.
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "5000"))
+LLM_CACHE_TTL_SECONDS = float(os.getenv("LLM_CACHE_TTL_SECONDS", "3600"))
+# Structured per-turn records (stage timings, tool, outcome), appended in batches
+# to rotating binary files. Query them with query_call_records.py.
+CALL_RECORDS_DIR = os.getenv("CALL_RECORDS_DIR", "call_records")
+CALL_RECORDS_MAX_FILE_MB = int(os.getenv("CALL_RECORDS_MAX_FILE_MB", "64"))
+CALL_RECORDS_KEEP_FILES = int(os.getenv("CALL_RECORDS_KEEP_FILES", "50"))
+# Token required in the x-admin-token header for /admin endpoints; unset disables them.
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+# Caller audio is processed once this much has been buffered (~3 seconds of 8kHz µ-law).
+TURN_AUDIO_BYTES = 24000
+# Size of each call's preallocated audio ring buffer: 4 seconds of 8kHz µ-law.
+MAX_AUDIO_BUFFER_BYTES = int(os.getenv("MAX_AUDIO_BUFFER_BYTES", "32000"))
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
@@ -51,15 +129,74 @@ except Exception as e:
     logger.error(f"Failed to initialize SarvamAI client: {e}")
     sarvam_client = None
 
+# Every SarvamAI request from this server is a live call turn.
+sarvam = SarvamScheduler(SARVAM_RATE_LIMITS, default_priority=sarvam_scheduler.LIVE_CALL, share=SARVAM_RATE_SHARE)
+
+admission = AdmissionController(
+    max_calls=MAX_CONCURRENT_CALLS,
+    max_calls_per_tenant=MAX_CALLS_PER_TENANT,
+    stage_limits=STAGE_LIMITS,
+    queue_timeout=STAGE_QUEUE_TIMEOUT,
+    reservation_ttl=CALL_RESERVATION_TTL,
+)
+call_record_writer = CallRecordWriter(
+    CALL_RECORDS_DIR,
+    max_file_bytes=CALL_RECORDS_MAX_FILE_MB * 1024 * 1024,
+    keep_files=CALL_RECORDS_KEEP_FILES,
+)
+# Audio dropped because a call's buffer was full.
+dropped_audio_bytes = 0
+
+async def run_stage(stage: str, tenant: str, func, /, *args, **kwargs):
+    """
+    Runs a blocking pipeline stage (STT, LLM, TTS) in a worker thread once the
+    admission controller grants it a slot. Raises AdmissionRejected on timeout.
+    """
+    async with admission.slot(stage, tenant):
+        return await asyncio.to_thread(func, *args, **kwargs)
+
+@app.on_event("startup")
+async def bind_admission_loop():
+    # Tool calls run in worker threads and queue for their slots on this loop.
+    admission.bind_loop(asyncio.get_running_loop())
+
+@app.on_event("startup")
+def start_background_workers():
+    payment_queue.start()
+    call_record_writer.start()
+
+@app.on_event("shutdown")
+def stop_background_workers():
+    payment_queue.stop()
+    call_record_writer.stop()
+
 # --- Twilio Webhook for Incoming Calls ---
 @app.post("/incoming_call")
-async def handle_incoming_call(response: Response):
+async def handle_incoming_call(request: Request):
     """
     Handles incoming calls from Twilio.
-    Responds with TwiML to connect the call to our WebSocket stream.
+    Responds with TwiML to connect the call to our WebSocket stream, or with a
+    polite busy message when this worker has no capacity left.
     """
     logger.info("Incoming call received")
+    form = parse_qs((await request.body()).decode("utf-8"))
+    tenant = form.get("AccountSid", [None])[0]
+    call_sid = form.get("CallSid", [None])[0]
     twiml_response = VoiceResponse()
+
+    # Reserve the slot now so concurrent webhooks cannot all pass the check
+    # before any of their streams starts; the ws `start` event uses it up.
+    if call_sid:
+        has_slot = admission.reserve_call(call_sid, tenant)
+    else:
+        has_slot = admission.has_call_capacity(tenant)
+        if not has_slot:
+            admission.reject_call()
+    if not has_slot:
+        logger.warning(f"Rejecting call, at capacity ({admission.active_calls} active calls).")
+        twiml_response.say("Sorry, all of our lines are busy right now. Please try again in a few minutes.")
+        twiml_response.hangup()
+        return Response(content=str(twiml_response), media_type="application/xml")
     
     # The <Connect> verb will establish a media stream
     # The 'url' should point to your WebSocket endpoint
@@ -84,57 +221,114 @@ async def websocket_endpoint(websocket: WebSocket):
     """
     await websocket.accept()
     logger.info("WebSocket connection established with Twilio.")
-    audio_buffer = bytearray()
-    stream_sid = None
+    global dropped_audio_bytes
+    session = open_session(MAX_AUDIO_BUFFER_BYTES)
+    ingest = MediaIngest(session.audio)
+    # Record of the turn in progress; submitted when the turn ends (or the call does).
+    turn_record = None
     
     try:
         while True:
-            message = await websocket.receive_json()
-            event = message.get("event")
+            # Media frames (50 per second per call) skip the JSON parser entirely.
+            event, payload, message = parse_message(await websocket.receive_text())
 
             if event == "start":
-                stream_sid = message["start"]["streamSid"]
-                logger.info(f"Twilio media stream started (SID: {stream_sid}).")
+                session.stream_sid = message["start"]["streamSid"]
+                session.tenant = message["start"].get("accountSid")
+                logger.info(f"Twilio media stream started (SID: {session.stream_sid}).")
+                session.admitted = admission.admit_call(session.tenant, message["start"].get("callSid"))
+                if not session.admitted:
+                    logger.warning(f"No capacity for stream {session.stream_sid}, closing.")
+                    await websocket.close()
+                    break
 
             elif event == "media":
-                payload = message["media"]["payload"]
-                audio_data = base64.b64decode(payload)
-                audio_buffer.extend(audio_data)
+                if payload is None:
+                    payload = message["media"]["payload"]
+                # The ring buffer keeps only the most recent audio if it is full.
+                overflow = ingest.write(payload)
+                if overflow:
+                    session.dropped_bytes += overflow
+                    dropped_audio_bytes += overflow
 
                 # 8000 bytes = 1 second for 8-bit, 8000Hz, 1-channel audio
-                if len(audio_buffer) > 24000: # Process after ~3 seconds of audio
-                    logger.info(f"Buffer full ({len(audio_buffer)} bytes), processing audio...")
+                if len(session.audio) > TURN_AUDIO_BYTES: # Process after ~3 seconds of audio
+                    logger.info(f"Buffer full ({len(session.audio)} bytes), processing audio...")
+                    profiling.increment("turns_processed")
+                    session.turns += 1
+                    turn_record = TurnRecord(session.stream_sid, session.turns, bytes_in=ingest.flush(session))
+                    # Sarvam requests of this turn share one deadline (copied into the stage threads).
+                    sarvam_scheduler.start_turn(TURN_SLO_SECONDS)
                     
                     # --- Start of Conversational Loop ---
                     
                     # 1. Prepare audio data for transcription
-                    wav_bytes = convert_mulaw_to_wav_bytes(bytes(audio_buffer))
+                    wav_bytes = convert_mulaw_to_wav_bytes(session.audio.read_all())
+                    # Clear buffer now that its audio has been copied out
+                    session.audio.clear()
                     
                     if wav_bytes:
                         # 2. Transcribe audio to text
-                        transcription = transcribe_audio(wav_bytes)
+                        try:
+                            transcription = await run_stage("stt", session.tenant, transcribe_audio, wav_bytes)
+                        except AdmissionRejected as e:
+                            logger.warning(f"Skipping turn, speech-to-text is saturated: {e}")
+                            transcription = None
+                            turn_record.outcome = "stt_busy"
+                        turn_record.mark("stt")
+                        if transcription is None and turn_record.outcome == "no_speech":
+                            # No engine produced a transcription at all (silence gives an empty one).
+                            turn_record.outcome = "stt_failed"
+                        # The input audio is no longer needed once transcribed.
+                        del wav_bytes
                         if transcription and transcription.transcript:
                             # CORRECTED: Get the detected language from the STT response using the correct attribute 'language_code'.
                             # We default to 'en-IN' if the language code is not available.
                             detected_language = getattr(transcription, 'language_code', 'en-IN')
                             logger.info(f"Detected language: {detected_language}")
+                            turn_record.transcript_chars = len(transcription.transcript)
+                            turn_record.language = detected_language or ""
+                            turn_record.outcome = "no_reply"
 
                             # 3. Get a response from the LLM
                             logger.info(f"LLM INPUT (Transcription): {transcription.transcript}")
-                            llm_response_text = get_llm_response(
-                                transcription.transcript,
-                                language_code=detected_language
-                            )
+                            try:
+                                llm_response_text = await run_stage(
+                                    "llm",
+                                    session.tenant,
+                                    get_llm_response,
+                                    transcription.transcript,
+                                    language_code=detected_language,
+                                    tenant=session.tenant,
+                                    owner=session.stream_sid,
+                                    turn_record=turn_record
+                                )
+                            except AdmissionRejected as e:
+                                logger.warning(f"LLM is saturated: {e}")
+                                llm_response_text = BUSY_RESPONSE_TEXT
+                                turn_record.outcome = "llm_busy"
+                            turn_record.mark("llm")
                             
                             if llm_response_text:
                                 logger.info(f"LLM OUPUT (Response): {llm_response_text}")
                                 
                                 # 4. Convert the LLM's text response to speech
                                 # NEW: Pass the detected language to the TTS function.
-                                response_audio_wav = convert_text_to_speech(
-                                    llm_response_text,
-                                    language_code=detected_language
-                                )
+                                try:
+                                    response_audio_wav = await run_stage(
+                                        "tts",
+                                        session.tenant,
+                                        convert_text_to_speech,
+                                        llm_response_text,
+                                        language_code=detected_language
+                                    )
+                                except AdmissionRejected as e:
+                                    logger.warning(f"Skipping reply, text-to-speech is saturated: {e}")
+                                    response_audio_wav = None
+                                    turn_record.outcome = "tts_busy"
+                                turn_record.mark("tts")
+                                if not response_audio_wav and turn_record.outcome != "tts_busy":
+                                    turn_record.outcome = "tts_failed"
 
                                 if response_audio_wav:
                                     # --- Start of Comprehensive Outgoing Audio Logging ---
@@ -148,6 +342,9 @@ async def websocket_endpoint(websocket: WebSocket):
 
                                     # 5. Convert response audio to raw mulaw bytes for Twilio
                                     response_audio_mulaw = convert_wav_to_mulaw_bytes(response_audio_wav)
+                                    # Release each large intermediate as soon as the next form exists,
+                                    # so a call never holds the WAV, µ-law and base64 copies at once.
+                                    del response_audio_wav
                                     
                                     if response_audio_mulaw:
                                         # Log the final raw mulaw bytestream being sent to Twilio
@@ -157,53 +354,135 @@ async def websocket_endpoint(websocket: WebSocket):
                                         logger.info(f"Saved final mulaw stream to: {mulaw_log_filename}")
 
                                         # 6. Send audio back to Twilio
-                                        payload = base64.b64encode(response_audio_mulaw).decode("utf-8")
+                                        payload = base64.b64encode(response_audio_mulaw).decode("ascii")
+                                        session.bytes_out += len(response_audio_mulaw)
+                                        turn_record.bytes_out = len(response_audio_mulaw)
+                                        del response_audio_mulaw
                                         
                                         # --- Start of Final Verification Log ---
-                                        logger.info("Preparing to send media response to Twilio.")
-                                        logger.info(f"  - Event: media")
-                                        logger.info(f"  - Stream SID: {stream_sid}")
-                                        logger.info(f"  - Payload Length (chars): {len(payload)}")
+                                        logger.debug("Preparing to send media response to Twilio.")
+                                        logger.debug(f"  - Event: media")
+                                        logger.debug(f"  - Stream SID: {session.stream_sid}")
+                                        logger.debug(f"  - Payload Length (chars): {len(payload)}")
                                         # --- End of Final Verification Log ---
                                         
                                         await websocket.send_json({
                                             "event": "media",
-                                            "streamSid": stream_sid,
+                                            "streamSid": session.stream_sid,
                                             "media": {
                                                 "payload": payload
                                             }
                                         })
+                                        del payload
                                         logger.info("Sent audio response back to Twilio.")
+                                        turn_record.mark("sent")
+                                        if turn_record.outcome == "no_reply":
+                                            turn_record.outcome = "replied"
 
                     # --- End of Conversational Loop ---
-                    
-                    # Clear buffer after processing
-                    audio_buffer.clear()
+                    call_record_writer.submit(turn_record)
+                    turn_record = None
 
             elif event == "stop":
                 logger.info("Twilio media stream stopped.")
+                ingest.flush(session)
                 # Process any remaining audio in the buffer to catch the last words.
-                if audio_buffer:
+                if len(session.audio):
                     logger.info("Processing remaining audio in buffer on stop event.")
-                    wav_bytes = convert_mulaw_to_wav_bytes(bytes(audio_buffer))
+                    sarvam_scheduler.start_turn(TURN_SLO_SECONDS)
+                    wav_bytes = convert_mulaw_to_wav_bytes(session.audio.read_all())
                     if wav_bytes:
-                        transcription = transcribe_audio(wav_bytes)
+                        try:
+                            transcription = await run_stage("stt", session.tenant, transcribe_audio, wav_bytes)
+                        except AdmissionRejected:
+                            transcription = None
                         if transcription and transcription.transcript:
                             # We'll just log the final transcription and not send a response,
                             # as the stream is closing.
                             logger.info(f"Final transcription: {transcription.transcript}")
-                    audio_buffer.clear()
+                    session.audio.clear()
                 break
+
+            else:
+                # connected, mark, dtmf: nothing to act on, reported in batches.
+                ingest.defer(event)
                 
     except WebSocketDisconnect:
         logger.warning("WebSocket disconnected.")
+        if turn_record:
+            turn_record.outcome = "disconnected"
     except Exception as e:
         logger.error(f"Error in WebSocket: {e}", exc_info=True)
+        if turn_record:
+            turn_record.outcome = "error"
     finally:
+        if turn_record:
+            call_record_writer.submit(turn_record)
+        ingest.flush(session)
+        if session.admitted:
+            admission.release_call(session.tenant)
+        close_session(session)
         logger.info("Closing WebSocket connection.")
 
+@app.get("/metrics/saturation")
+async def saturation_metrics():
+    """
+    Reports how close this worker is to its call and per-stage concurrency limits.
+    """
+    stats = admission.stats()
+    stats["dropped_audio_bytes"] = dropped_audio_bytes
+    stats["stt_router"] = stt_router.stats()
+    stats["payment_jobs"] = payment_queue.stats()
+    stats["sarvam"] = sarvam.stats()
+    stats["call_records"] = call_record_writer.stats()
+    return stats
+
+@app.get("/metrics/memory")
+async def memory_metrics():
+    """
+    Memory accounting for active calls: session bytes per call and process RSS.
+    """
+    return memory_report()
+
+@app.get("/metrics/hot_paths")
+async def hot_path_metrics():
+    """
+    Always-on counters (frames ingested, bytes decoded, turns processed) and
+    cumulative time spent in the audio-conversion and tool-call paths.
+    """
+    return profiling.snapshot()
+
+@app.get("/metrics/llm_cache")
+async def llm_cache_metrics():
+    """
+    Hit rate of the first-pass LLM cache and the LLM time saved by hits.
+    """
+    return first_pass_cache.stats()
+
+@app.get("/admin/profile")
+async def profile_process(request: Request, seconds: float = 10.0, interval_ms: float = 5.0):
+    """
+    Samples every thread's Python stack for `seconds` and returns collapsed
+    stacks, ready for flamegraph.pl or speedscope:
+        curl -H "x-admin-token: $ADMIN_TOKEN" "http://host/admin/profile?seconds=30" > out.folded
+    """
+    # Constant-time comparison, so response timing does not leak the token.
+    supplied = request.headers.get("x-admin-token", "")
+    if not ADMIN_TOKEN or not hmac.compare_digest(supplied.encode("utf-8"), ADMIN_TOKEN.encode("utf-8")):
+        raise HTTPException(status_code=403, detail="Forbidden")
+    seconds = min(max(seconds, 0.1), 120.0)
+    interval = min(max(interval_ms, 1.0), 1000.0) / 1000
+    try:
+        # The sampler runs in its own thread so the event loop keeps serving calls
+        # (and shows up in the profile doing so).
+        collapsed = await asyncio.to_thread(profiling.sample_stacks, seconds, interval)
+    except profiling.ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return PlainTextResponse(collapsed)
+
 # --- Audio Conversion Utilities ---
 
+@profiling.timed()
 def convert_mulaw_to_wav_bytes(mulaw_bytes: bytes) -> bytes:
     """
     Packages raw mulaw bytes from Twilio into a WAV file container.
@@ -225,35 +504,16 @@ def convert_mulaw_to_wav_bytes(mulaw_bytes: bytes) -> bytes:
         logger.error(f"Failed to convert mulaw to wav: {e}", exc_info=True)
         return None
 
+@profiling.timed()
 def convert_wav_to_mulaw_bytes(wav_bytes: bytes) -> bytes:
     """
-    Converts a standard 16-bit PCM WAV file into raw, headerless 8kHz µ-law
-    bytes suitable for the Twilio media stream, using the standard audioop library.
+    Converts a PCM WAV file of any sample rate, sample width and channel count
+    into raw, headerless 8kHz µ-law bytes suitable for the Twilio media stream.
+    Resampling and downmixing are handled by the audio_format stage.
     """
     try:
-        # 1. Read the raw PCM audio frames from the WAV file bytes
-        with wave.open(io.BytesIO(wav_bytes), 'rb') as wf:
-            # Ensure audio is 16-bit mono PCM, which is what lin2ulaw expects.
-            if wf.getsampwidth() != 2 or wf.getnchannels() != 1:
-                logger.error(
-                    f"Unsupported WAV format: "
-                    f"Sample width {wf.getsampwidth()}, channels {wf.getnchannels()}. "
-                    f"Expected 16-bit mono."
-                )
-                return None
-            
-            # The TTS service should already provide 8kHz, but we log a warning if not.
-            if wf.getframerate() != 8000:
-                logger.warning(f"WAV sample rate is {wf.getframerate()}, not 8000Hz.")
-
-            pcm_frames = wf.readframes(wf.getnframes())
-
-        # 2. Convert the 16-bit linear PCM data to 8-bit µ-law.
-        # The '2' indicates the sample width of the input data is 2 bytes (16-bit).
-        mulaw_bytes = audioop.lin2ulaw(pcm_frames, 2)
-        
-        return mulaw_bytes
-
+        sink_format = SINK_FORMATS["twilio"]
+        return convert_audio(wav_bytes, sink_format["sample_rate"], sink_format["codec"])
     except Exception as e:
         logger.error(f"Failed to convert wav to mulaw: {e}", exc_info=True)
         return None
@@ -300,6 +560,18 @@ TOOLS = [
         "parameters": [
             {"name": "recipient_name", "type": "string", "description": "The name of the person to pay."}
         ]
+    },
+    {
+        "name": "get_payment_status",
+        "description": "Checks whether the payment links requested earlier in this conversation have been created. Use this when the user asks if a payment went through or whether their payment link is ready.",
+        "parameters": [
+            {"name": "job_id", "type": "string", "description": "Optional. The job ID of a specific payment; omit to check all recent payments."}
+        ]
+    },
+    {
+        "name": "settle_up_everyone",
+        "description": "Pays everyone the user owes money to at once, creating a payment link for each person with an outstanding balance. Use this when the user wants to settle up with everyone or clear all their debts.",
+        "parameters": []
     }
 ]
 
@@ -320,9 +592,225 @@ def _get_current_user_identity() -> dict:
         logger.error(f"Failed to fetch current user identity: {e}")
         return {}
 
-def call_tool(tool_name: str, parameters: dict):
+@profiling.timed()
+def _create_payment_link(recipient_email: str, recipient_name: str, amount: float, link_id: str = None) -> dict:
     """
-    Executes the appropriate API call based on the tool name provided by the LLM.
+    Creates a payment link for the given amount (in rupees) through the tools API.
+    A `link_id` makes the request idempotent: it is sent as the link's id and
+    as the idempotency key, so repeating the request cannot create a second link.
+    Raises requests.exceptions.RequestException if the request fails.
+    """
+    payment_payload = {
+        "customer_email": recipient_email,
+        "link_amount": int(amount * 100),
+        "customer_name": recipient_name
+    }
+    if link_id:
+        payment_payload["link_id"] = link_id
+    
+    logger.debug(f"Preparing to call payment API with exact payload: {payment_payload}")
+    
+    payment_url = f"{TOOLS_API_BASE_URL}/tools/createPaymentLink"
+    payment_headers = {
+        'Content-Type': 'application/json',
+        'x-api-version': '2023-08-01',
+        'x-client-id': CASHFREE_CLIENT_ID,
+        'x-client-secret': CASHFREE_CLIENT_SECRET
+    }
+    if link_id:
+        payment_headers['x-idempotency-key'] = link_id
+
+    payment_response = requests.post(payment_url, headers=payment_headers, json=payment_payload, timeout=15)
+    payment_response.raise_for_status()
+    payment_data = payment_response.json()
+    logger.info(f"Payment link API call successful for {recipient_name}.")
+    return payment_data
+
+def _run_payment_link_job(payload: dict) -> dict:
+    """
+    Background handler for "payment_link" jobs. Timeouts, connection errors,
+    429s and 5xx responses are retried; other 4xx responses fail the job.
+    Every attempt sends the job's link id, so a retry (or a re-run after a
+    crash) after the link was in fact created cannot create a second one.
+    """
+    link_id = payload.get("link_id")
+    try:
+        payment_data = _create_payment_link(payload["email"], payload["recipient"], payload["amount"], link_id=link_id)
+    except requests.exceptions.HTTPError as e:
+        status = e.response.status_code if e.response is not None else None
+        if status == 409 and link_id:
+            # An earlier attempt already created this link.
+            logger.info(f"Payment link {link_id} already exists; treating the job as done.")
+            return {"recipient": payload["recipient"], "amount": payload["amount"], "status": "created", "link_url": None}
+        if status == 429 or status is None or status >= 500:
+            raise RetryableJobError(f"Payment service returned {status}") from e
+        raise
+    except requests.exceptions.RequestException as e:
+        raise RetryableJobError(str(e)) from e
+    data = payment_data.get("data", payment_data)
+    return {
+        "recipient": payload["recipient"],
+        "amount": payload["amount"],
+        "status": data.get("link_status", "created"),
+        "link_url": data.get("link_url"),
+    }
+
+payment_queue = JobQueue(
+    PAYMENT_JOBS_DB,
+    handlers={"payment_link": _run_payment_link_job},
+    workers=PAYMENT_JOB_WORKERS,
+    max_attempts=PAYMENT_JOB_MAX_ATTEMPTS,
+)
+
+def _enqueue_payment_link(recipient_email: str, recipient_name: str, amount: float, owner: str = None) -> dict:
+    # The job id doubles as the payment link id, making every attempt idempotent.
+    job_id = payment_queue.new_job_id()
+    payment_queue.enqueue(
+        "payment_link",
+        {"email": recipient_email, "recipient": recipient_name, "amount": amount, "link_id": job_id},
+        owner=owner,
+        job_id=job_id,
+    )
+    return {"job_id": job_id, "recipient": recipient_name, "amount": amount, "status": "queued"}
+
+def describe_payment_job(job: dict) -> dict:
+    """Summarizes a payment job for the LLM; the link URL is left out."""
+    summary = {
+        "job_id": job["id"],
+        "recipient": job["payload"].get("recipient"),
+        "amount": job["payload"].get("amount"),
+        "status": job["status"],
+    }
+    if job["status"] == "failed":
+        summary["error"] = "The payment service could not create the link."
+    elif job["status"] == "queued" and job["attempts"]:
+        summary["retrying"] = True
+    return summary
+
+def calculate_net_balances(expenses: list, current_user_name: str) -> dict:
+    """
+    Nets every unsettled expense involving the current user into one balance per
+    counterparty, in a single pass. Positive means the user owes them.
+    Returns {name: {"amount": float, "email": str or None}}.
+    """
+    current_user_name_words = set(current_user_name.lower().split())
+    balances = {}
+    for expense in expenses:
+        if expense.get('settled'):
+            continue
+        from_user = expense.get('from', '')
+        to_user = expense.get('to', '')
+        amount = float(expense.get('amount', 0.0))
+
+        if current_user_name_words.issubset(set(from_user.lower().split())):
+            # I (current user) owe them money.
+            entry = balances.setdefault(to_user, {"amount": 0.0, "email": None})
+            entry["amount"] += amount
+            entry["email"] = entry["email"] or expense.get('to_email')
+        elif current_user_name_words.issubset(set(to_user.lower().split())):
+            # They owe me money.
+            entry = balances.setdefault(from_user, {"amount": 0.0, "email": None})
+            entry["amount"] -= amount
+            entry["email"] = entry["email"] or expense.get('from_email')
+    return balances
+
+def _settle_up_everyone(owner: str = None) -> dict:
+    """
+    Creates payment links for everyone the user owes, concurrently, and reports
+    every outcome in one result so the reply can be a single spoken summary.
+    With ASYNC_PAYMENT_LINKS, one background job is queued per person instead.
+    """
+    logger.info("--- Starting Settle-Up-Everyone Flow ---")
+    current_user = _get_current_user_identity()
+    if not current_user:
+        return {"error": "I couldn't identify who you are, so I can't make any payments."}
+    current_user_name = f"{current_user.get('first_name', '')} {current_user.get('last_name', '') or ''}".strip()
+
+    try:
+        store = get_expense_store(TOOLS_API_BASE_URL, SPLITWISE_API_KEY)
+        store.sync_fully()
+        balances = calculate_net_balances(store.outstanding(), current_user_name)
+    except requests.exceptions.RequestException as e:
+        logger.error(f"Internal call to getExpenses failed: {e}")
+        return {"error": "I couldn't retrieve the list of expenses to work out who you owe."}
+
+    creditors = {name: entry for name, entry in balances.items() if round(entry["amount"], 2) > 0}
+    owed_to_you = [
+        {"name": name, "amount": round(-entry["amount"], 2)}
+        for name, entry in balances.items() if round(entry["amount"], 2) < 0
+    ]
+    if not creditors:
+        return {"paid": [], "failed": [], "owed_to_you": owed_to_you, "message": "You don't owe anyone right now."}
+
+    if ASYNC_PAYMENT_LINKS:
+        queued, failed = [], []
+        for name, entry in creditors.items():
+            amount = round(entry["amount"], 2)
+            if not entry["email"]:
+                failed.append({"recipient": name, "amount": amount, "error": "No email address on file."})
+                continue
+            queued.append(_enqueue_payment_link(entry["email"], name, amount, owner=owner))
+        logger.info(f"Settle-up queued {len(queued)} payment links, {len(failed)} could not be queued.")
+        return {
+            "queued": queued,
+            "failed": failed,
+            "total_queued": round(sum(job["amount"] for job in queued), 2),
+            "owed_to_you": owed_to_you,
+        }
+
+    def settle(name, entry):
+        amount = round(entry["amount"], 2)
+        if not entry["email"]:
+            return {"recipient": name, "amount": amount, "error": "No email address on file."}
+        try:
+            payment_data = _create_payment_link(entry["email"], name, amount)
+            data = payment_data.get("data", payment_data)
+            return {"recipient": name, "amount": amount, "status": data.get("link_status", "created")}
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Payment link creation for {name} failed: {e}")
+            return {"recipient": name, "amount": amount, "error": "The payment service request failed."}
+
+    with ThreadPoolExecutor(max_workers=SETTLE_UP_CONCURRENCY) as executor:
+        outcomes = list(executor.map(lambda item: settle(*item), creditors.items()))
+
+    paid = [outcome for outcome in outcomes if "error" not in outcome]
+    failed = [outcome for outcome in outcomes if "error" in outcome]
+    logger.info(f"Settle-up finished: {len(paid)} payment links created, {len(failed)} failed.")
+    return {
+        "paid": paid,
+        "failed": failed,
+        "total_paid": round(sum(outcome["amount"] for outcome in paid), 2),
+        "owed_to_you": owed_to_you,
+    }
+
+@profiling.timed()
+def call_tool(tool_name: str, parameters: dict, tenant: str = None, owner: str = None,
+              turn_record: TurnRecord = None):
+    """
+    Executes the appropriate API call based on the tool name provided by the LLM,
+    within the tool-call concurrency limit. `owner` identifies the conversation
+    (the Twilio stream SID) that background payment jobs report back to.
+    A rejected or failed tool call is noted on `turn_record`.
+    """
+    try:
+        with admission.blocking_slot("tool", tenant):
+            result = _execute_tool(tool_name, parameters, owner)
+    except AdmissionRejected as e:
+        logger.warning(f"Tool call '{tool_name}' rejected: {e}")
+        if turn_record:
+            turn_record.outcome = "tool_busy"
+        return json.dumps({"error": "The service is very busy right now. Please try again in a moment."})
+    if turn_record and '"error"' in result:
+        try:
+            if "error" in json.loads(result):
+                turn_record.outcome = "tool_error"
+        except (json.JSONDecodeError, TypeError):
+            pass
+    return result
+
+def _execute_tool(tool_name: str, parameters: dict, owner: str = None):
+    """
+    Runs a single tool call against the tools API.
     """
     if tool_name == "get_current_user":
         logger.info("Executing tool: get_current_user")
@@ -332,26 +820,27 @@ def call_tool(tool_name: str, parameters: dict):
         
         # We wrap it in the same structure as other tools for consistency
         user_data = {"success": True, "data": {"result": {"user": user_identity}}}
-        logger.info(f"Tool 'get_current_user' returned: {user_data}")
+        logger.debug(f"Tool 'get_current_user' returned: {user_data}")
         return json.dumps(user_data)
     
     elif tool_name == "get_expenses":
         logger.info("Executing tool: get_expenses")
-        url = f"{TOOLS_API_BASE_URL}/tools/getExpenses"
-        headers = {
-            'x-splitwise-key': f'{SPLITWISE_API_KEY}',
-            'Content-Type': 'application/json'
-        }
         try:
-            response = requests.post(url, headers=headers, data='{}')
-            response.raise_for_status()
-            expenses_data = response.json()
-            logger.info(f"Tool 'get_expenses' returned: {expenses_data}")
-            logger.info(f"Tool 'get_expenses' returned successfully with {len(expenses_data.get('data', {}).get('result', {}).get('expenses', []))} expenses.")
+            # Only expenses added or changed since the last sync cross the wire;
+            # the rest come from the user's local copy.
+            store = get_expense_store(TOOLS_API_BASE_URL, SPLITWISE_API_KEY)
+            store.sync_fully()
+            recent_expenses = store.recent(limit=15)
+            outstanding = store.outstanding()
+            logger.info(f"Tool 'get_expenses' returned successfully with {len(recent_expenses)} expenses.")
             
-            # Pre-process the data before sending to the LLM
-            expenses_list = expenses_data.get('data', {}).get('result', {}).get('expenses', [])
-            summarized_data = summarize_expenses(expenses_list)
+            # Pre-process the data before sending to the LLM. The recent rows are a
+            # window; the owes totals are netted over everything still unsettled.
+            summarized_data = {
+                "expenses": summarize_expenses(recent_expenses),
+                "owes": net_owes(outstanding),
+                "unsettled_count": len(outstanding),
+            }
             
             # We return the summarized JSON string to the LLM.
             return json.dumps(summarized_data)
@@ -373,46 +862,29 @@ def call_tool(tool_name: str, parameters: dict):
         logger.info(f"Step 1: Identity confirmed as '{current_user_name}'.")
 
         # Step 2: Get all expenses for context.
-        logger.info("Step 2: Fetching all expenses to calculate net balance.")
-        expenses_url = f"{TOOLS_API_BASE_URL}/tools/getExpenses"
-        expenses_headers = {'x-splitwise-key': f'{SPLITWISE_API_KEY}', 'Content-Type': 'application/json'}
+        logger.info("Step 2: Syncing expenses to calculate net balance.")
         try:
-            expenses_response = requests.post(expenses_url, headers=expenses_headers, data='{}')
-            expenses_response.raise_for_status()
-            all_expenses = expenses_response.json().get('data', {}).get('result', {}).get('expenses', [])
-            logger.info(f"Successfully fetched {len(all_expenses)} expense records.")
+            store = get_expense_store(TOOLS_API_BASE_URL, SPLITWISE_API_KEY)
+            store.sync_fully()
+            all_expenses = store.outstanding()
+            logger.info(f"Using {len(all_expenses)} outstanding expense records.")
         except requests.exceptions.RequestException as e:
             logger.error(f"Internal call to getExpenses failed: {e}")
             return json.dumps({"error": "I couldn't retrieve the list of expenses to find the payment details."})
 
         # Step 3: Calculate the net balance between the current user and the recipient.
         logger.info(f"Step 3: Calculating net balance between '{current_user_name}' and '{recipient_name_query}'.")
-        net_balance = 0.0
-        recipient_email = None
-        recipient_full_name = None
-
-        current_user_name_words = set(current_user_name.lower().split())
         recipient_query_words = set(recipient_name_query.lower().split())
-
-        for expense in all_expenses:
-            if expense.get('settled'):
-                continue
-
-            from_user_words = set(expense.get('from', '').lower().split())
-            to_user_words = set(expense.get('to', '').lower().split())
-            amount = float(expense.get('amount', 0.0))
-
-            # Case 1: I (current user) owe them money.
-            if current_user_name_words.issubset(from_user_words) and recipient_query_words.issubset(to_user_words):
-                net_balance += amount
-                if not recipient_email:
-                    recipient_email = expense.get('to_email')
-                    recipient_full_name = expense.get('to')
-
-            # Case 2: They owe me money.
-            elif recipient_query_words.issubset(from_user_words) and current_user_name_words.issubset(to_user_words):
-                net_balance -= amount
-        
+        matches = {
+            name: entry for name, entry in calculate_net_balances(all_expenses, current_user_name).items()
+            if recipient_query_words.issubset(set(name.lower().split()))
+        }
+        if len(matches) > 1:
+            names = ", ".join(sorted(matches))
+            return json.dumps({"error": f"More than one person matches {recipient_name_query}: {names}. Who do you want to pay?"})
+        recipient_full_name, entry = next(iter(matches.items()), (None, {"amount": 0.0, "email": None}))
+        net_balance = round(entry["amount"], 2)
+        recipient_email = entry["email"]
         logger.info(f"Final calculated net balance is: {net_balance:.2f}")
 
         # Step 4: Act based on the calculated net balance.
@@ -427,38 +899,45 @@ def call_tool(tool_name: str, parameters: dict):
         if not recipient_email:
             return json.dumps({"error": f"I calculated that you owe {net_balance:.2f}, but I couldn't find an email for {recipient_name_query} to send the payment."})
 
-        # Step 5: If a payment is needed, call the payment API with the exact payload.
-        payment_payload = {
-            "customer_email": recipient_email,
-            "link_amount": int(net_balance * 100),
-            "customer_name": recipient_full_name or recipient_name_query
-        }
-        
-        logger.info(f"Step 4: Preparing to call payment API with exact payload: {payment_payload}")
-        
-        payment_url = f"{TOOLS_API_BASE_URL}/tools/createPaymentLink"
-        payment_headers = {
-            'Content-Type': 'application/json',
-            'x-api-version': '2023-08-01',
-            'x-client-id': CASHFREE_CLIENT_ID,
-            'x-client-secret': CASHFREE_CLIENT_SECRET
-        }
-
+        # Step 5: If a payment is needed, call the payment API with the exact payload,
+        # or hand it to the background workers and answer right away.
+        if ASYNC_PAYMENT_LINKS:
+            return json.dumps(_enqueue_payment_link(recipient_email, recipient_full_name or recipient_name_query, round(net_balance, 2), owner=owner))
         try:
-            payment_response = requests.post(payment_url, headers=payment_headers, json=payment_payload)
-            payment_response.raise_for_status()
-            payment_data = payment_response.json()
-            logger.info(f"Payment link API call successful: {payment_data}")
+            payment_data = _create_payment_link(recipient_email, recipient_full_name or recipient_name_query, net_balance)
             return json.dumps(payment_data)
         except requests.exceptions.RequestException as e:
             logger.error(f"Payment link creation failed: {e}")
             return json.dumps({"error": "I tried to create the payment link, but the request to the payment service failed."})
+
+    elif tool_name == "settle_up_everyone":
+        return json.dumps(_settle_up_everyone(owner))
+
+    elif tool_name == "get_payment_status":
+        job_id = parameters.get("job_id")
+        if job_id:
+            job = payment_queue.get(job_id)
+            if not job or job["owner"] != owner:
+                return json.dumps({"error": "I couldn't find that payment."})
+            jobs = [job]
+        else:
+            jobs = payment_queue.recent_for_owner(owner)
+        if not jobs:
+            return json.dumps({"error": "You haven't asked me to make any payments on this call."})
+        return json.dumps({"payments": [describe_payment_job(job) for job in jobs]})
     else:
         logger.warning(f"LLM tried to call an unknown tool: {tool_name}")
         return json.dumps({"error": "Unknown tool."})
 
 # --- SarvamAI Speech-to-Text Function (adapted from your script) ---
 def transcribe_audio(audio_bytes: bytes):
+    """
+    Transcribe audio with whichever engine the STT router picks: SarvamAI, or
+    the local CPU engine when SarvamAI is down, slow, or the utterance is short.
+    """
+    return stt_router.transcribe(audio_bytes)
+
+def transcribe_with_sarvam(audio_bytes: bytes):
     """
     Transcribe audio using SarvamAI's speech translation API.
     Note: Twilio sends audio in mulaw format. SarvamAI might need a different
@@ -488,36 +967,129 @@ def transcribe_audio(audio_bytes: bytes):
         # We now have a WAV file, so we name it accordingly.
         audio_file_like.name = "audio.wav" 
 
-        # IMPORTANT: This is the speech-to-text model.
-        response = sarvam_client.speech_to_text.translate(
-            file=audio_file_like,
-            model="saaras:v2.5" 
-        )
-        logger.info(f"Received transcription: {response}")
+        def translate():
+            # Rewind so a retry after a 429 uploads the whole file again.
+            audio_file_like.seek(0)
+            # IMPORTANT: This is the speech-to-text model.
+            return sarvam_client.speech_to_text.translate(
+                file=audio_file_like,
+                model="saaras:v2.5" 
+            )
+
+        response = sarvam.run("stt", "saaras:v2.5", translate)
+        logger.debug(f"Received transcription: {response}")
         return response
-            
+
+    except DeadlineExceeded:
+        # Never sent, so the STT router must not count it against SarvamAI.
+        raise
     except Exception as e:
         logger.error(f"Transcription failed: {e}")
         return None
 
+stt_router = STTRouter(
+    remote=RemoteSTTEngine(transcribe_with_sarvam, is_available=lambda: sarvam_client is not None),
+    local=LocalSTTEngine(LOCAL_STT_MODEL, LOCAL_STT_COMPUTE_TYPE, LOCAL_STT_WORKERS),
+    latency_slo=STT_LATENCY_SLO_SECONDS,
+    short_utterance_seconds=LOCAL_STT_SHORT_UTTERANCE_SECONDS,
+    breaker=CircuitBreaker(STT_BREAKER_FAILURES, STT_BREAKER_RESET_SECONDS),
+)
+
 # --- SarvamAI Language Model (LLM) Function ---
-def get_llm_response(text: str, language_code: str = "en-IN"):
+BUSY_RESPONSE_TEXT = "I'm handling a lot of calls right now. Please give me a moment and try again."
+
+def build_final_response_messages(text: str, tool_name: str, tool_result: str, language_code: str = "en-IN",
+                                  payment_updates: str = None) -> list:
     """
-    Manages the interaction with the LLM, including tool-calling logic.
+    Builds the second-pass prompt that turns a tool result into a spoken answer.
     """
-    if not sarvam_client:
-        logger.error("SarvamAI client not available.")
-        return "The AI model is currently unavailable. Please try again later."
+    system_prompt_for_final_response = f"""You are a professional financial assistant providing clear, actionable responses. Transform tool results into natural, conversational answers.
 
-    # 1. First Pass: Tool Selection
-    # The system prompt now instructs the LLM on how to use tools.
-    system_prompt_for_tool_selection = f"""
+LANGUAGE: Respond in {language_code}. Translate any English data to {language_code}.
+
+RESPONSE STYLE:
+- Concise but complete (1-2 sentences max)
+- Friendly and professional tone
+- Direct and actionable
+- No technical jargon or JSON terminology
+
+FORMATTING REQUIREMENTS:
+- Single paragraph, plain text only
+- NO markdown, bullets, stars, or special formatting
+- NO URLs or links in the response text
+- Numbers should be clearly stated with currency when relevant
+
+CONTENT GUIDELINES:
+
+For EXPENSES queries:
+- Focus on amounts the user owes or is owed
+- Clearly identify who owes whom
+- Provide specific amounts and currency
+- If multiple transactions exist, give totals or key highlights
+- The "owes" totals are already netted per pair of people; prefer them over individual rows
+- Example: "You owe John 250 rupees from the dinner bill last week"
+
+For USER IDENTITY queries:
+- Provide name and key details naturally
+- Example: "Your account is registered under John Smith with email john@email.com"
+
+For SETTLE-UP-EVERYONE requests:
+- Summarize in one sentence: how many people were paid and the total, then name anyone whose payment failed
+- If the payments are "queued", say you're creating the links now and will let them know when they're ready
+- Example: "I've created payment links for Priya and Rahul totalling 1,200 rupees, but the link for Neha failed"
+
+For PAYMENT requests:
+- If successful: Confirm payment initiation and next steps
+- If error: Explain the issue clearly and suggest solutions
+- For payment links: Say "I've created a payment link" but don't include the actual URL
+- If the status is "queued": Say you're creating the payment link now and will confirm when it's ready
+- For payment status checks: Say which links are ready, still being created, or failed
+- Example: "I've set up a payment of 250 rupees to John. You'll receive the payment link shortly"
+
+ERROR HANDLING:
+- Convert technical errors to user-friendly explanations
+- Provide clear next steps when possible
+- Stay supportive and helpful
+"""
+
+    messages = [
+        {"role": "system", "content": system_prompt_for_final_response},
+        {"role": "user", "content": f"My original question was: '{text}'"},
+        {"role": "assistant", "content": f"I have run the tool '{tool_name}' and the result is: {tool_result}"},
+        {"role": "user", "content": "Now, please give me the final answer based on this information."}
+    ]
+    if payment_updates:
+        messages[-1]["content"] += f" Also briefly tell me about these earlier payments that have since finished: {payment_updates}"
+    return messages
+
+def collect_payment_updates(owner: str):
+    """
+    Returns the payment jobs of this conversation that finished since the last
+    turn as (compact JSON for the prompt, job ids), or (None, []). The caller
+    marks the jobs notified once a reply mentioning them has been produced,
+    so each job is reported once.
+    """
+    if not owner:
+        return None, []
+    finished = payment_queue.unnotified_finished(owner)
+    if not finished:
+        return None, []
+    updates = json.dumps([describe_payment_job(job) for job in finished], separators=(",", ":"))
+    return updates, [job["id"] for job in finished]
+
+def build_tool_selection_prompt(language_code: str, payment_updates_prompt: str = "") -> str:
+    """
+    Builds the first-pass system prompt that asks the LLM to pick a tool or reply.
+    """
+    return f"""
 You are a smart financial assistant with access to expense tracking and payment tools. Analyze user queries carefully to determine if they require tool usage.
 
 TOOL USAGE CRITERIA:
 - User asks about expenses, bills, spending, or financial transactions → use "get_expenses"
 - User asks about their identity, name, or account details → use "get_current_user"  
 - User wants to pay someone, settle a debt, or send money → use "initiate_payment"
+- User wants to settle up with everyone or pay all their debts at once → use "settle_up_everyone"
+- User asks whether a payment went through or a payment link is ready → use "get_payment_status"
 
 CONVERSATIONAL QUERIES (no tool needed):
 - Greetings, thanks, small talk
@@ -537,22 +1109,67 @@ Available tools:
 {json.dumps(TOOLS, indent=2)}
 
 CRITICAL: For payment requests, extract the person's name accurately from the user's speech. Common variations like "John" vs "Jon" or "Mike" vs "Michael" should be handled consistently.
+{payment_updates_prompt}"""
+
+# Cached first-pass outputs are only valid for the tools and prompt they were made with.
+TOOL_SCHEMA_VERSION = schema_version(json.dumps(TOOLS, sort_keys=True), build_tool_selection_prompt("{language_code}"))
+first_pass_cache = ResponseCache(LLM_CACHE_MAX_ENTRIES, LLM_CACHE_TTL_SECONDS)
+
+def get_llm_response(text: str, language_code: str = "en-IN", tenant: str = None, owner: str = None,
+                     turn_record: TurnRecord = None):
+    """
+    Manages the interaction with the LLM, including tool-calling logic.
+    Payment links that finished in the background since the last turn are
+    mentioned in this reply. The chosen tool is noted on `turn_record`, and so is
+    a failure (llm_error, llm_dropped) that this reply apologises for.
+    """
+    if not sarvam_client:
+        logger.error("SarvamAI client not available.")
+        if turn_record:
+            turn_record.outcome = "llm_error"
+        return "The AI model is currently unavailable. Please try again later."
+
+    payment_updates, payment_job_ids = collect_payment_updates(owner)
+    payment_updates_prompt = ""
+    if payment_updates:
+        payment_updates_prompt = f"""
+PAYMENT UPDATES: These payments requested earlier have finished since the user last spoke: {payment_updates}
+If you respond conversationally, briefly tell the user about them (never read out job IDs or links).
 """
+
+    # 1. First Pass: Tool Selection
+    # The system prompt now instructs the LLM on how to use tools.
+    system_prompt_for_tool_selection = build_tool_selection_prompt(language_code, payment_updates_prompt)
     
     messages = [
         {"role": "system", "content": system_prompt_for_tool_selection},
         {"role": "user", "content": text}
     ]
     
-    logger.info(f"Sending to LLM for tool selection: {text}")
+    # The first pass runs at temperature 0 and sees only the utterance, so its
+    # output (tool call or reply) is reused across callers. Turns that carry
+    # payment updates have a per-call prompt and always go to the LLM.
+    cache_key = None
+    llm_output = None
+    if not payment_updates:
+        cache_key = first_pass_cache.key(text, language_code, TOOL_SCHEMA_VERSION)
+        llm_output = first_pass_cache.get(cache_key)
+
     try:
-        response = sarvam_client.chat.completions(
-            messages=messages,
-            max_tokens=550, # Increased tokens to allow for JSON response
-            temperature=0.0, # Low temperature for reliable JSON output
-        )
-        llm_output = response.choices[0].message.content
-        logger.info(f"Received from LLM (initial pass): {llm_output}")
+        if llm_output is not None:
+            logger.info(f"First pass served from cache: {llm_output}")
+        else:
+            logger.info(f"Sending to LLM for tool selection: {text}")
+            started = time.monotonic()
+            response = sarvam.run("chat", "default", lambda: sarvam_client.chat.completions(
+                messages=messages,
+                max_tokens=550, # Increased tokens to allow for JSON response
+                temperature=0.0, # Low temperature for reliable JSON output
+            ))
+            llm_output = response.choices[0].message.content
+            logger.info(f"Received from LLM (initial pass): {llm_output}")
+            if cache_key and llm_output:
+                first_pass_cache.put(cache_key, llm_output, time.monotonic() - started)
 
         # 2. Check if the LLM wants to call a tool
         try:
@@ -560,80 +1177,51 @@ CRITICAL: For payment requests, extract the person's name accurately from the us
             tool_name = tool_call_request.get("tool_name")
             
             if tool_name:
+                if turn_record:
+                    turn_record.tool = tool_name
                 # 3. Execute the tool
-                tool_result = call_tool(tool_name, tool_call_request.get("parameters", {}))
+                tool_result = call_tool(tool_name, tool_call_request.get("parameters", {}), tenant=tenant, owner=owner,
+                                        turn_record=turn_record)
                 
                 # 4. Second Pass: Generate Final Response
-                # Now we send the tool's result back to the LLM to generate a human-friendly response.
-                system_prompt_for_final_response = f"""You are a professional financial assistant providing clear, actionable responses. Transform tool results into natural, conversational answers.
-
-LANGUAGE: Respond in {language_code}. Translate any English data to {language_code}.
-
-RESPONSE STYLE:
-- Concise but complete (1-2 sentences max)
-- Friendly and professional tone
-- Direct and actionable
-- No technical jargon or JSON terminology
-
-FORMATTING REQUIREMENTS:
-- Single paragraph, plain text only
-- NO markdown, bullets, stars, or special formatting
-- NO URLs or links in the response text
-- Numbers should be clearly stated with currency when relevant
-
-CONTENT GUIDELINES:
-
-For EXPENSES queries:
-- Focus on amounts the user owes or is owed
-- Clearly identify who owes whom
-- Provide specific amounts and currency
-- If multiple transactions exist, give totals or key highlights
-- Example: "You owe John 250 rupees from the dinner bill last week"
-
-For USER IDENTITY queries:
-- Provide name and key details naturally
-- Example: "Your account is registered under John Smith with email john@email.com"
-
-For PAYMENT requests:
-- If successful: Confirm payment initiation and next steps
-- If error: Explain the issue clearly and suggest solutions
-- For payment links: Say "I've created a payment link" but don't include the actual URL
-- Example: "I've set up a payment of 250 rupees to John. You'll receive the payment link shortly"
-
-ERROR HANDLING:
-- Convert technical errors to user-friendly explanations
-- Provide clear next steps when possible
-- Stay supportive and helpful
-"""
-                
-                final_messages = [
-                    {"role": "system", "content": system_prompt_for_final_response},
-                    {"role": "user", "content": f"My original question was: '{text}'"},
-                    {"role": "assistant", "content": f"I have run the tool '{tool_name}' and the result is: {tool_result}"},
-                    {"role": "user", "content": "Now, please give me the final answer based on this information."}
-                ]
+                # Now we send the tool's result, shaped into a compact summary, back
+                # to the LLM to generate a human-friendly response.
+                final_messages = build_final_response_messages(
+                    text, tool_name, shape_tool_result(tool_name, tool_result), language_code, payment_updates
+                )
                 
                 logger.info(f"Sending tool result to LLM for final response generation.")
-                final_response = sarvam_client.chat.completions(
+                final_response = sarvam.run("chat", "default", lambda: sarvam_client.chat.completions(
                     messages=final_messages,
                     max_tokens=300, # Increased from 100 to allow for a full, detailed response
                     temperature=0.7,
-                )
-                logger.info(f"Final response: {final_response}")
+                ))
+                logger.debug(f"Final response: {final_response}")
                 final_content = final_response.choices[0].message.content
                 logger.info(f"Received from LLM (final response): {final_content}")
-                return final_content
+                reply = final_content
             else:
                 # If it's valid JSON but not a tool call, treat as conversational
-                return llm_output
+                reply = llm_output
 
         except (json.JSONDecodeError, AttributeError):
             # If the output is not a JSON object, it's a direct conversational response.
             logger.info("LLM response is conversational, not a tool call.")
-            return llm_output
+            reply = llm_output
+
+        # The finished payments are only reported once a reply mentioning them exists.
+        payment_queue.mark_notified(payment_job_ids)
+        return reply
 
+    except DeadlineExceeded as e:
+        logger.warning(f"LLM request dropped: {e}")
+        if turn_record:
+            turn_record.outcome = "llm_dropped"
+        return BUSY_RESPONSE_TEXT
     except Exception as e:
         logger.error(f"LLM request failed: {e}", exc_info=True)
+        if turn_record:
+            turn_record.outcome = "llm_error"
         return "I'm sorry, I had trouble processing your request."
 
 # --- SarvamAI Text-to-Speech (TTS) Function ---
@@ -648,13 +1236,13 @@ def convert_text_to_speech(text: str, language_code: str = "en-IN"):
     
     logger.info(f"Sending to TTS: '{text}' in language: {language_code}")
     try:
-        response = sarvam_client.text_to_speech.convert(
+        response = sarvam.run("tts", "bulbul:v2", lambda: sarvam_client.text_to_speech.convert(
             text=text,
             target_language_code=language_code,
             speaker="anushka",
             model="bulbul:v2",
-            speech_sample_rate=8000
-        )
+            speech_sample_rate=TTS_SAMPLE_RATE
+        ))
         
         audio_chunks_base64 = response.audios
         if not audio_chunks_base64:
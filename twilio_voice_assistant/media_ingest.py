@@ -0,0 +1,101 @@
+import json
+import logging
+from binascii import Error as Base64Error, a2b_base64
+from collections import Counter
+
+import profiling
+
+logger = logging.getLogger(__name__)
+
+# Twilio serializes every media message with "event" as the first key:
+#   {"event":"media","sequenceNumber":"4","media":{"track":"inbound","chunk":"3",
+#    "timestamp":"60","payload":"<base64 µ-law>"},"streamSid":"MZ..."}
+_MEDIA_PREFIX = '{"event":"media"'
+_PAYLOAD_KEY = '"payload":"'
+
+
+def media_payload(raw: str):
+    """
+    Returns the base64 payload of a Twilio media message by scanning the raw
+    text, or None when `raw` is anything else (or is formatted unexpectedly)
+    and should go through the JSON parser instead.
+    """
+    if not raw.startswith(_MEDIA_PREFIX):
+        return None
+    start = raw.find(_PAYLOAD_KEY, len(_MEDIA_PREFIX))
+    if start < 0:
+        return None
+    start += len(_PAYLOAD_KEY)
+    end = raw.find('"', start)
+    if end < 0:
+        return None
+    payload = raw[start:end]
+    # Base64 never needs JSON escapes, but an encoder may still write "/" as "\/".
+    if "\\" in payload:
+        return None
+    return payload
+
+
+def parse_message(raw: str):
+    """
+    Splits a raw websocket message into (event, payload, message):
+      - media on the fast path: ("media", payload, None), no JSON parse,
+      - anything else: (event, None, parsed_message).
+    """
+    payload = media_payload(raw)
+    if payload is not None:
+        return "media", payload, None
+    message = json.loads(raw)
+    return message.get("event"), None, message
+
+
+class MediaIngest:
+    """
+    Per-call media ingest: decodes each frame's base64 payload with the C
+    decoder and copies it straight into the call's preallocated audio ring.
+    Frame and byte counts are kept locally and published to the profiling
+    counters once per turn, not once per frame. Control events other than
+    start/stop (connected, mark, dtmf) are collected and logged together.
+    """
+
+    __slots__ = ("audio", "frames", "bytes", "control_events")
+
+    def __init__(self, audio):
+        self.audio = audio
+        self.frames = 0
+        self.bytes = 0
+        self.control_events = None
+
+    def write(self, payload: str) -> int:
+        """Decodes one media payload into the ring. Returns bytes of older audio overwritten."""
+        try:
+            audio_data = a2b_base64(payload)
+        except Base64Error as e:
+            logger.warning(f"Dropping media frame with invalid base64 payload: {e}")
+            return 0
+        self.frames += 1
+        self.bytes += len(audio_data)
+        return self.audio.write(audio_data)
+
+    def defer(self, event: str):
+        """Records a control event to be reported with the next batch."""
+        if self.control_events is None:
+            self.control_events = Counter()
+        self.control_events[event] += 1
+
+    def flush(self, session) -> int:
+        """
+        Publishes the frames and bytes ingested since the last flush, and logs
+        any deferred control events. Returns the number of bytes flushed.
+        """
+        flushed = self.bytes
+        if self.frames:
+            session.bytes_in += self.bytes
+            profiling.increment("frames_ingested", self.frames)
+            profiling.increment("bytes_decoded", self.bytes)
+            self.frames = 0
+            self.bytes = 0
+        if self.control_events:
+            logger.info(f"Control events for stream {session.stream_sid}: {dict(self.control_events)}")
+            self.control_events = None
+        return flushed
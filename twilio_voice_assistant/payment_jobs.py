@@ -0,0 +1,286 @@
+import json
+import logging
+import os
+import random
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    owner TEXT,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    next_run_at REAL NOT NULL,
+    result TEXT,
+    error TEXT,
+    notified INTEGER NOT NULL DEFAULT 0,
+    lease_owner TEXT,
+    lease_expires_at REAL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_due ON jobs (status, next_run_at);
+CREATE INDEX IF NOT EXISTS jobs_owner ON jobs (owner, created_at);
+"""
+
+# Columns added after the first release; older databases get them on open.
+_LEASE_COLUMNS = {"lease_owner": "TEXT", "lease_expires_at": "REAL"}
+
+
+class RetryableJobError(Exception):
+    """Raised by a handler for failures worth retrying (timeouts, 5xx, 429)."""
+
+
+class JobQueue:
+    """
+    A durable local job queue for side effects (e.g. payment-link creation)
+    that should not block a voice turn. Jobs live in SQLite, so queued work
+    survives a restart. Worker threads claim due jobs, run the handler
+    registered for the job's kind, and retry retryable failures with
+    exponential backoff and jitter.
+
+    Several server processes may share one database, so each claim takes a
+    lease naming the claiming process (host:pid) that runs out after
+    lease_seconds. A running job is only taken back when its lease has run
+    out or its process is gone, never from a live worker. Handlers that may
+    outlive their lease must be idempotent (payment links use the job id).
+    """
+
+    def __init__(self, db_path: str, handlers: dict, workers: int = 2, max_attempts: int = 5,
+                 backoff_base: float = 2.0, backoff_max: float = 60.0, poll_interval: float = 0.5,
+                 lease_seconds: float = 120.0):
+        self.handlers = handlers
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._threads = []
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(_SCHEMA)
+            columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+            for column, column_type in _LEASE_COLUMNS.items():
+                if column not in columns:
+                    self._conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {column_type}")
+        recovered = self.recover_abandoned()
+        if recovered:
+            logger.info(f"Re-queued {recovered} jobs left running by a stopped process.")
+
+    def _lease_abandoned(self, lease_owner: str, lease_expires_at: float, now: float) -> bool:
+        """Whether a running job's lease has run out or belongs to a process on this host that is gone."""
+        if lease_owner is None or lease_expires_at is None or lease_expires_at <= now:
+            return True
+        host, _, pid = lease_owner.rpartition(":")
+        if host != socket.gethostname() or not pid.isdigit():
+            return False
+        if lease_owner == self.worker_id:
+            # Only a previous process with our pid can have left this behind.
+            return not any(thread.is_alive() for thread in self._threads)
+        try:
+            os.kill(int(pid), 0)
+        except ProcessLookupError:
+            return True
+        except OSError:
+            return False
+        return False
+
+    def recover_abandoned(self) -> int:
+        """Re-queues running jobs whose worker is gone or whose lease ran out; returns how many."""
+        now = time.time()
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, lease_owner, lease_expires_at FROM jobs WHERE status = ?", (RUNNING,)
+            ).fetchall()
+            abandoned = [
+                (QUEUED, now, row["id"], RUNNING, row["lease_owner"])
+                for row in rows
+                if self._lease_abandoned(row["lease_owner"], row["lease_expires_at"], now)
+            ]
+            if abandoned:
+                # The lease owner check keeps a job that was just finished or re-claimed.
+                self._conn.executemany(
+                    "UPDATE jobs SET status = ?, lease_owner = NULL, lease_expires_at = NULL, updated_at = ? "
+                    "WHERE id = ? AND status = ? AND lease_owner IS ?",
+                    abandoned,
+                )
+        return len(abandoned)
+
+    # --- Producer side ---
+
+    @staticmethod
+    def new_job_id() -> str:
+        return uuid.uuid4().hex[:12]
+
+    def enqueue(self, kind: str, payload: dict, owner: str = None, job_id: str = None) -> str:
+        """
+        Adds a job and returns its id. Callers that need the id inside the
+        payload (e.g. as an idempotency key) can choose it with new_job_id().
+        """
+        job_id = job_id or self.new_job_id()
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, kind, owner, payload, status, max_attempts, next_run_at, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, kind, owner, json.dumps(payload), QUEUED, self.max_attempts, now, now, now),
+            )
+        self._wakeup.set()
+        logger.info(f"Enqueued {kind} job {job_id}.")
+        return job_id
+
+    def get(self, job_id: str) -> dict:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_dict(row) if row else None
+
+    def recent_for_owner(self, owner: str, limit: int = 5) -> list:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM jobs WHERE owner IS ? ORDER BY created_at DESC LIMIT ?", (owner, limit)
+            ).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    def unnotified_finished(self, owner: str) -> list:
+        """
+        Returns finished jobs the owner has not been told about yet. They stay
+        unnotified until mark_notified(), so a reply that never reached the
+        user does not swallow them.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM jobs WHERE owner IS ? AND status IN (?, ?) AND notified = 0 ORDER BY updated_at",
+                (owner, SUCCEEDED, FAILED),
+            ).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    def mark_notified(self, job_ids: list):
+        if not job_ids:
+            return
+        with self._lock:
+            self._conn.executemany("UPDATE jobs SET notified = 1 WHERE id = ?", [(job_id,) for job_id in job_ids])
+
+    def stats(self) -> dict:
+        """Job counts by status, plus the age in seconds of the oldest queued job."""
+        with self._lock:
+            counts = dict(self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+            oldest = self._conn.execute("SELECT MIN(created_at) FROM jobs WHERE status = ?", (QUEUED,)).fetchone()[0]
+        return {
+            "counts": {status: counts.get(status, 0) for status in (QUEUED, RUNNING, SUCCEEDED, FAILED)},
+            "oldest_queued_seconds": round(time.time() - oldest, 1) if oldest else 0.0,
+            "workers": len(self._threads),
+        }
+
+    @staticmethod
+    def _to_dict(row) -> dict:
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    # --- Worker side ---
+
+    def start(self):
+        self._stopping.clear()
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"job-worker-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: float = 5.0):
+        self._stopping.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def _claim(self):
+        """
+        Atomically moves the next due job to 'running' under a lease held by this
+        process and returns it. Running jobs whose lease ran out count as due.
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "UPDATE jobs SET status = ?, attempts = attempts + 1, lease_owner = ?, lease_expires_at = ?, updated_at = ? "
+                "WHERE id = (SELECT id FROM jobs WHERE (status = ? AND next_run_at <= ?) "
+                "OR (status = ? AND lease_expires_at <= ?) ORDER BY next_run_at LIMIT 1) "
+                "RETURNING *",
+                (RUNNING, self.worker_id, now + self.lease_seconds, now, QUEUED, now, RUNNING, now),
+            ).fetchone()
+        return self._to_dict(row) if row else None
+
+    def _finish(self, job_id: str, status: str, result=None, error: str = None, next_run_at: float = None):
+        """Records the outcome of a job this process still holds the lease on."""
+        now = time.time()
+        with self._lock:
+            updated = self._conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, next_run_at = COALESCE(?, next_run_at), "
+                "lease_owner = NULL, lease_expires_at = NULL, updated_at = ? "
+                "WHERE id = ? AND status = ? AND lease_owner = ?",
+                (status, json.dumps(result) if result is not None else None, error, next_run_at, now,
+                 job_id, RUNNING, self.worker_id),
+            ).rowcount
+        if not updated:
+            logger.warning(f"Job {job_id} lost its lease before finishing; its result was not recorded.")
+
+    def _backoff(self, attempts: int) -> float:
+        delay = min(self.backoff_base * (2 ** (attempts - 1)), self.backoff_max)
+        return delay * random.uniform(0.5, 1.0)
+
+    def run_once(self) -> bool:
+        """Runs one due job if there is one. Returns whether a job was run."""
+        job = self._claim()
+        if not job:
+            return False
+        handler = self.handlers.get(job["kind"])
+        try:
+            if handler is None:
+                raise ValueError(f"No handler for job kind '{job['kind']}'")
+            result = handler(job["payload"])
+            self._finish(job["id"], SUCCEEDED, result=result)
+            logger.info(f"Job {job['id']} ({job['kind']}) succeeded on attempt {job['attempts']}.")
+        except RetryableJobError as e:
+            if job["attempts"] < job["max_attempts"]:
+                delay = self._backoff(job["attempts"])
+                self._finish(job["id"], QUEUED, error=str(e), next_run_at=time.time() + delay)
+                logger.warning(f"Job {job['id']} failed (attempt {job['attempts']}), retrying in {delay:.1f}s: {e}")
+            else:
+                self._finish(job["id"], FAILED, error=str(e))
+                logger.error(f"Job {job['id']} failed after {job['attempts']} attempts: {e}")
+        except Exception as e:
+            self._finish(job["id"], FAILED, error=str(e))
+            logger.error(f"Job {job['id']} failed permanently: {e}")
+        return True
+
+    def _work(self):
+        while not self._stopping.is_set():
+            try:
+                ran = self.run_once()
+            except sqlite3.Error as e:
+                logger.error(f"Job queue database error: {e}")
+                ran = False
+            if not ran:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
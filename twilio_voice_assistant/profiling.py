@@ -0,0 +1,98 @@
+import functools
+import sys
+import threading
+import time
+from collections import Counter
+
+# --- Always-on Hot-Path Counters ---
+# Plain integer/float updates: cheap enough for every media frame. Under heavy
+# threading an increment can occasionally be lost; these are for trends, not billing.
+
+counters = Counter()
+# name -> [calls, cumulative_seconds, max_seconds]
+timings = {}
+
+
+def increment(name: str, amount: int = 1):
+    counters[name] += amount
+
+
+def timed(name: str = None):
+    """Decorator recording call count and cumulative wall time for a function."""
+    def decorator(func):
+        label = name or func.__name__
+        timings.setdefault(label, [0, 0.0, 0.0])
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - started
+                entry = timings[label]
+                entry[0] += 1
+                entry[1] += elapsed
+                if elapsed > entry[2]:
+                    entry[2] = elapsed
+        return wrapper
+    return decorator
+
+
+def snapshot() -> dict:
+    return {
+        "counters": dict(counters),
+        "timings": {
+            label: {
+                "calls": calls,
+                "total_ms": round(total * 1000, 3),
+                "avg_ms": round(total / calls * 1000, 3) if calls else 0.0,
+                "max_ms": round(worst * 1000, 3),
+            }
+            for label, (calls, total, worst) in timings.items()
+        },
+    }
+
+
+# --- On-demand Sampling Profiler ---
+
+_profile_lock = threading.Lock()
+
+
+class ProfilerBusy(Exception):
+    """Raised when a profile is requested while another one is running."""
+
+
+def _collapse(frame, thread_name: str) -> str:
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{code.co_firstlineno})")
+        frame = frame.f_back
+    stack.append(thread_name)
+    return ";".join(reversed(stack))
+
+
+def sample_stacks(seconds: float, interval: float = 0.005) -> str:
+    """
+    Samples the Python stacks of every thread in this process every `interval`
+    seconds for `seconds` seconds. Returns collapsed stacks ("frame;frame;... count"
+    per line), the input format of flamegraph.pl, speedscope and inferno.
+    Overhead is one stack walk per thread per sample, in a separate thread.
+    """
+    if not _profile_lock.acquire(blocking=False):
+        raise ProfilerBusy("A profile is already running.")
+    try:
+        sampler_id = threading.get_ident()
+        samples = Counter()
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == sampler_id:
+                    continue
+                samples[_collapse(frame, names.get(thread_id, f"thread-{thread_id}"))] += 1
+            time.sleep(interval)
+        return "\n".join(f"{stack} {count}" for stack, count in samples.most_common()) + "\n"
+    finally:
+        _profile_lock.release()
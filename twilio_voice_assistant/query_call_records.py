@@ -0,0 +1,151 @@
+"""
+Query the per-turn call records written by the voice assistant.
+
+Prints turn counts, outcome breakdowns and latency percentiles per stage,
+optionally grouped by tool, language or outcome. Run from the
+twilio_voice_assistant folder:
+
+    python query_call_records.py                          # everything in CALL_RECORDS_DIR
+    python query_call_records.py --by tool --since-hours 24
+    python query_call_records.py --by language --percentiles 50 95 99
+    python query_call_records.py --call MZ18ad3ab5a668481ce02b83e7395059f0
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+
+import numpy as np
+
+from call_records import NOT_RUN, call_id_bytes, read_file
+
+COLUMNS = ("language", "tool", "outcome")
+
+
+def load_turns(paths: list):
+    """
+    Reads every file and concatenates the turn rows. String codes are
+    remapped from each file's table to one shared table. Returns
+    (turns, codes) where codes[column] is an int array into the shared `names` list.
+    """
+    names, name_ids = [], {}
+    parts, code_parts = [], {column: [] for column in COLUMNS}
+    for path in paths:
+        try:
+            turns, strings = read_file(path)
+        except (OSError, ValueError) as e:
+            print(f"skipping {path}: {e}", file=sys.stderr)
+            continue
+        lookup = np.zeros(256, dtype=np.int32)
+        for code in range(256):
+            name = strings.get(code, "other")
+            if name not in name_ids:
+                name_ids[name] = len(names)
+                names.append(name)
+            lookup[code] = name_ids[name]
+        parts.append(turns)
+        for column in COLUMNS:
+            code_parts[column].append(lookup[turns[column]])
+    if not parts:
+        return None, None, names
+    turns = np.concatenate(parts)
+    codes = {column: np.concatenate(code_parts[column]) for column in COLUMNS}
+    return turns, codes, names
+
+
+def stage_durations(turns) -> dict:
+    """Per-stage durations in ms (NaN where the stage did not run), from cumulative offsets."""
+    durations = {}
+    previous = np.zeros(len(turns))
+    for stage in ("stt", "llm", "tts", "sent"):
+        ends = turns[stage].astype(np.float64)
+        ran = turns[stage] != NOT_RUN
+        ends[~ran] = np.nan
+        durations[stage] = ends - previous
+        previous = np.where(ran, ends, previous)
+    durations["total"] = np.where(turns["sent"] != NOT_RUN, turns["sent"].astype(np.float64), np.nan)
+    return durations
+
+
+def format_percentiles(values, percentiles) -> str:
+    values = values[~np.isnan(values)]
+    if not len(values):
+        return " ".join(f"{'-':>7}" for _ in percentiles)
+    return " ".join(f"{value:>7.0f}" for value in np.percentile(values, percentiles))
+
+
+def print_report(turns, codes, names, group_by: str, percentiles: list):
+    durations = stage_durations(turns)
+    span = turns["started_at"].max() - turns["started_at"].min()
+    calls = len(np.unique(turns["call_id"]))
+    print(f"{len(turns):,} turns across {calls:,} calls over {span / 3600:.1f} hours")
+
+    outcome_ids, outcome_counts = np.unique(codes["outcome"], return_counts=True)
+    breakdown = ", ".join(
+        f"{names[outcome] or '-'} {count / len(turns):.1%}"
+        for outcome, count in sorted(zip(outcome_ids, outcome_counts), key=lambda item: -item[1])
+    )
+    print(f"outcomes: {breakdown}")
+    print(f"bytes per turn: {turns['bytes_in'].mean():,.0f} in, {turns['bytes_out'].mean():,.0f} out")
+    print()
+
+    labels = "/".join(f"p{p:g}" for p in percentiles)
+    stages = ("total", "stt", "llm", "tts")
+    width = 8 * len(percentiles)
+    header = f"{group_by or 'all':<22}{'turns':>9}{'share':>8}  " + "  ".join(f"{stage + ' ms ' + labels:>{width}}" for stage in stages)
+    print(header)
+    print("-" * len(header))
+
+    if group_by:
+        group_ids, group_counts = np.unique(codes[group_by], return_counts=True)
+        groups = sorted(zip(group_ids, group_counts), key=lambda item: -item[1])
+    else:
+        groups = [(None, len(turns))]
+    for group, count in groups:
+        mask = codes[group_by] == group if group_by else np.ones(len(turns), dtype=bool)
+        label = (names[group] or "-") if group_by else "all"
+        cells = "  ".join(format_percentiles(durations[stage][mask], percentiles).rjust(width) for stage in stages)
+        print(f"{label[:21]:<22}{count:>9,}{count / len(turns):>8.1%}  {cells}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="*", help="Record files or directories (default: CALL_RECORDS_DIR).")
+    parser.add_argument("--by", choices=COLUMNS, help="Break the report down by this column.")
+    parser.add_argument("--since-hours", type=float, help="Only turns that started in the last N hours.")
+    parser.add_argument("--call", help="Only turns of this call (Twilio stream SID).")
+    parser.add_argument("--percentiles", type=float, nargs="+", default=[50, 90, 99])
+    args = parser.parse_args()
+
+    paths = []
+    for path in args.paths or [os.getenv("CALL_RECORDS_DIR", "call_records")]:
+        if os.path.isdir(path):
+            paths.extend(sorted(glob.glob(os.path.join(path, "*.crec"))))
+        else:
+            paths.append(path)
+
+    started = time.perf_counter()
+    turns, codes, names = load_turns(paths)
+    if turns is None or not len(turns):
+        print("No call records found.")
+        return
+
+    mask = np.ones(len(turns), dtype=bool)
+    if args.since_hours:
+        mask &= turns["started_at"] >= time.time() - args.since_hours * 3600
+    if args.call:
+        mask &= turns["call_id"] == call_id_bytes(args.call)
+    if not mask.all():
+        turns = turns[mask]
+        codes = {column: values[mask] for column, values in codes.items()}
+    if not len(turns):
+        print("No turns match the filters.")
+        return
+
+    print_report(turns, codes, names, args.by, args.percentiles)
+    print(f"\n({len(paths)} files, {time.perf_counter() - started:.2f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+import contextvars
+import heapq
+import itertools
+import logging
+import math
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+logger = logging.getLogger(__name__)
+
+# --- Priority Classes ---
+# Lower numbers are served first when requests queue for the same endpoint.
+LIVE_CALL = 0
+WEB = 1
+BATCH = 2
+PRIORITY_NAMES = {LIVE_CALL: "live_call", WEB: "web", BATCH: "batch"}
+
+# Longest Retry-After we are willing to honour; anything longer is capped.
+MAX_RETRY_AFTER_SECONDS = 60.0
+# Pause applied on a 429 that carries no Retry-After header.
+DEFAULT_RETRY_AFTER_SECONDS = 1.0
+# Latency estimates only update when a request is sent. Each request dropped
+# because of the estimate shrinks it by this factor, so after a slow spell the
+# lane soon lets a request through again and re-measures.
+DROP_LATENCY_DECAY = 0.8
+
+# Priority and deadline of the request being handled, so code deep in the call
+# stack (e.g. the STT router) is scheduled with its caller's turn budget.
+# asyncio.to_thread copies these into the worker thread.
+current_priority = contextvars.ContextVar("sarvam_priority", default=None)
+current_deadline = contextvars.ContextVar("sarvam_deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    """Raised instead of sending a request that can no longer finish before its deadline."""
+
+
+def start_turn(slo_seconds: float, priority: int = None):
+    """Sets the deadline (and optionally priority) for every Sarvam request of this turn."""
+    current_deadline.set(time.monotonic() + slo_seconds)
+    if priority is not None:
+        current_priority.set(priority)
+
+
+def retry_after_seconds(error: Exception):
+    """
+    Returns how long the provider asked us to back off, or None if the error
+    is not a rate limit. Works for SarvamAI SDK errors (status_code/headers)
+    and requests.HTTPError (response.status_code/headers).
+    """
+    status = getattr(error, "status_code", None)
+    headers = getattr(error, "headers", None)
+    response = getattr(error, "response", None)
+    if response is not None:
+        status = status or getattr(response, "status_code", None)
+        headers = headers or getattr(response, "headers", None)
+    if status not in (429, 503):
+        return None
+
+    value = None
+    if headers:
+        value = headers.get("Retry-After") or headers.get("retry-after")
+    if value is None:
+        return DEFAULT_RETRY_AFTER_SECONDS if status == 429 else None
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            seconds = (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds()
+        except (TypeError, ValueError):
+            seconds = DEFAULT_RETRY_AFTER_SECONDS
+    return min(max(seconds, 0.0), MAX_RETRY_AFTER_SECONDS)
+
+
+class TokenBucket:
+    """Allows `rate` requests per second on average, with bursts of up to `burst`."""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_take(self, now: float) -> float:
+        """Takes a token and returns 0, or returns the seconds until one is available."""
+        if now < self.paused_until:
+            return self.paused_until - now
+        self._refill(now)
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return 0.0
+        return (1.0 - self.tokens) / self.rate
+
+    def pause(self, until: float):
+        """Honours a Retry-After: no tokens until `until`, then refill from empty."""
+        self.paused_until = max(self.paused_until, until)
+        self.tokens = 0.0
+        self.updated = self.paused_until
+
+
+class _Lane:
+    """Queue, bucket and counters for one (endpoint, model) pair."""
+
+    def __init__(self, rate: float, burst: int):
+        self.bucket = TokenBucket(rate, burst)
+        self.waiting = []
+        self.latency_ewma = None
+        self.counts = {"granted": 0, "dropped_deadline": 0, "rate_limited": 0, "retried": 0}
+
+    def record_latency(self, seconds: float):
+        if self.latency_ewma is None:
+            self.latency_ewma = seconds
+        else:
+            self.latency_ewma = 0.8 * self.latency_ewma + 0.2 * seconds
+
+    def record_drop(self, now: float, deadline: float):
+        """Counts a deadline drop; if only the latency estimate caused it, decays the estimate."""
+        self.counts["dropped_deadline"] += 1
+        if self.latency_ewma is not None and now <= deadline:
+            self.latency_ewma *= DROP_LATENCY_DECAY
+
+
+class SarvamScheduler:
+    """
+    Central gate for Sarvam API traffic. Each (endpoint, model) pair has a token
+    bucket sized from `limits` ({endpoint: (requests_per_second, burst)}),
+    scaled by `share`: the fraction of the account's limits this process may
+    use when several processes (uvicorn workers, the web app) share one key.
+    Requests waiting for a token are served by priority class, then earliest
+    deadline. A request is dropped with DeadlineExceeded as soon as its deadline
+    minus the endpoint's recent latency has passed, rather than being sent late.
+    That latency estimate decays with every such drop, so one slow response
+    cannot stop a lane for good.
+    A 429 pauses the bucket for the Retry-After period and the request is
+    retried if its deadline still allows.
+    """
+
+    def __init__(self, limits: dict, default_priority: int = LIVE_CALL, max_retries: int = 2, share: float = 1.0):
+        if not 0.0 < share <= 1.0:
+            raise ValueError(f"Rate limit share must be in (0, 1], got {share}")
+        self.limits = limits
+        self.share = share
+        self.default_priority = default_priority
+        self.max_retries = max_retries
+        self._lanes = {}
+        self._cond = threading.Condition()
+        self._sequence = itertools.count()
+
+    def _lane(self, endpoint: str, model: str) -> _Lane:
+        key = (endpoint, model)
+        lane = self._lanes.get(key)
+        if lane is None:
+            rate, burst = self.limits.get(endpoint, (5.0, 5))
+            lane = self._lanes[key] = _Lane(rate * self.share, max(1, int(burst * self.share)))
+        return lane
+
+    def _acquire(self, lane: _Lane, endpoint: str, priority: int, deadline: float):
+        ticket = [priority, deadline if deadline is not None else math.inf, next(self._sequence)]
+        with self._cond:
+            heapq.heappush(lane.waiting, ticket)
+            try:
+                while True:
+                    now = time.monotonic()
+                    expected = lane.latency_ewma or 0.0
+                    if deadline is not None and now + expected > deadline:
+                        lane.record_drop(now, deadline)
+                        raise DeadlineExceeded(
+                            f"Dropped {endpoint} request: it cannot finish within its deadline "
+                            f"({PRIORITY_NAMES.get(priority, priority)}, {len(lane.waiting) - 1} ahead)"
+                        )
+                    timeout = None
+                    if lane.waiting[0] is ticket:
+                        wait = lane.bucket.try_take(now)
+                        if wait == 0.0:
+                            lane.counts["granted"] += 1
+                            return
+                        timeout = wait
+                    if deadline is not None:
+                        slack = deadline - expected - now
+                        timeout = slack if timeout is None else min(timeout, slack)
+                    self._cond.wait(timeout)
+            finally:
+                if lane.waiting and lane.waiting[0] is ticket:
+                    heapq.heappop(lane.waiting)
+                else:
+                    lane.waiting.remove(ticket)
+                    heapq.heapify(lane.waiting)
+                self._cond.notify_all()
+
+    def run(self, endpoint: str, model: str, request, priority: int = None, deadline: float = None):
+        """
+        Runs `request` (a zero-argument callable making one Sarvam API call) once
+        the (endpoint, model) bucket allows it. `priority` and `deadline`
+        (time.monotonic() seconds) default to the current turn's, if set.
+        """
+        if priority is None:
+            priority = current_priority.get()
+        if priority is None:
+            priority = self.default_priority
+        if deadline is None:
+            deadline = current_deadline.get()
+        lane = self._lane(endpoint, model)
+
+        attempt = 0
+        while True:
+            self._acquire(lane, endpoint, priority, deadline)
+            started = time.monotonic()
+            try:
+                result = request()
+            except Exception as e:
+                delay = retry_after_seconds(e)
+                if delay is None:
+                    raise
+                now = time.monotonic()
+                with self._cond:
+                    lane.counts["rate_limited"] += 1
+                    lane.bucket.pause(now + delay)
+                    self._cond.notify_all()
+                logger.warning(f"Sarvam {endpoint} ({model}) rate limited, pausing {delay:.1f}s.")
+                expected = lane.latency_ewma or 0.0
+                if attempt >= self.max_retries or (deadline is not None and now + delay + expected > deadline):
+                    raise
+                attempt += 1
+                lane.counts["retried"] += 1
+                continue
+            lane.record_latency(time.monotonic() - started)
+            return result
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        with self._cond:
+            return {
+                f"{endpoint}:{model}": {
+                    **lane.counts,
+                    "queued": len(lane.waiting),
+                    "queued_by_priority": {
+                        PRIORITY_NAMES.get(priority, str(priority)): sum(1 for ticket in lane.waiting if ticket[0] == priority)
+                        for priority in sorted({ticket[0] for ticket in lane.waiting})
+                    },
+                    "rate_per_second": round(lane.bucket.rate, 3),
+                    "paused_seconds": round(max(lane.bucket.paused_until - now, 0.0), 2),
+                    "latency_ewma_ms": round(lane.latency_ewma * 1000, 1) if lane.latency_ewma else None,
+                }
+                for (endpoint, model), lane in self._lanes.items()
+            }
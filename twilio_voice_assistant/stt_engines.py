@@ -0,0 +1,326 @@
+import audioop
+import contextvars
+import logging
+import multiprocessing
+import struct
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+from audio_format import resample_pcm
+from sarvam_scheduler import DeadlineExceeded
+
+logger = logging.getLogger(__name__)
+
+# Same shape the rest of the pipeline reads from SarvamAI responses.
+Transcription = namedtuple("Transcription", ["transcript", "language_code", "engine"])
+
+MULAW_SAMPLE_RATE = 8000
+
+# Whisper language codes for the languages SarvamAI speaks (its TTS
+# target_language_code values). Anything else is answered in English.
+SARVAM_LANGUAGE_CODES = {
+    "bn": "bn-IN", "en": "en-IN", "gu": "gu-IN", "hi": "hi-IN", "kn": "kn-IN", "ml": "ml-IN",
+    "mr": "mr-IN", "or": "od-IN", "pa": "pa-IN", "ta": "ta-IN", "te": "te-IN",
+}
+
+
+def sarvam_language_code(language: str) -> str:
+    """Maps a Whisper language code to the SarvamAI code, falling back to en-IN."""
+    return SARVAM_LANGUAGE_CODES.get(language or "", "en-IN")
+
+
+def mulaw_payload(audio_bytes: bytes) -> bytes:
+    """
+    Returns the raw µ-law samples from either headerless µ-law or a µ-law WAV
+    container (as produced by convert_mulaw_to_wav_bytes).
+    """
+    if not audio_bytes.startswith(b"RIFF"):
+        return audio_bytes
+    offset = 12
+    while offset + 8 <= len(audio_bytes):
+        chunk_id = audio_bytes[offset:offset + 4]
+        (chunk_size,) = struct.unpack("<I", audio_bytes[offset + 4:offset + 8])
+        if chunk_id == b"data":
+            return audio_bytes[offset + 8:offset + 8 + chunk_size]
+        offset += 8 + chunk_size + (chunk_size & 1)
+    return b""
+
+
+def utterance_seconds(audio_bytes: bytes) -> float:
+    return len(mulaw_payload(audio_bytes)) / MULAW_SAMPLE_RATE
+
+
+class STTEngine:
+    """Interface for speech-to-text engines used by transcribe_audio."""
+
+    name = "base"
+
+    @property
+    def available(self) -> bool:
+        return True
+
+    def transcribe(self, audio_bytes: bytes):
+        """Returns a Transcription-like object (with .transcript and .language_code) or None."""
+        raise NotImplementedError
+
+
+class RemoteSTTEngine(STTEngine):
+    """Wraps the hosted SarvamAI speech-to-text call."""
+
+    name = "sarvam"
+
+    def __init__(self, transcribe_fn, is_available=lambda: True):
+        self._transcribe_fn = transcribe_fn
+        self._is_available = is_available
+
+    @property
+    def available(self) -> bool:
+        return self._is_available()
+
+    def transcribe(self, audio_bytes: bytes):
+        return self._transcribe_fn(audio_bytes)
+
+
+# --- Local engine (runs in worker processes) ---
+
+_local_model = None
+
+
+def _load_local_model(model_name: str, compute_type: str, cpu_threads: int):
+    """Process-pool initializer: loads the quantized model once per worker."""
+    global _local_model
+    from faster_whisper import WhisperModel
+    _local_model = WhisperModel(model_name, device="cpu", compute_type=compute_type, cpu_threads=cpu_threads)
+
+
+def _local_transcribe(pcm_16k: bytes):
+    """Runs in a worker process: transcribes 16kHz float32 PCM, translating to English."""
+    samples = np.frombuffer(pcm_16k, dtype=np.float32)
+    segments, info = _local_model.transcribe(samples, task="translate", beam_size=1, vad_filter=True)
+    text = " ".join(segment.text.strip() for segment in segments).strip()
+    return text, info.language
+
+
+class LocalSTTEngine(STTEngine):
+    """
+    CPU speech-to-text using a small int8-quantized Whisper model (faster-whisper)
+    in a process pool, so inference never holds the server's GIL. The pool and
+    model are created on first use; without faster-whisper installed the engine
+    reports itself unavailable and the router never picks it.
+    """
+
+    name = "local"
+    # How long to stop offering the engine after its worker pool breaks
+    # (e.g. the model could not be loaded or a worker was killed).
+    RETRY_AFTER_SECONDS = 60.0
+
+    def __init__(self, model_name: str = "tiny", compute_type: str = "int8", workers: int = 2, cpu_threads: int = 2):
+        self.model_name = model_name
+        self.compute_type = compute_type
+        self.workers = workers
+        self.cpu_threads = cpu_threads
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self._disabled_until = 0.0
+        try:
+            import faster_whisper  # noqa: F401
+            self._installed = True
+        except ImportError:
+            self._installed = False
+
+    @property
+    def available(self) -> bool:
+        return self._installed and time.monotonic() >= self._disabled_until
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._pool_lock:
+            if self._pool is None:
+                # Spawned, not forked: the server process already runs many threads
+                # (to_thread workers, job workers, the record writer), and a forked
+                # child can inherit a lock one of them held and deadlock.
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_load_local_model,
+                    initargs=(self.model_name, self.compute_type, self.cpu_threads),
+                )
+            return self._pool
+
+    def transcribe(self, audio_bytes: bytes):
+        pcm = audioop.ulaw2lin(mulaw_payload(audio_bytes), 2)
+        samples = np.frombuffer(pcm, dtype="<i2").astype(np.float32) / 32768.0
+        samples_16k = resample_pcm(samples, MULAW_SAMPLE_RATE, 16000)
+        try:
+            text, language = self._get_pool().submit(_local_transcribe, samples_16k.tobytes()).result()
+        except BrokenProcessPool:
+            with self._pool_lock:
+                self._pool = None
+            self._disabled_until = time.monotonic() + self.RETRY_AFTER_SECONDS
+            logger.error(f"Local STT worker pool failed; disabling local engine for {self.RETRY_AFTER_SECONDS:.0f}s.")
+            raise
+        return Transcription(text, sarvam_language_code(language), self.name)
+
+
+# --- Routing ---
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures and stays open for
+    `reset_seconds`; then one trial request is let through (half-open).
+    """
+
+    def __init__(self, failure_threshold: int = 3, reset_seconds: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        """Current state ("closed", "open" or "half_open" once a trial is due), read without changing it."""
+        with self._lock:
+            if self.opened_at is None:
+                return "closed"
+            if time.monotonic() - self.opened_at >= self.reset_seconds:
+                return "half_open"
+            return "open"
+
+    @property
+    def is_open(self) -> bool:
+        """Whether to skip the remote engine. Once the reset period is over, moves to half-open."""
+        with self._lock:
+            if self.opened_at is None:
+                return False
+            if time.monotonic() - self.opened_at >= self.reset_seconds:
+                # Half-open: allow a trial; a failure re-opens immediately.
+                self.opened_at = None
+                self.failures = self.failure_threshold - 1
+                return False
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+class STTRouter:
+    """
+    Chooses between the remote and local engines for each utterance:
+      - short utterances go to the local engine (cheaper than a network round trip),
+      - an open circuit breaker or a remote latency average above the SLO routes
+        everything locally,
+      - otherwise the remote engine is tried, and if it has not answered within
+        the SLO the local engine is started and whichever finishes first wins.
+    """
+
+    PROBE_EVERY = 10
+
+    def __init__(self, remote: STTEngine, local: STTEngine, latency_slo: float = 2.5,
+                 short_utterance_seconds: float = 1.5, breaker: CircuitBreaker = None):
+        self.remote = remote
+        self.local = local
+        self.latency_slo = latency_slo
+        self.short_utterance_seconds = short_utterance_seconds
+        self.breaker = breaker or CircuitBreaker()
+        self.remote_latency_ewma = None
+        # While remote is considered slow, every PROBE_EVERY-th utterance still goes
+        # remote so the latency average can recover.
+        self._slow_skips = 0
+        self._executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="stt")
+        self.routed = {"remote": 0, "local": 0, "hedged": 0}
+
+    def _record_remote_latency(self, seconds: float):
+        if self.remote_latency_ewma is None:
+            self.remote_latency_ewma = seconds
+        else:
+            self.remote_latency_ewma = 0.8 * self.remote_latency_ewma + 0.2 * seconds
+
+    def _run_remote(self, audio_bytes: bytes):
+        started = time.monotonic()
+        try:
+            result = self.remote.transcribe(audio_bytes)
+        except DeadlineExceeded as e:
+            # Dropped by our own scheduler before it was sent: not a remote failure.
+            logger.warning(f"Remote transcription skipped: {e}")
+            return None
+        except Exception as e:
+            logger.error(f"Remote transcription failed: {e}")
+            result = None
+        self._record_remote_latency(time.monotonic() - started)
+        if result is None:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        return result
+
+    def _run_local(self, audio_bytes: bytes):
+        try:
+            return self.local.transcribe(audio_bytes)
+        except Exception as e:
+            logger.error(f"Local transcription failed: {e}")
+            return None
+
+    def choose_engine(self, audio_bytes: bytes) -> str:
+        if not self.local.available:
+            return "remote"
+        if not self.remote.available or self.breaker.is_open:
+            return "local"
+        if utterance_seconds(audio_bytes) <= self.short_utterance_seconds:
+            return "local"
+        if self.remote_latency_ewma is not None and self.remote_latency_ewma > self.latency_slo:
+            self._slow_skips += 1
+            if self._slow_skips % self.PROBE_EVERY:
+                return "local"
+        return "remote"
+
+    def transcribe(self, audio_bytes: bytes):
+        engine = self.choose_engine(audio_bytes)
+        self.routed[engine] += 1
+        logger.info(f"Routing transcription to {engine} engine.")
+        if engine == "local":
+            result = self._run_local(audio_bytes)
+            if result is None and self.remote.available and not self.breaker.is_open:
+                return self._run_remote(audio_bytes)
+            return result
+
+        # Run in a copy of the caller's context so the turn's Sarvam deadline applies.
+        remote_future = self._executor.submit(contextvars.copy_context().run, self._run_remote, audio_bytes)
+        if not self.local.available:
+            return remote_future.result()
+
+        done, _ = wait([remote_future], timeout=self.latency_slo)
+        if done and remote_future.result() is not None:
+            return remote_future.result()
+
+        # Remote is slow or failed: hedge with the local engine.
+        self.routed["hedged"] += 1
+        logger.warning("Remote transcription missed its latency SLO or failed; using local engine.")
+        local_future = self._executor.submit(contextvars.copy_context().run, self._run_local, audio_bytes)
+        pending = {remote_future, local_future}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.result() is not None:
+                    return future.result()
+        return None
+
+    def stats(self) -> dict:
+        return {
+            "routed": dict(self.routed),
+            "remote_latency_ewma_ms": round(self.remote_latency_ewma * 1000, 1) if self.remote_latency_ewma else None,
+            "breaker_state": self.breaker.state,
+            "local_available": self.local.available,
+        }
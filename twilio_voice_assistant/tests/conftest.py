@@ -0,0 +1,85 @@
+import os
+import sys
+import tempfile
+from urllib.parse import urlsplit
+
+import pytest
+import requests
+
+# The service modules are imported by plain name, as uvicorn does when run from
+# twilio_voice_assistant; the repository root holds the Flask app.
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+SERVICE_DIR = os.path.dirname(TESTS_DIR)
+sys.path.insert(0, SERVICE_DIR)
+sys.path.insert(1, os.path.dirname(SERVICE_DIR))
+
+# Importing main opens the payment job database; keep it out of the source tree.
+os.environ.setdefault("PAYMENT_JOBS_DB", os.path.join(tempfile.mkdtemp(prefix="swarnam-tests-"), "payment_jobs.sqlite3"))
+
+
+def as_requests_response(response) -> requests.Response:
+    """Converts a TestClient response into the requests.Response the service code expects."""
+    converted = requests.Response()
+    converted.status_code = response.status_code
+    converted._content = response.content
+    converted.headers.update(response.headers)
+    return converted
+
+
+@pytest.fixture
+def stub_api(monkeypatch):
+    """
+    Routes the service's tools API requests to an in-process tools_api_stub,
+    reseeded for each test. Yields the list of requests made.
+    """
+    from fastapi.testclient import TestClient
+
+    import expense_store
+    import main
+    import tools_api_stub
+
+    tools_api_stub.seed()
+    tools_api_stub.PAYMENT_LINKS.clear()
+    client = TestClient(tools_api_stub.app)
+    calls = []
+
+    def post(url, headers=None, json=None, data=None, timeout=None):
+        calls.append({"url": url, "headers": headers, "json": json})
+        # requests leaves out headers whose value is None (e.g. unset credentials).
+        headers = {name: value for name, value in (headers or {}).items() if value is not None}
+        return as_requests_response(client.post(urlsplit(url).path, headers=headers, json=json, content=data))
+
+    monkeypatch.setattr(main, "TOOLS_API_BASE_URL", "http://tools-api.test")
+    monkeypatch.setattr(requests, "post", post)
+    expense_store._stores.clear()
+    yield calls
+    expense_store._stores.clear()
+    tools_api_stub.seed()
+
+
+class FakeChat:
+    """Stands in for sarvam_client.chat: returns scripted replies (or raises scripted errors) in order."""
+
+    def __init__(self):
+        self.replies = []
+        self.calls = []
+
+    def completions(self, messages, **kwargs):
+        self.calls.append(messages)
+        reply = self.replies.pop(0)
+        if isinstance(reply, Exception):
+            raise reply
+        message = type("Message", (), {"content": reply})
+        choice = type("Choice", (), {"message": message})
+        return type("Completion", (), {"choices": [choice]})
+
+
+@pytest.fixture
+def fake_llm(monkeypatch):
+    """Replaces main's SarvamAI client with one whose chat replies the test scripts."""
+    import main
+
+    chat = FakeChat()
+    monkeypatch.setattr(main, "sarvam_client", type("Client", (), {"chat": chat})())
+    main.first_pass_cache._entries.clear()
+    return chat
@@ -0,0 +1,112 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from admission import AdmissionController, AdmissionRejected
+
+
+def make_controller(tool_limit: int, queue_timeout: float = 5.0) -> AdmissionController:
+    return AdmissionController(
+        max_calls=10,
+        max_calls_per_tenant=10,
+        stage_limits={"tool": {"global": tool_limit, "tenant": tool_limit}},
+        queue_timeout=queue_timeout,
+    )
+
+
+def run_tool_calls(controller: AdmissionController, calls: int, hold: float) -> list:
+    """Runs `calls` worker-thread tool calls the way get_llm_response does; returns peak concurrency and errors."""
+    state = {"running": 0, "peak": 0}
+    lock = threading.Lock()
+    errors = []
+
+    def tool_call():
+        try:
+            with controller.blocking_slot("tool", "tenant-a"):
+                with lock:
+                    state["running"] += 1
+                    state["peak"] = max(state["peak"], state["running"])
+                time.sleep(hold)
+                with lock:
+                    state["running"] -= 1
+        except AdmissionRejected as e:
+            errors.append(e)
+
+    async def serve():
+        controller.bind_loop(asyncio.get_running_loop())
+        await asyncio.gather(*(asyncio.to_thread(tool_call) for _ in range(calls)))
+
+    asyncio.run(serve())
+    return [state["peak"], errors]
+
+
+def test_tool_limit_is_enforced_for_worker_threads():
+    controller = make_controller(tool_limit=1)
+    peak, errors = run_tool_calls(controller, calls=4, hold=0.05)
+    assert errors == []
+    assert peak == 1
+    stats = controller.stats()["stages"]["tool"]
+    assert stats["admitted"] == 4
+    assert stats["in_use"] == 0
+    assert stats["active_tenants"] == 0
+
+
+def test_tool_calls_beyond_queue_timeout_are_rejected():
+    controller = make_controller(tool_limit=1, queue_timeout=0.05)
+    peak, errors = run_tool_calls(controller, calls=3, hold=0.3)
+    assert peak == 1
+    assert len(errors) == 2
+    assert controller.stats()["stages"]["tool"]["rejected"] == 2
+
+
+def test_async_slot_rejects_after_timeout():
+    controller = make_controller(tool_limit=1, queue_timeout=0.05)
+
+    async def scenario():
+        async with controller.slot("tool", "tenant-a"):
+            with pytest.raises(AdmissionRejected):
+                async with controller.slot("tool", "tenant-a"):
+                    pass
+
+    asyncio.run(scenario())
+    assert controller.stats()["stages"]["tool"]["in_use"] == 0
+
+
+def test_call_admission_per_tenant():
+    controller = AdmissionController(max_calls=3, max_calls_per_tenant=2, stage_limits={}, queue_timeout=1.0)
+    assert controller.admit_call("a")
+    assert controller.admit_call("a")
+    assert not controller.admit_call("a")
+    assert controller.admit_call("b")
+    assert not controller.admit_call("c")
+    controller.release_call("a")
+    assert controller.admit_call("c")
+
+
+def test_reserved_call_slot_is_held_until_stream_starts():
+    controller = AdmissionController(max_calls=1, max_calls_per_tenant=1, stage_limits={}, queue_timeout=1.0)
+    assert controller.reserve_call("CA1", "a")
+    # A second webhook before the first stream starts must not get the same slot.
+    assert not controller.reserve_call("CA2", "a")
+    assert not controller.admit_call("a")
+    assert controller.admit_call("a", call_sid="CA1")
+    stats = controller.stats()["calls"]
+    assert stats["active"] == 1
+    assert stats["reserved"] == 0
+    assert stats["admitted"] == 1
+    assert stats["rejected"] == 2
+
+
+def test_unused_call_reservation_expires():
+    controller = AdmissionController(
+        max_calls=1, max_calls_per_tenant=1, stage_limits={}, queue_timeout=1.0, reservation_ttl=0.01
+    )
+    assert controller.reserve_call("CA1", "a")
+    time.sleep(0.02)
+    assert controller.reserve_call("CA2", "a")
+    assert controller.admit_call("a", call_sid="CA2")
+    # The expired reservation no longer admits its stream.
+    assert not controller.admit_call("a", call_sid="CA1")
+    assert controller.stats()["calls"]["active"] == 1
@@ -0,0 +1,58 @@
+import audioop
+import io
+import wave
+
+import numpy as np
+
+from audio_format import SINK_FORMATS, convert_audio, decode_wav, resample_pcm
+
+
+def make_wav(frames: bytes, sample_width: int, sample_rate: int = 8000, channels: int = 1) -> bytes:
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wf:
+        wf.setnchannels(channels)
+        wf.setsampwidth(sample_width)
+        wf.setframerate(sample_rate)
+        wf.writeframes(frames)
+    return buffer.getvalue()
+
+
+def test_decode_8bit_wav_is_unsigned():
+    samples, rate = decode_wav(make_wav(bytes([0, 128, 255]), sample_width=1, sample_rate=11025))
+    assert rate == 11025
+    np.testing.assert_allclose(samples, [-1.0, 0.0, 127 / 128])
+
+
+def test_decode_24bit_wav():
+    values = [-8388608, 0, 4194304, 8388607]
+    frames = b"".join(value.to_bytes(3, "little", signed=True) for value in values)
+    samples, _ = decode_wav(make_wav(frames, sample_width=3))
+    np.testing.assert_allclose(samples, [-1.0, 0.0, 0.5, 8388607 / 8388608])
+
+
+def test_decode_stereo_wav_downmixes_channels():
+    interleaved = np.array([16384, -16384, 8192, 8192, -32768, 0], dtype='<i2')
+    samples, _ = decode_wav(make_wav(interleaved.tobytes(), sample_width=2, channels=2))
+    np.testing.assert_allclose(samples, [0.0, 0.25, -0.5])
+
+
+def test_resample_pcm_keeps_the_tone():
+    t = np.arange(24000) / 24000
+    tone = (0.5 * np.sin(2 * np.pi * 440 * t)).astype(np.float32)
+
+    resampled = resample_pcm(tone, 24000, 8000)
+
+    assert len(resampled) == 8000
+    assert resampled.dtype == np.float32
+    spectrum = np.abs(np.fft.rfft(resampled))
+    assert np.argmax(spectrum) == 440  # 1 Hz bins over one second
+    assert resample_pcm(tone, 24000, 24000) is tone
+
+
+def test_8khz_16bit_conversion_matches_lin2ulaw():
+    pcm = np.random.default_rng(0).integers(-32768, 32768, 8000).astype('<i2').tobytes()
+    sink_format = SINK_FORMATS["twilio"]
+
+    converted = convert_audio(make_wav(pcm, sample_width=2), sink_format["sample_rate"], sink_format["codec"])
+
+    assert converted == audioop.lin2ulaw(pcm, 2)
@@ -0,0 +1,84 @@
+import glob
+import os
+
+from call_records import NOT_RUN, RECORD_SIZE, CallRecordWriter, TurnRecord, call_id_bytes, read_file
+from query_call_records import load_turns
+
+CALL_SID = "CA" + "ab" * 16
+
+
+def turn(number, outcome="replied", tool="", language="en-IN"):
+    record = TurnRecord(CALL_SID, number, bytes_in=24000 + number)
+    record.stages = {"stt": 100 + number, "llm": 900}
+    record.transcript_chars = 20
+    record.language = language
+    record.tool = tool
+    record.outcome = outcome
+    record.bytes_out = 5000
+    return record
+
+
+def files(directory):
+    return sorted(glob.glob(os.path.join(directory, "turns-*.crec")))
+
+
+def test_records_round_trip(tmp_path):
+    writer = CallRecordWriter(str(tmp_path))
+    writer.submit(turn(1, tool="get_expenses"))
+    writer.submit(turn(2, outcome="llm_error", language="hi-IN"))
+    writer.stop()
+
+    turns, strings = read_file(files(tmp_path)[0])
+    assert len(turns) == 2
+    assert list(turns["turn"]) == [1, 2]
+    assert turns["call_id"][0] == call_id_bytes(CALL_SID) == bytes.fromhex("ab" * 16)
+    assert list(turns["stt"]) == [101, 102]
+    assert turns["tts"][0] == turns["sent"][0] == NOT_RUN
+    assert list(turns["bytes_in"]) == [24001, 24002]
+    assert [strings[code] for code in turns["outcome"]] == ["replied", "llm_error"]
+    assert [strings[code] for code in turns["language"]] == ["en-IN", "hi-IN"]
+    assert strings[turns["tool"][0]] == "get_expenses"
+
+
+def test_files_rotate_within_a_batch_and_old_files_are_pruned(tmp_path):
+    writer = CallRecordWriter(str(tmp_path), max_file_bytes=2048, keep_files=3, batch_size=1024)
+    for number in range(200):
+        writer.submit(turn(number, outcome="replied" if number % 2 else "no_speech"))
+    writer.stop()
+
+    paths = files(tmp_path)
+    assert len(paths) == 3
+    # Each row is 64 bytes and a record writes at most four rows (three strings and the turn).
+    assert all(os.path.getsize(path) < 2048 + 4 * RECORD_SIZE for path in paths)
+    assert writer.written == 200
+
+    turns, codes, names = load_turns(paths)
+    newest = turns["turn"].max()
+    assert newest == 199
+    # Every file has its own string table, so codes map back correctly after merging.
+    outcomes = [names[code] for code in codes["outcome"]]
+    assert outcomes == ["replied" if number % 2 else "no_speech" for number in turns["turn"]]
+
+
+def test_partial_trailing_row_is_ignored(tmp_path):
+    writer = CallRecordWriter(str(tmp_path))
+    writer.submit(turn(1))
+    writer.submit(turn(2))
+    writer.stop()
+    path = files(tmp_path)[0]
+    with open(path, "ab") as f:
+        f.write(b"T" + b"\0" * 20)
+
+    turns, _ = read_file(path)
+    assert list(turns["turn"]) == [1, 2]
+
+
+def test_non_record_files_are_skipped(tmp_path):
+    bogus = tmp_path / "turns-bogus.crec"
+    bogus.write_bytes(b"not a record file")
+    good = CallRecordWriter(str(tmp_path))
+    good.submit(turn(7))
+    good.stop()
+
+    turns, codes, names = load_turns(files(tmp_path))
+    assert list(turns["turn"]) == [7]
@@ -0,0 +1,40 @@
+import random
+
+from call_session import AudioRingBuffer, close_session, memory_report, open_session
+
+
+def test_ring_matches_a_plain_buffer_that_keeps_the_newest_bytes():
+    rng = random.Random(34)
+    ring = AudioRingBuffer(64)
+    expected = bytearray()
+    for step in range(2000):
+        chunk = bytes(rng.randrange(256) for _ in range(rng.choice((0, 1, 7, 20, 63, 64, 65, 150))))
+        dropped = ring.write(chunk)
+        expected += chunk
+        assert dropped == max(len(expected) - 64, 0)
+        del expected[:dropped]
+        assert len(ring) == len(expected)
+        assert ring.read_all() == bytes(expected)
+        if step % 97 == 0:
+            ring.clear()
+            expected.clear()
+
+
+def test_ring_accepts_memoryviews_and_never_grows():
+    ring = AudioRingBuffer(10)
+    storage = ring._buffer
+    ring.write(memoryview(b"abcdefgh"))
+    ring.write(b"ijkl")
+    assert ring.read_all() == b"cdefghijkl"
+    assert ring._buffer is storage and len(storage) == ring.capacity == 10
+
+
+def test_sessions_are_tracked_until_closed():
+    session = open_session(320)
+    session.audio.write(b"\xff" * 100)
+    report = memory_report()
+    assert report["active_calls"] >= 1
+    assert report["audio_bytes_buffered"] >= 100
+    assert session.footprint() >= 320
+    close_session(session)
+    assert memory_report()["active_calls"] == report["active_calls"] - 1
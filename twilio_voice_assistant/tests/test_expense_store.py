@@ -0,0 +1,126 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import tools_api_stub
+import expense_store
+from expense_store import ExpenseStore, expense_key
+
+
+@pytest.fixture
+def stub():
+    tools_api_stub.seed(120)
+    yield tools_api_stub
+    tools_api_stub.seed()
+
+
+def make_store(page_size=50, paging=True, **kwargs):
+    """An ExpenseStore whose fetch_page calls the stub in-process. Returns it with the list of requests made."""
+    client = TestClient(tools_api_stub.app)
+    requests_made = []
+
+    def fetch_page(base_url, api_key, limit, offset=0, updated_after=None):
+        body = {"limit": limit, "offset": offset} if paging else {}
+        if updated_after:
+            body["updated_after"] = updated_after
+        requests_made.append(body)
+        response = client.post("/tools/getExpenses", json=body)
+        response.raise_for_status()
+        return response.json()["data"]["result"]
+
+    store = ExpenseStore("http://tools-api.test", "key", page_size=page_size, min_sync_interval=0,
+                         fetch_page=fetch_page, **kwargs)
+    return store, requests_made
+
+
+def test_first_sync_pages_through_everything(stub):
+    store, requests_made = make_store(page_size=50)
+    assert store.sync() == 120
+    assert [body["offset"] for body in requests_made] == [0, 50, 100]
+    assert len(store.recent()) == 120
+    dates = [expense["date"] for expense in store.recent()]
+    assert dates == sorted(dates, reverse=True)
+    assert store.outstanding() == [expense for expense in store.recent() if not expense["settled"]]
+
+
+def test_later_syncs_ask_only_for_changes(stub):
+    store, requests_made = make_store()
+    store.sync()
+    newest = max(expense["updated_at"] for expense in stub.EXPENSES)
+    requests_made.clear()
+
+    assert store.sync() == 0
+    assert requests_made == [{"limit": 50, "offset": 0, "updated_after": newest}]
+
+    added = stub.add_expense("Snacks", 99, "Asha Rao", "asha@example.com", "Priya Shah", "priya@example.com")
+    assert store.sync() == 1
+    assert store.recent(1) == [added]
+    assert store.records_fetched == 121
+
+
+def test_changed_rows_are_merged_by_id(stub):
+    store, _ = make_store()
+    store.sync()
+    changed = dict(stub.EXPENSES[10], amount="1.00", settled=True, updated_at="2099-01-01T00:00:00+00:00")
+    stub.EXPENSES[10] = changed
+
+    assert store.sync() == 1
+    assert len(store.recent()) == 120
+    held = [expense for expense in store.recent() if expense_key(expense) == str(changed["id"])]
+    assert held == [changed]
+    assert changed not in store.outstanding()
+
+
+def test_deleted_rows_are_removed(stub):
+    store, _ = make_store()
+    store.sync()
+    victim = stub.EXPENSES[5]
+    stub.EXPENSES[5] = {"id": victim["id"], "deleted": True, "updated_at": "2099-01-01T00:00:00+00:00"}
+
+    assert store.sync() == 1
+    assert len(store.recent()) == 119
+    assert all(expense["id"] != victim["id"] for expense in store.recent())
+
+
+def test_api_without_paging_is_read_in_one_request(stub):
+    store, requests_made = make_store(page_size=50, paging=False)
+    assert store.sync() == 120
+    assert len(requests_made) == 1
+    assert len(store.recent()) == 120
+
+
+def test_legacy_rows_without_ids_or_timestamps_are_not_duplicated(stub):
+    for expense in stub.EXPENSES:
+        del expense["id"]
+        del expense["updated_at"]
+    store, requests_made = make_store()
+    store.sync()
+    store.sync()
+    # Without update timestamps every sync is a full read, merged rather than appended.
+    assert all("updated_after" not in body for body in requests_made)
+    assert len(store.recent()) == 120
+
+
+def test_sync_cut_short_resumes_instead_of_skipping_older_rows(stub, monkeypatch):
+    monkeypatch.setattr(expense_store, "MAX_PAGES_PER_SYNC", 4)
+    store, requests_made = make_store(page_size=10)
+
+    assert store.sync() == 40
+    assert not store.complete
+    assert store.sync() == 40
+    assert store.sync() == 40
+    assert store.complete
+    assert len(store.recent()) == 120
+    assert [body["offset"] for body in requests_made[4:6]] == [40, 50]
+
+    added = stub.add_expense("Snacks", 99, "Asha Rao", "asha@example.com", "Priya Shah", "priya@example.com")
+    assert store.sync() == 1
+    assert store.recent(1) == [added]
+
+
+def test_sync_fully_reads_a_long_history_in_one_call(stub, monkeypatch):
+    monkeypatch.setattr(expense_store, "MAX_PAGES_PER_SYNC", 4)
+    stub.seed(425)
+    store, _ = make_store(page_size=10)
+    assert store.sync_fully() == 425
+    assert store.complete
+    assert len(store.outstanding()) == sum(not expense["settled"] for expense in stub.EXPENSES)
@@ -0,0 +1,64 @@
+import llm_cache
+import main
+from llm_cache import ResponseCache, normalize_utterance
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(llm_cache.time, "monotonic", lambda: now[0])
+    cache = ResponseCache(max_entries=10, ttl_seconds=60)
+    key = cache.key("Who am I?", "en-IN", "v1")
+    cache.put(key, '{"tool_name": "get_current_user"}', 0.8)
+
+    now[0] += 59
+    assert cache.get(key) == '{"tool_name": "get_current_user"}'
+    now[0] += 2
+    assert cache.get(key) is None
+    assert cache.stats()["entries"] == 0
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = ResponseCache(max_entries=2, ttl_seconds=60)
+    first, second, third = (cache.key(text, "en-IN", "v1") for text in ("one", "two", "three"))
+    cache.put(first, "1", 0.1)
+    cache.put(second, "2", 0.1)
+    assert cache.get(first) == "1"  # now `second` is the least recently used
+
+    cache.put(third, "3", 0.1)
+
+    assert cache.get(second) is None
+    assert cache.get(first) == "1"
+    assert cache.get(third) == "3"
+
+
+def test_normalization_keeps_indic_combining_marks():
+    # Viramas and vowel signs are combining marks; dropping them would merge different words.
+    assert normalize_utterance("नमस्ते,  मेरा खर्च?") == "नमस्ते मेरा खर्च"
+    assert normalize_utterance("வணக்கம்!") == "வணக்கம்"
+    assert normalize_utterance("किसको") == "किसको"
+
+
+def test_cache_hit_skips_the_first_llm_pass(fake_llm):
+    fake_llm.replies = ["Hello! How can I help?"]
+
+    assert main.get_llm_response("Hello there!", "en-IN") == "Hello! How can I help?"
+    assert main.get_llm_response("hello there", "en-IN") == "Hello! How can I help?"
+
+    assert len(fake_llm.calls) == 1
+    assert main.first_pass_cache.stats()["hits"] >= 1
+
+
+def test_turn_with_payment_updates_bypasses_the_cache(fake_llm):
+    fake_llm.replies = ["Hello! How can I help?", "Hello! Your payment to Ravi went through."]
+    main.get_llm_response("Hello there!", "en-IN")
+    job_id = main.payment_queue.enqueue("payment_link", {"recipient": "Ravi", "amount": 70.0}, owner="call-cache-1")
+    with main.payment_queue._lock:
+        main.payment_queue._conn.execute("UPDATE jobs SET status = 'succeeded' WHERE id = ?", (job_id,))
+
+    reply = main.get_llm_response("Hello there!", "en-IN", owner="call-cache-1")
+
+    assert reply == "Hello! Your payment to Ravi went through."
+    assert len(fake_llm.calls) == 2
+    assert "Ravi" in fake_llm.calls[1][0]["content"]
@@ -0,0 +1,64 @@
+import base64
+import json
+
+from call_session import CallSession
+from media_ingest import MediaIngest, media_payload, parse_message
+
+AUDIO = bytes(range(256)) * 2
+PAYLOAD = base64.b64encode(AUDIO).decode()
+
+
+def twilio_frame(payload=PAYLOAD, **overrides) -> str:
+    """A media message laid out the way Twilio sends it."""
+    message = {
+        "event": "media",
+        "sequenceNumber": "4",
+        "media": {"track": "inbound", "chunk": "3", "timestamp": "60", "payload": payload},
+        "streamSid": "MZ18ad3ab5a668481ce02b83e7395059f0",
+    }
+    message.update(overrides)
+    return json.dumps(message, separators=(",", ":"))
+
+
+def test_fast_path_matches_the_json_parser():
+    raw = twilio_frame()
+    assert media_payload(raw) == json.loads(raw)["media"]["payload"] == PAYLOAD
+    assert parse_message(raw) == ("media", PAYLOAD, None)
+
+
+def test_other_layouts_fall_back_to_the_json_parser():
+    frames = [
+        json.dumps(json.loads(twilio_frame())),  # spaces after separators
+        json.dumps({"streamSid": "MZ1", "event": "media", "media": {"payload": PAYLOAD}}),  # event not first
+        twilio_frame().replace(PAYLOAD, PAYLOAD.replace("/", "\\/")),  # "/" written as "\/"
+    ]
+    for raw in frames:
+        assert media_payload(raw) is None
+        event, payload, message = parse_message(raw)
+        assert (event, payload) == ("media", None)
+        assert message["media"]["payload"] == PAYLOAD
+
+
+def test_control_events_and_truncated_frames_are_not_media():
+    start = json.dumps({"event": "start", "start": {"streamSid": "MZ1", "accountSid": "AC1"}}, separators=(",", ":"))
+    assert media_payload(start) is None
+    assert parse_message(start)[0] == "start"
+    assert media_payload('{"event":"media","media":{"track":"inbound"}}') is None
+    assert media_payload('{"event":"media","media":{"payload":"abc') is None
+
+
+def test_ingest_decodes_into_the_ring_and_publishes_once_per_flush():
+    session = CallSession(audio_capacity=4096)
+    ingest = MediaIngest(session.audio)
+    for _ in range(3):
+        assert ingest.write(PAYLOAD) == 0
+    assert ingest.write("not base64!!!") == 0
+    ingest.defer("mark")
+    ingest.defer("mark")
+
+    assert session.bytes_in == 0
+    assert ingest.flush(session) == 3 * len(AUDIO)
+    assert session.bytes_in == 3 * len(AUDIO)
+    assert session.audio.read_all() == AUDIO * 3
+    assert ingest.control_events is None
+    assert ingest.flush(session) == 0
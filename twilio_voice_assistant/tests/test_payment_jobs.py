@@ -0,0 +1,65 @@
+import os
+import socket
+import subprocess
+import sys
+import time
+
+from payment_jobs import QUEUED, RUNNING, SUCCEEDED, JobQueue
+
+
+def make_queue(path, **kwargs) -> JobQueue:
+    return JobQueue(str(path / "jobs.sqlite3"), handlers={"echo": lambda payload: payload}, **kwargs)
+
+
+def hand_over_lease(queue: JobQueue, job_id: str, lease_owner: str, expires_in: float = 60.0):
+    """Makes the job look claimed by another process."""
+    with queue._lock:
+        queue._conn.execute(
+            "UPDATE jobs SET status = ?, lease_owner = ?, lease_expires_at = ? WHERE id = ?",
+            (RUNNING, lease_owner, time.time() + expires_in, job_id),
+        )
+
+
+def test_restart_leaves_jobs_of_a_live_worker_alone(tmp_path):
+    queue = make_queue(tmp_path)
+    job_id = queue.enqueue("echo", {"n": 1})
+    # The parent process (pytest's runner) is alive and holds the lease.
+    hand_over_lease(queue, job_id, f"{socket.gethostname()}:{os.getppid()}")
+
+    restarted = make_queue(tmp_path)
+    assert restarted.get(job_id)["status"] == RUNNING
+    assert restarted.run_once() is False
+
+
+def test_restart_requeues_jobs_of_a_dead_worker(tmp_path):
+    finished = subprocess.Popen([sys.executable, "-c", "pass"])
+    finished.wait()
+    queue = make_queue(tmp_path)
+    job_id = queue.enqueue("echo", {"n": 1})
+    hand_over_lease(queue, job_id, f"{socket.gethostname()}:{finished.pid}")
+
+    restarted = make_queue(tmp_path)
+    assert restarted.get(job_id)["status"] == QUEUED
+    assert restarted.run_once() is True
+    assert restarted.get(job_id)["status"] == SUCCEEDED
+
+
+def test_expired_lease_is_claimed_again(tmp_path):
+    queue = make_queue(tmp_path)
+    job_id = queue.enqueue("echo", {"n": 1})
+    hand_over_lease(queue, job_id, "other-host:1234", expires_in=-1)
+
+    assert queue.run_once() is True
+    job = queue.get(job_id)
+    assert job["status"] == SUCCEEDED
+    assert job["lease_owner"] is None
+
+
+def test_finish_without_lease_is_not_recorded(tmp_path):
+    queue = make_queue(tmp_path)
+    job_id = queue.enqueue("echo", {"n": 1})
+    assert queue._claim()["lease_owner"] == queue.worker_id
+    hand_over_lease(queue, job_id, "other-host:1234")
+
+    queue._finish(job_id, SUCCEEDED, result={"n": 1})
+    assert queue.get(job_id)["status"] == RUNNING
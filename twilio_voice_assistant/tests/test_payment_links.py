@@ -0,0 +1,85 @@
+import json
+
+import pytest
+import requests
+
+import main
+import tools_api_stub
+from payment_jobs import RetryableJobError
+
+
+def test_payment_job_retry_does_not_create_a_second_link(stub_api, monkeypatch):
+    job = main._enqueue_payment_link("ravi@example.com", "Ravi", 70.0, owner="call-1")
+    payload = main.payment_queue.get(job["job_id"])["payload"]
+    assert payload["link_id"] == job["job_id"]
+
+    # The first attempt reaches the payment service but the response is lost.
+    create = main._create_payment_link
+
+    def lost_response(*args, **kwargs):
+        create(*args, **kwargs)
+        raise requests.exceptions.ReadTimeout("response lost")
+
+    monkeypatch.setattr(main, "_create_payment_link", lost_response)
+    with pytest.raises(RetryableJobError):
+        main._run_payment_link_job(payload)
+
+    monkeypatch.setattr(main, "_create_payment_link", create)
+    result = main._run_payment_link_job(payload)
+
+    assert len(tools_api_stub.PAYMENT_LINKS) == 1
+    assert result["link_url"].endswith(job["job_id"])
+    assert [call["json"]["link_id"] for call in stub_api] == [job["job_id"], job["job_id"]]
+    assert all(call["headers"]["x-idempotency-key"] == job["job_id"] for call in stub_api)
+
+
+def test_existing_link_conflict_completes_the_job(monkeypatch):
+    def conflict(*args, **kwargs):
+        response = requests.Response()
+        response.status_code = 409
+        raise requests.exceptions.HTTPError("409 Conflict", response=response)
+
+    monkeypatch.setattr(main, "_create_payment_link", conflict)
+    result = main._run_payment_link_job({"email": "ravi@example.com", "recipient": "Ravi", "amount": 70.0, "link_id": "abc"})
+    assert result["status"] == "created"
+
+
+def test_initiate_payment_uses_the_net_balance(stub_api, monkeypatch):
+    monkeypatch.setattr(main, "ASYNC_PAYMENT_LINKS", False)
+    me = main.calculate_net_balances(tools_api_stub.EXPENSES, "Asha Rao")
+    owed = round(me["Sandeep Kumar"]["amount"], 2)
+    assert owed > 0
+
+    result = json.loads(main._execute_tool("initiate_payment", {"recipient_name": "sandeep"}))
+    assert result["data"]["link_amount"] == int(owed * 100)
+    assert result["data"]["customer_details"] == {"customer_name": "Sandeep Kumar", "customer_email": "sandeep@example.com"}
+
+
+def test_initiate_payment_asks_when_the_name_is_ambiguous(stub_api):
+    tools_api_stub.add_expense("Lunch", 120, "Asha Rao", "asha@example.com", "Sandeep Iyer", "iyer@example.com")
+    main.get_expense_store(main.TOOLS_API_BASE_URL, main.SPLITWISE_API_KEY).sync(force=True)
+
+    result = json.loads(main._execute_tool("initiate_payment", {"recipient_name": "Sandeep"}))
+    assert "Sandeep Iyer, Sandeep Kumar" in result["error"]
+    assert tools_api_stub.PAYMENT_LINKS == {}
+
+
+def finished_payment_job(owner: str) -> str:
+    job_id = main.payment_queue.enqueue("payment_link", {"recipient": "Ravi", "amount": 70.0}, owner=owner)
+    with main.payment_queue._lock:
+        main.payment_queue._conn.execute("UPDATE jobs SET status = 'succeeded' WHERE id = ?", (job_id,))
+    return job_id
+
+
+def test_payment_update_survives_a_failed_reply(fake_llm):
+    job_id = finished_payment_job("call-updates-1")
+    fake_llm.replies = [RuntimeError("upstream 500"), "Your payment link for Ravi is ready."]
+
+    main.get_llm_response("hello", owner="call-updates-1")
+    assert main.payment_queue.get(job_id)["notified"] == 0
+
+    reply = main.get_llm_response("hello", owner="call-updates-1")
+    assert reply == "Your payment link for Ravi is ready."
+    assert "Ravi" in fake_llm.calls[-1][0]["content"]
+    assert main.payment_queue.get(job_id)["notified"] == 1
+    assert main.collect_payment_updates("call-updates-1") == (None, [])
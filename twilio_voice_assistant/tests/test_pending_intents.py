@@ -0,0 +1,87 @@
+import time
+
+import app as web_app
+from app import PendingIntentStore
+
+
+def intent(amount):
+    return {"success": True, "amount": amount, "contact": web_app.CONTACTS["priya"], "reason": None}
+
+
+def test_intent_is_returned_once():
+    store = PendingIntentStore(ttl_seconds=60)
+    store.put("token", intent(100))
+    assert store.pop("token")["amount"] == 100
+    assert store.pop("token") is None
+    assert store.pop(None) is None
+
+
+def test_newer_intent_replaces_the_old_one_and_discard_removes_it():
+    store = PendingIntentStore(ttl_seconds=60)
+    store.put("token", intent(100))
+    store.put("token", intent(250))
+    assert len(store) == 1
+    assert store.pop("token")["amount"] == 250
+    store.put("token", intent(100))
+    store.discard("token")
+    assert store.pop("token") is None
+
+
+def test_expired_intents_are_not_executed():
+    store = PendingIntentStore(ttl_seconds=0.05)
+    store.put("old", intent(100))
+    time.sleep(0.06)
+    assert store.pop("old") is None
+    store.put("new", intent(200))
+    # Expired entries are evicted when the next one is stored.
+    assert len(store) == 1
+
+
+def test_full_store_drops_the_oldest_session():
+    store = PendingIntentStore(ttl_seconds=60, max_entries=3)
+    for n in range(5):
+        store.put(f"token-{n}", intent(n))
+    assert len(store) == 3
+    assert store.pop("token-0") is None and store.pop("token-1") is None
+    assert store.pop("token-4")["amount"] == 4
+
+
+def test_confirmation_executes_only_the_server_side_intent():
+    client = web_app.app.test_client()
+    token = web_app.pending_intents.new_token()
+    web_app.pending_intents.put(token, intent(300))
+    before = len(web_app.TRANSACTIONS)
+
+    # The amount in the request body is ignored; only the session token counts.
+    response = client.post("/execute_payment", json={"session_token": token, "amount": 1}).get_json()
+    assert response["success"] and response["message"].startswith("Payment of 300 rupees")
+    assert len(web_app.TRANSACTIONS) == before + 1
+
+    replay = client.post("/execute_payment", json={"session_token": token}).get_json()
+    assert replay["success"] is False
+    assert len(web_app.TRANSACTIONS) == before + 1
+
+
+def test_confirming_a_replaced_intent_executes_nothing():
+    store = PendingIntentStore(ttl_seconds=60)
+    old_id = store.put("token", intent(100))
+    new_id = store.put("token", intent(250))
+    assert old_id != new_id
+    assert store.pop("token", old_id) is None
+    assert store.pop("token", new_id)["amount"] == 250
+
+
+def test_process_voice_returns_the_intent_id_to_confirm():
+    client = web_app.app.test_client()
+    before = len(web_app.TRANSACTIONS)
+    first = client.post("/process_voice", json={"text": "send 100 to Priya"}).get_json()
+    token = first["session_token"]
+    second = client.post("/process_voice", json={"text": "send 250 to Rahul", "session_token": token}).get_json()
+    assert first["success"] and second["success"] and first["intent_id"] != second["intent_id"]
+
+    # A confirm quoting the first parse must not pay the second one.
+    stale = client.post("/execute_payment", json={"session_token": token, "intent_id": first["intent_id"]}).get_json()
+    assert stale["success"] is False
+    current = client.post("/execute_payment", json={"session_token": token, "intent_id": second["intent_id"]}).get_json()
+    assert current["success"] and "250 rupees to Rahul" in current["message"]
+    assert len(web_app.TRANSACTIONS) == before + 1
@@ -0,0 +1,51 @@
+import re
+import threading
+import time
+
+import profiling
+
+
+def test_timed_records_calls_and_snapshot_reports_them():
+    @profiling.timed("test.sleepy")
+    def sleepy(seconds):
+        time.sleep(seconds)
+        return seconds
+
+    assert sleepy(0.01) == 0.01
+    sleepy(0.02)
+    profiling.increment("test.frames", 3)
+
+    stats = profiling.snapshot()
+    timing = stats["timings"]["test.sleepy"]
+    assert timing["calls"] == 2
+    assert timing["total_ms"] >= 30
+    assert timing["max_ms"] >= 20
+    assert abs(timing["avg_ms"] - timing["total_ms"] / 2) < 0.01
+    assert stats["counters"]["test.frames"] == 3
+    assert sleepy.__name__ == "sleepy"
+
+
+def spin_until(stop: threading.Event):
+    while not stop.is_set():
+        sum(range(1000))
+
+
+def test_sample_stacks_returns_collapsed_stacks():
+    stop = threading.Event()
+    worker = threading.Thread(target=spin_until, args=(stop,), name="busy-worker")
+    worker.start()
+    try:
+        collapsed = profiling.sample_stacks(0.1, interval=0.005)
+    finally:
+        stop.set()
+        worker.join()
+
+    lines = collapsed.splitlines()
+    assert lines and collapsed.endswith("\n")
+    # One "frame;frame;... count" per line, outermost (the thread name) first.
+    for line in lines:
+        assert re.fullmatch(r"[^;\n]+(;[^;\n]+)* \d+", line), line
+    worker_stacks = [line for line in lines if line.startswith("busy-worker;")]
+    assert worker_stacks
+    assert any(re.search(r";spin_until \(test_profiling\.py:\d+\) \d+$", line) for line in worker_stacks)
+    assert sum(int(line.rsplit(" ", 1)[1]) for line in worker_stacks) >= 5
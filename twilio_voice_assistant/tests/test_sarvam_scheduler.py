@@ -0,0 +1,105 @@
+import threading
+import time
+
+import pytest
+
+from sarvam_scheduler import BATCH, LIVE_CALL, WEB, DeadlineExceeded, SarvamScheduler, retry_after_seconds
+
+
+def run_queued(scheduler: SarvamScheduler, requests: list) -> list:
+    """
+    Empties the bucket, then queues `requests` ((label, priority, deadline)
+    tuples) one after another while no token is available. Returns the labels
+    in the order the scheduler let them through.
+    """
+    order = []
+    scheduler.run("chat", "m", lambda: None)
+    threads = []
+    for label, priority, deadline in requests:
+        thread = threading.Thread(
+            target=scheduler.run, args=("chat", "m", lambda label=label: order.append(label), priority, deadline)
+        )
+        thread.start()
+        threads.append(thread)
+        time.sleep(0.02)
+    for thread in threads:
+        thread.join(5)
+    return order
+
+
+def test_waiting_requests_are_served_by_priority_class():
+    scheduler = SarvamScheduler({"chat": (5.0, 1)})
+    order = run_queued(scheduler, [("batch", BATCH, None), ("web", WEB, None), ("live", LIVE_CALL, None)])
+    assert order == ["live", "web", "batch"]
+
+
+def test_same_priority_is_served_earliest_deadline_first():
+    scheduler = SarvamScheduler({"chat": (5.0, 1)})
+    now = time.monotonic()
+    order = run_queued(scheduler, [("late", WEB, now + 5.0), ("none", WEB, None), ("soon", WEB, now + 3.0)])
+    assert order == ["soon", "late", "none"]
+
+
+def test_request_that_cannot_meet_its_deadline_is_dropped():
+    scheduler = SarvamScheduler({"chat": (1.0, 1)})
+    scheduler.run("chat", "m", lambda: None)
+    sent = []
+    with pytest.raises(DeadlineExceeded):
+        scheduler.run("chat", "m", lambda: sent.append(1), deadline=time.monotonic() + 0.1)
+    assert sent == []
+    assert scheduler.stats()["chat:m"]["dropped_deadline"] == 1
+
+
+def test_rate_limited_request_is_retried_after_the_pause():
+    class RateLimited(Exception):
+        status_code = 429
+        headers = {"Retry-After": "0.1"}
+
+    scheduler = SarvamScheduler({"chat": (100.0, 5)})
+    attempts = []
+
+    def request():
+        attempts.append(time.monotonic())
+        if len(attempts) == 1:
+            raise RateLimited()
+        return "ok"
+
+    assert scheduler.run("chat", "m", request) == "ok"
+    assert attempts[1] - attempts[0] >= 0.1
+    assert scheduler.stats()["chat:m"]["rate_limited"] == 1
+
+
+def test_share_scales_the_bucket():
+    scheduler = SarvamScheduler({"chat": (10.0, 10)}, share=0.2)
+    scheduler.run("chat", "m", lambda: None)
+    assert scheduler.stats()["chat:m"]["rate_per_second"] == 2.0
+    with pytest.raises(ValueError):
+        SarvamScheduler({}, share=0)
+
+
+def test_retry_after_parsing():
+    class Error(Exception):
+        def __init__(self, status_code, headers):
+            self.status_code = status_code
+            self.headers = headers
+
+    assert retry_after_seconds(Error(429, {"Retry-After": "3"})) == 3.0
+    assert retry_after_seconds(Error(429, {"Retry-After": "9999"})) == 60.0
+    assert retry_after_seconds(Error(500, {"Retry-After": "3"})) is None
+    assert retry_after_seconds(ValueError("not http")) is None
+
+
+def test_lane_recovers_after_one_slow_response():
+    scheduler = SarvamScheduler({"chat": (1000.0, 100)})
+    scheduler.run("chat", "m", lambda: time.sleep(0.2))
+
+    sent = 0
+    for _ in range(20):
+        try:
+            scheduler.run("chat", "m", lambda: None, deadline=time.monotonic() + 0.1)
+            sent += 1
+        except DeadlineExceeded:
+            pass
+    # A few turns are dropped while the estimate decays, then requests flow again.
+    assert sent >= 15
+    assert scheduler.stats()["chat:m"]["latency_ewma_ms"] < 100
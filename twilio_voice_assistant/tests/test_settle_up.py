@@ -0,0 +1,81 @@
+import threading
+import time
+
+import requests
+
+import main
+import tools_api_stub
+
+ME = ("Asha Rao", "asha@example.com")
+
+
+def owe(name: str, email: str, amount: float, settled: bool = False):
+    tools_api_stub.add_expense("Dinner", amount, *ME, name, email, settled=settled)
+
+
+def seed_balances():
+    """Asha owes five people (one without an email) and is owed by one."""
+    tools_api_stub.EXPENSES.clear()
+    owe("Sandeep Kumar", "sandeep@example.com", 100)
+    owe("Sandeep Kumar", "sandeep@example.com", 999, settled=True)
+    owe("Priya Shah", "priya@example.com", 250.5)
+    owe("Kiran Das", "kiran@example.com", 60)
+    owe("Meera Nair", "meera@example.com", 80.25)
+    owe("Rahul Mehta", None, 40)
+    tools_api_stub.add_expense("Cab", 75, "Neha Iyer", "neha@example.com", *ME)
+
+
+def test_settle_up_respects_concurrency_and_reports_failures(stub_api, monkeypatch):
+    seed_balances()
+    monkeypatch.setattr(main, "ASYNC_PAYMENT_LINKS", False)
+    monkeypatch.setattr(main, "SETTLE_UP_CONCURRENCY", 2)
+    state = {"running": 0, "peak": 0}
+    lock = threading.Lock()
+    create = main._create_payment_link
+
+    def slow_create(email, name, amount, link_id=None):
+        with lock:
+            state["running"] += 1
+            state["peak"] = max(state["peak"], state["running"])
+        try:
+            time.sleep(0.05)
+            if name == "Priya Shah":
+                raise requests.exceptions.ConnectionError("payment service down")
+            return create(email, name, amount, link_id)
+        finally:
+            with lock:
+                state["running"] -= 1
+
+    monkeypatch.setattr(main, "_create_payment_link", slow_create)
+
+    result = main._settle_up_everyone()
+
+    assert state["peak"] == 2
+    assert sorted(outcome["recipient"] for outcome in result["paid"]) == ["Kiran Das", "Meera Nair", "Sandeep Kumar"]
+    assert all(outcome["status"] == "ACTIVE" for outcome in result["paid"])
+    failed = {outcome["recipient"]: outcome for outcome in result["failed"]}
+    assert failed["Rahul Mehta"] == {"recipient": "Rahul Mehta", "amount": 40.0, "error": "No email address on file."}
+    assert failed["Priya Shah"]["error"] == "The payment service request failed."
+    assert result["total_paid"] == 240.25
+    assert result["owed_to_you"] == [{"name": "Neha Iyer", "amount": 75.0}]
+    assert len(tools_api_stub.PAYMENT_LINKS) == 3
+
+
+def test_settle_up_queues_one_job_per_creditor(stub_api, monkeypatch):
+    seed_balances()
+    monkeypatch.setattr(main, "ASYNC_PAYMENT_LINKS", True)
+
+    result = main._settle_up_everyone(owner="call-settle-1")
+
+    queued = {job["recipient"]: job for job in result["queued"]}
+    assert sorted(queued) == ["Kiran Das", "Meera Nair", "Priya Shah", "Sandeep Kumar"]
+    assert queued["Sandeep Kumar"]["amount"] == 100.0
+    assert result["failed"] == [{"recipient": "Rahul Mehta", "amount": 40.0, "error": "No email address on file."}]
+    assert result["total_queued"] == 490.75
+    assert result["owed_to_you"] == [{"name": "Neha Iyer", "amount": 75.0}]
+    for job in queued.values():
+        stored = main.payment_queue.get(job["job_id"])
+        assert stored["owner"] == "call-settle-1"
+        assert stored["payload"]["link_id"] == job["job_id"]
+    # Nothing is created until the background workers run the jobs.
+    assert tools_api_stub.PAYMENT_LINKS == {}
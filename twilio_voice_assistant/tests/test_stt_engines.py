@@ -0,0 +1,86 @@
+import time
+
+from sarvam_scheduler import DeadlineExceeded
+from stt_engines import CircuitBreaker, LocalSTTEngine, STTEngine, STTRouter, Transcription, sarvam_language_code
+
+
+class FakeEngine(STTEngine):
+    def __init__(self, name, behaviour, available=True):
+        self.name = name
+        self._behaviour = behaviour
+        self._available = available
+        self.calls = 0
+
+    @property
+    def available(self) -> bool:
+        return self._available
+
+    def transcribe(self, audio_bytes: bytes):
+        self.calls += 1
+        return self._behaviour()
+
+
+def failing():
+    raise RuntimeError("remote down")
+
+
+def dropped():
+    raise DeadlineExceeded("turn budget spent")
+
+
+LONG_UTTERANCE = b"\xff" * 8000 * 3
+
+
+def test_stats_do_not_move_an_open_breaker_to_half_open():
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=0.05)
+    breaker.record_failure()
+    assert breaker.state == "open"
+    time.sleep(0.06)
+    for _ in range(3):
+        assert breaker.state == "half_open"
+    assert breaker.opened_at is not None
+    # Only the routing check starts the trial.
+    assert breaker.is_open is False
+    assert breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+
+def test_scheduler_deadline_drops_are_not_remote_failures():
+    remote = FakeEngine("sarvam", dropped)
+    router = STTRouter(remote, FakeEngine("local", lambda: None, available=False),
+                       breaker=CircuitBreaker(failure_threshold=2))
+    for _ in range(5):
+        assert router.transcribe(LONG_UTTERANCE) is None
+    assert remote.calls == 5
+    assert router.breaker.failures == 0
+    assert router.stats()["breaker_state"] == "closed"
+
+
+def test_remote_errors_open_the_breaker_and_route_locally():
+    remote = FakeEngine("sarvam", failing)
+    local = FakeEngine("local", lambda: Transcription("hello", "en-IN", "local"))
+    router = STTRouter(remote, local, latency_slo=1.0, short_utterance_seconds=0.5,
+                       breaker=CircuitBreaker(failure_threshold=2, reset_seconds=60))
+    for _ in range(2):
+        assert router.transcribe(LONG_UTTERANCE).transcript == "hello"
+    assert router.stats()["breaker_state"] == "open"
+    assert router.choose_engine(LONG_UTTERANCE) == "local"
+    assert remote.calls == 2
+
+
+def test_local_worker_pool_is_spawned_not_forked():
+    engine = LocalSTTEngine()
+    pool = engine._get_pool()
+    try:
+        assert pool._mp_context.get_start_method() == "spawn"
+        assert engine._get_pool() is pool
+    finally:
+        pool.shutdown()
+
+
+def test_whisper_languages_map_to_codes_sarvam_can_speak():
+    assert sarvam_language_code("hi") == "hi-IN"
+    assert sarvam_language_code("or") == "od-IN"
+    for unsupported in ("ur", "ne", "ja", "", None):
+        assert sarvam_language_code(unsupported) == "en-IN"
@@ -0,0 +1,91 @@
+import json
+
+from tool_results import estimate_tokens, net_owes, shape_tool_result
+
+
+def expense(expense_id, amount, from_user, to_user, settled=False):
+    return {
+        "id": expense_id,
+        "description": f"Expense {expense_id}",
+        "amount": f"{amount:.2f}",
+        "currency_code": "INR",
+        "date": f"2025-01-{expense_id % 28 + 1:02d}T10:00:00Z",
+        "from": from_user,
+        "to": to_user,
+        "settled": settled,
+    }
+
+
+def test_net_owes_nets_opposite_debts_and_skips_settled():
+    owes = net_owes([
+        expense(1, 100, "Asha", "Ravi"),
+        expense(2, 30, "Ravi", "Asha"),
+        expense(3, 500, "Asha", "Ravi", settled=True),
+        expense(4, 40, "Neha", "Asha"),
+        expense(5, 40, "Asha", "Neha"),
+    ])
+    assert owes == [["Asha", "Ravi", 70.0]]
+
+
+def test_expense_owes_come_from_the_full_history_not_the_recent_window():
+    history = [expense(i, 10, "Asha", "Ravi") for i in range(1, 41)]
+    result = json.dumps({"expenses": history[:15], "owes": net_owes(history), "unsettled_count": len(history)})
+    shaped = json.loads(shape_tool_result("get_expenses", result, token_budget=1000))
+    assert shaped["owes"] == [["Asha", "Ravi", 400.0]]
+    assert shaped["unsettled_count"] == 40
+    assert len(shaped["recent"]) == 15
+
+
+def test_trimming_drops_whole_rows_and_keeps_valid_json():
+    history = [expense(i, 10 * i, "Asha", f"Friend {i}") for i in range(1, 16)]
+    result = json.dumps({"expenses": history, "owes": net_owes(history), "unsettled_count": 15})
+    for budget in (40, 80, 150):
+        text = shape_tool_result("get_expenses", result, token_budget=budget)
+        shaped = json.loads(text)
+        assert estimate_tokens(text) <= budget or not (shaped["recent"] or shaped["owes"])
+        # Recent rows give way before the totals do.
+        if shaped["recent"]:
+            assert len(shaped["owes"]) == 15
+
+
+def test_unshaped_results_are_trimmed_by_list_items():
+    result = json.dumps({"items": [{"name": f"row {i}", "value": i} for i in range(100)]})
+    text = shape_tool_result("some_other_tool", result, token_budget=60)
+    shaped = json.loads(text)
+    assert estimate_tokens(text) <= 60
+    assert shaped["items"] == [{"name": f"row {i}", "value": i} for i in range(len(shaped["items"]))]
+
+    trimmed = json.loads(shape_tool_result("some_other_tool", json.dumps(list(range(500))), token_budget=20))
+    assert trimmed == list(range(len(trimmed)))
+
+
+def test_settle_up_is_shaped_without_job_ids():
+    result = json.dumps({
+        "queued": [{"job_id": "abc123", "recipient": "Ravi", "amount": 70.0, "status": "queued"}],
+        "failed": [{"recipient": "Neha", "amount": 20.0, "error": "No email address on file."}],
+        "total_queued": 70.0,
+        "owed_to_you": [{"name": "Priya", "amount": 15.0}],
+    })
+    shaped = json.loads(shape_tool_result("settle_up_everyone", result))
+    assert shaped["queued"] == [["Ravi", 70.0]]
+    assert shaped["failed"] == [["Neha", 20.0, "No email address on file."]]
+    assert shaped["owed_to_you"] == [["Priya", 15.0]]
+    assert "abc123" not in json.dumps(shaped)
+
+
+def test_payment_status_rows():
+    result = json.dumps({"payments": [
+        {"job_id": "a", "recipient": "Ravi", "amount": 70.0, "status": "succeeded"},
+        {"job_id": "b", "recipient": "Neha", "amount": 20.0, "status": "queued", "retrying": True},
+    ]})
+    shaped = json.loads(shape_tool_result("get_payment_status", result))
+    assert shaped["payments"] == [["Ravi", 70.0, "succeeded"], ["Neha", 20.0, "retrying"]]
+
+
+def test_settled_rows_stay_in_recent_but_not_in_owes():
+    rows = [expense(1, 100, "Asha", "Ravi"), expense(2, 500, "Asha", "Ravi", settled=True)]
+    shaped = json.loads(shape_tool_result("get_expenses", json.dumps({"expenses": rows}), token_budget=1000))
+    assert [row[-1] for row in shaped["recent"]] == [0, 1]
+    assert shaped["recent"][1][:2] == ["Expense 2", 500.0]
+    assert shaped["owes"] == [["Asha", "Ravi", 100.0]]
+    assert shaped["unsettled_count"] == 1
@@ -0,0 +1,47 @@
+import json
+
+import main
+from call_records import TurnRecord
+from sarvam_scheduler import DeadlineExceeded
+
+
+def record():
+    turn = TurnRecord("CA" + "0" * 32, 1)
+    turn.outcome = "no_reply"
+    return turn
+
+
+def test_llm_failure_is_recorded_not_replied(fake_llm):
+    fake_llm.replies = [RuntimeError("upstream 500")]
+    turn = record()
+    reply = main.get_llm_response("hello there", turn_record=turn)
+    assert reply.startswith("I'm sorry")
+    assert turn.outcome == "llm_error"
+
+
+def test_scheduler_drop_is_recorded(fake_llm, monkeypatch):
+    def dropped(*args, **kwargs):
+        raise DeadlineExceeded("turn budget spent")
+
+    monkeypatch.setattr(main.sarvam, "run", dropped)
+    turn = record()
+    assert main.get_llm_response("hello there", turn_record=turn) == main.BUSY_RESPONSE_TEXT
+    assert turn.outcome == "llm_dropped"
+
+
+def test_tool_error_is_recorded(fake_llm):
+    fake_llm.replies = [
+        json.dumps({"tool_name": "initiate_payment", "parameters": {}}),
+        "Who would you like to pay?",
+    ]
+    turn = record()
+    assert main.get_llm_response("pay someone", turn_record=turn) == "Who would you like to pay?"
+    assert turn.tool == "initiate_payment"
+    assert turn.outcome == "tool_error"
+
+
+def test_successful_turn_is_left_for_the_caller(fake_llm):
+    fake_llm.replies = ["Hello! How can I help?"]
+    turn = record()
+    main.get_llm_response("hello there", turn_record=turn)
+    assert turn.outcome == "no_reply"
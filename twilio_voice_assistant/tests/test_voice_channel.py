@@ -0,0 +1,76 @@
+import threading
+import time
+
+import app as web_app
+
+
+class FakeSocket:
+    """Records sends and fails the test if two threads ever write at once."""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.sent = []
+        self.closed_with = None
+        self.overlaps = 0
+        self._writing = threading.Lock()
+
+    def send(self, payload):
+        if not self._writing.acquire(blocking=False):
+            self.overlaps += 1
+            self._writing.acquire()
+        try:
+            time.sleep(self.delay)
+            self.sent.append(payload)
+        finally:
+            self._writing.release()
+
+    def close(self, reason=None, message=None):
+        self.closed_with = message
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_sends_from_many_threads_are_serialized_in_order():
+    ws = FakeSocket(delay=0.001)
+    connection = web_app.VoiceConnection(ws, max_pending=1000)
+    threads = [
+        threading.Thread(target=lambda n=n: [connection.send({"thread": n, "i": i}) for i in range(20)])
+        for n in range(5)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    connection.close()
+    assert len(ws.sent) == 100
+    assert ws.overlaps == 0
+
+
+def test_broadcast_does_not_wait_for_a_slow_client():
+    slow, fast = FakeSocket(delay=0.5), FakeSocket()
+    slow_connection = web_app.VoiceConnection(slow, max_pending=2)
+    fast_connection = web_app.VoiceConnection(fast)
+    with web_app.VOICE_SOCKETS_LOCK:
+        web_app.VOICE_SOCKETS.update({slow_connection, fast_connection})
+    try:
+        started = time.monotonic()
+        for i in range(5):
+            web_app.broadcast({"type": "transaction", "id": i})
+        assert time.monotonic() - started < 0.1
+
+        # The slow client overflowed its outbox: it is dropped and disconnected.
+        assert slow_connection.closed
+        assert slow_connection not in web_app.VOICE_SOCKETS
+        assert wait_for(lambda: slow.closed_with is not None)
+        assert wait_for(lambda: len(fast.sent) == 5)
+        assert fast_connection in web_app.VOICE_SOCKETS
+    finally:
+        with web_app.VOICE_SOCKETS_LOCK:
+            web_app.VOICE_SOCKETS.clear()
+        fast_connection.close()
+        slow_connection.close()
@@ -0,0 +1,216 @@
+import json
+import logging
+import os
+
+import profiling
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on the size of a shaped tool result, in estimated prompt tokens.
+TOOL_RESULT_TOKEN_BUDGET = int(os.getenv("TOOL_RESULT_TOKEN_BUDGET", "250"))
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token estimate (~4 characters per token) used for budgeting."""
+    return (len(text) + 3) // 4
+
+
+def compact_json(data) -> str:
+    """Stable, whitespace-free JSON: sorted keys so identical results give identical prompts."""
+    return json.dumps(data, separators=(",", ":"), sort_keys=True, ensure_ascii=False)
+
+
+def _amount(value) -> float:
+    try:
+        return round(float(value), 2)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _party(expense: dict, side: str):
+    return expense.get(f"{side}_user") or expense.get(side)
+
+
+def net_owes(expenses: list) -> list:
+    """
+    Nets unsettled expenses into one who-owes-whom total per pair of people.
+    Returns [debtor, creditor, amount] rows, largest first, so trimming to a
+    budget drops the least important. Pass the user's full outstanding history,
+    not a window of recent rows, or the totals will be wrong.
+    """
+    balances = {}
+    for expense in expenses:
+        if expense.get("settled"):
+            continue
+        debtor = _party(expense, "from")
+        creditor = _party(expense, "to")
+        if not debtor or not creditor:
+            continue
+        amount = _amount(expense.get("amount"))
+        # Net opposite debts between the same two people into one figure.
+        if (creditor, debtor) in balances:
+            balances[(creditor, debtor)] -= amount
+        else:
+            balances[(debtor, creditor)] = balances.get((debtor, creditor), 0.0) + amount
+
+    owed = []
+    for (debtor, creditor), amount in sorted(balances.items()):
+        if amount < 0:
+            debtor, creditor, amount = creditor, debtor, -amount
+        if round(amount, 2):
+            owed.append([debtor, creditor, round(amount, 2)])
+    owed.sort(key=lambda entry: (-entry[2], entry[0], entry[1]))
+    return owed
+
+
+def shape_expenses(expenses: list, owes: list = None, unsettled_count: int = None) -> dict:
+    """
+    Compacts expense rows (description, amount, date, people, settled flag)
+    and the who-owes-whom totals. Settled rows stay in `recent`, flagged 1, so
+    "what did I spend on?" still sees them; only unsettled rows count towards
+    the totals. `owes` should be netted over the whole outstanding history
+    (see net_owes); without it, the totals come from `expenses` alone.
+    Emails are dropped; the prompt never speaks them.
+    """
+    outstanding = [expense for expense in expenses if not expense.get("settled")]
+    currency = next(
+        (expense.get("currency") or expense.get("currency_code") for expense in expenses
+         if expense.get("currency") or expense.get("currency_code")),
+        None,
+    )
+    return {
+        "fields": {
+            "owes": ["debtor", "creditor", "amount"],
+            "recent": ["description", "amount", "date", "from", "to", "settled"],
+        },
+        "currency": currency or "INR",
+        "owes": net_owes(outstanding) if owes is None else owes,
+        "unsettled_count": len(outstanding) if unsettled_count is None else unsettled_count,
+        "recent": [
+            [
+                expense.get("description"),
+                _amount(expense.get("amount")),
+                (expense.get("date") or "").split("T")[0],
+                _party(expense, "from"),
+                _party(expense, "to"),
+                1 if expense.get("settled") else 0,
+            ]
+            for expense in expenses
+        ],
+    }
+
+
+def shape_current_user(result: dict) -> dict:
+    user = result.get("data", {}).get("result", {}).get("user", {})
+    name = f"{user.get('first_name', '')} {user.get('last_name', '') or ''}".strip()
+    return {"name": name, "email": user.get("email")}
+
+
+def shape_payment(result: dict) -> dict:
+    """Keeps the outcome of a payment-link request; the URL is never spoken."""
+    if result.get("status") == "queued":
+        return {"status": "queued", "recipient": result.get("recipient"), "amount": result.get("amount")}
+    data = result.get("data", result)
+    customer = data.get("customer_details", {})
+    amount = data.get("link_amount")
+    return {
+        "status": data.get("link_status") or ("created" if result.get("success") else "unknown"),
+        "recipient": customer.get("customer_name"),
+        "amount": amount / 100 if isinstance(amount, (int, float)) else amount,
+    }
+
+
+def shape_settle_up(result: dict) -> dict:
+    """Keeps who was paid (or queued), who failed and who owes the user; job ids and URLs are dropped."""
+    shaped = {"fields": {"paid": ["recipient", "amount", "status"], "failed": ["recipient", "amount", "error"],
+                         "owed_to_you": ["name", "amount"]}}
+    if "queued" in result:
+        shaped["fields"]["queued"] = ["recipient", "amount"]
+        shaped["queued"] = [[job.get("recipient"), job.get("amount")] for job in result["queued"]]
+        shaped["total_queued"] = result.get("total_queued")
+    else:
+        shaped["paid"] = [[entry.get("recipient"), entry.get("amount"), entry.get("status")]
+                          for entry in result.get("paid", [])]
+        shaped["total_paid"] = result.get("total_paid")
+    shaped["failed"] = [[entry.get("recipient"), entry.get("amount"), entry.get("error")]
+                        for entry in result.get("failed", [])]
+    shaped["owed_to_you"] = [[entry.get("name"), entry.get("amount")] for entry in result.get("owed_to_you", [])]
+    if result.get("message"):
+        shaped["message"] = result["message"]
+    return shaped
+
+
+def shape_payment_status(result: dict) -> dict:
+    """One [recipient, amount, status] row per payment job; a job being retried reads as "retrying"."""
+    return {
+        "fields": {"payments": ["recipient", "amount", "status"]},
+        "payments": [
+            [job.get("recipient"), job.get("amount"), "retrying" if job.get("retrying") else job.get("status")]
+            for job in result.get("payments", [])
+        ],
+    }
+
+
+def _trim_to_budget(data, token_budget: int, trim_order: tuple = ()) -> str:
+    """
+    Serializes data, dropping whole list items until it fits the budget, so the
+    result is always valid JSON. Lists named in `trim_order` are trimmed first,
+    in that order; after that the longest remaining list loses its last item.
+    Lists are expected to hold their most important items first.
+    """
+    text = compact_json(data)
+    if estimate_tokens(text) <= token_budget:
+        return text
+    container = {"items": data} if isinstance(data, list) else data
+
+    while estimate_tokens(text) > token_budget:
+        lists = [value for key, value in container.items() if isinstance(value, list) and value and key != "fields"]
+        if not lists:
+            logger.warning(f"Tool result still exceeds the {token_budget}-token budget with every list emptied.")
+            break
+        preferred = [container[key] for key in trim_order if isinstance(container.get(key), list) and container[key]]
+        (preferred[0] if preferred else max(lists, key=len)).pop()
+        text = compact_json(data)
+    return text
+
+
+@profiling.timed()
+def shape_tool_result(tool_name: str, tool_result: str, token_budget: int = TOOL_RESULT_TOKEN_BUDGET) -> str:
+    """
+    Turns a tool's raw JSON result into the compact form sent to the LLM for the
+    final answer. Errors are passed through unchanged; anything that cannot be
+    shaped falls back to compact JSON cut to the budget.
+    """
+    try:
+        result = json.loads(tool_result)
+    except (TypeError, json.JSONDecodeError):
+        return tool_result
+
+    if isinstance(result, dict) and "error" in result:
+        return compact_json({"error": result["error"]})
+
+    # Which lists give way first when a shaped result is over budget.
+    trim_order = ()
+    try:
+        if tool_name == "get_expenses" and isinstance(result, dict) and "expenses" in result:
+            shaped = shape_expenses(result["expenses"], result.get("owes"), result.get("unsettled_count"))
+            trim_order = ("recent", "owes")
+        elif tool_name == "get_expenses" and isinstance(result, list):
+            shaped = shape_expenses(result)
+            trim_order = ("recent", "owes")
+        elif tool_name == "get_current_user":
+            shaped = shape_current_user(result)
+        elif tool_name == "initiate_payment":
+            shaped = shape_payment(result)
+        elif tool_name == "settle_up_everyone":
+            shaped = shape_settle_up(result)
+            trim_order = ("owed_to_you",)
+        elif tool_name == "get_payment_status":
+            shaped = shape_payment_status(result)
+        else:
+            shaped = result
+    except (AttributeError, TypeError) as e:
+        logger.warning(f"Could not shape result of '{tool_name}': {e}")
+        shaped = result
+
+    return _trim_to_budget(shaped, token_budget, trim_order)
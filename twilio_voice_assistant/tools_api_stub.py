@@ -0,0 +1,114 @@
+"""
+A local stand-in for the tools API (TOOLS_API_BASE_URL) for development and tests.
+
+Serves getCurrentUser, getExpenses (with paging and "updated_after" delta
+queries) and createPaymentLink from seeded in-memory data. To use it:
+
+    uvicorn tools_api_stub:app --port 9000
+    TOOLS_API_BASE_URL=http://localhost:9000 uvicorn main:app
+"""
+import os
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from fastapi import FastAPI, Request
+
+app = FastAPI()
+
+CURRENT_USER = {"id": 1, "first_name": "Asha", "last_name": "Rao", "email": "asha@example.com"}
+FRIENDS = [
+    ("Sandeep Kumar", "sandeep@example.com"),
+    ("Priya Shah", "priya@example.com"),
+    ("Rahul Mehta", "rahul@example.com"),
+    ("Neha Iyer", "neha@example.com"),
+]
+DESCRIPTIONS = ["Dinner", "Groceries", "Cab", "Movie tickets", "Electricity bill", "Coffee", "Rent share"]
+
+EXPENSES = []
+PAYMENT_LINKS = {}
+_base_time = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+
+def _timestamp(offset_minutes: int) -> str:
+    return (_base_time + timedelta(minutes=offset_minutes)).isoformat()
+
+
+def add_expense(description: str, amount: float, from_user: str, from_email: str,
+                to_user: str, to_email: str, settled: bool = False) -> dict:
+    """Appends an expense with the next id and a fresh update timestamp."""
+    index = len(EXPENSES)
+    expense = {
+        "id": index + 1,
+        "description": description,
+        "amount": f"{amount:.2f}",
+        "currency_code": "INR",
+        "date": _timestamp(index * 60),
+        "updated_at": _timestamp(index * 60),
+        "from": from_user,
+        "from_email": from_email,
+        "to": to_user,
+        "to_email": to_email,
+        "settled": settled,
+    }
+    EXPENSES.append(expense)
+    return expense
+
+
+def seed(count: int = int(os.getenv("STUB_EXPENSE_COUNT", "200"))):
+    """Fills the store with a deterministic expense history."""
+    EXPENSES.clear()
+    me = f"{CURRENT_USER['first_name']} {CURRENT_USER['last_name']}"
+    for i in range(count):
+        friend, friend_email = FRIENDS[i % len(FRIENDS)]
+        amount = 50 + (i * 37) % 900
+        description = DESCRIPTIONS[i % len(DESCRIPTIONS)]
+        if i % 3 == 0:
+            add_expense(description, amount, friend, friend_email, me, CURRENT_USER["email"], settled=i % 5 == 0)
+        else:
+            add_expense(description, amount, me, CURRENT_USER["email"], friend, friend_email, settled=i % 5 == 0)
+
+
+seed()
+
+
+def _wrap(result: dict) -> dict:
+    return {"success": True, "data": {"result": result}}
+
+
+@app.post("/tools/getCurrentUser")
+async def get_current_user():
+    return _wrap({"user": CURRENT_USER})
+
+
+@app.post("/tools/getExpenses")
+async def get_expenses(request: Request):
+    body = await request.json() if await request.body() else {}
+    updated_after = body.get("updated_after")
+    offset = int(body.get("offset", 0))
+    limit = body.get("limit")
+
+    # Newest first, as the real API returns them.
+    matching = [e for e in reversed(EXPENSES) if not updated_after or e["updated_at"] > updated_after]
+    if limit is None:
+        return _wrap({"expenses": matching, "has_more": False})
+    page = matching[offset:offset + int(limit)]
+    return _wrap({"expenses": page, "has_more": offset + len(page) < len(matching)})
+
+
+@app.post("/tools/createPaymentLink")
+async def create_payment_link(request: Request):
+    body = await request.json()
+    # A repeated link_id returns the existing link rather than creating a second one.
+    link_id = body.get("link_id") or uuid.uuid4().hex[:12]
+    if link_id not in PAYMENT_LINKS:
+        PAYMENT_LINKS[link_id] = {
+            "link_id": link_id,
+            "link_url": f"https://payments.example.com/links/{link_id}",
+            "link_amount": body.get("link_amount"),
+            "customer_details": {
+                "customer_name": body.get("customer_name"),
+                "customer_email": body.get("customer_email"),
+            },
+            "link_status": "ACTIVE",
+        }
+    return {"success": True, "data": PAYMENT_LINKS[link_id]}